@@ -0,0 +1,182 @@
+#!/bin/env python
+"""This file compares the eventlet and the asyncio variants of the servers.
+
+For each variant, a green apple server and a red apple server are started with
+`use_asyncio` set accordingly. Red clients connect concurrently to the red
+server, and producers publish timestamped messages to the green server. It
+reports how many red clients were connected and how fast, the latencies from
+publishing to receiving the messages and the CPU and memory used by the
+servers. Usage:
+
+    $ python benchmarks/asyncio_servers.py --consumers 2000 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from socketio import AsyncClient
+
+from common import (
+    process_usage, start_server, stop_servers, summarize
+)
+
+
+async def connect_consumer(room_id, semaphore, latencies, connect_times):
+    """Connects a red client and joins it to a room.
+
+    :param room_id: The three digit room id.
+    :param semaphore: The `asyncio.Semaphore` limiting concurrent connects.
+    :param latencies: The list receiving the latencies of the messages in
+                      seconds.
+    :param connect_times: The list receiving the connect latencies in
+                          seconds.
+
+    :return: The connected `AsyncClient`, or None if it failed to connect.
+    """
+    client = AsyncClient(reconnection=False)
+    client.rejected = False
+
+    async def on_broadcast_message(data):
+        now = time.perf_counter()
+        for message in data["data"]:
+            latencies.append(now - float(message.split(":")[2]))
+
+    async def on_abort_connection(error):
+        client.rejected = True
+
+    client.on("broadcast_message", on_broadcast_message, namespace="/red")
+    client.on("abort_connection", on_abort_connection, namespace="/red")
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            await client.connect("http://127.0.0.1:6100", namespaces=["/red"])
+        except Exception:
+            return None
+        connect_times.append(time.perf_counter() - start)
+    def on_join_response(response=None):
+        if response is not None and "retry_after" in response:
+            client.rejected = True
+
+    # The red server rejects joins till it learns about the green clients,
+    # and throttles joins beyond its join rate
+    client.rejected = True
+    while client.rejected:
+        client.rejected = False
+        await client.emit(
+            "join",
+            {"id": room_id},
+            namespace="/red",
+            callback=on_join_response
+        )
+        await asyncio.sleep(1)
+    return client
+
+
+async def drive(consumers, producers, messages, concurrency, interval):
+    """Connects the clients and publishes the messages.
+
+    :param consumers: The number of red clients.
+    :param producers: The number of producers, each with its own room.
+    :param messages: The number of messages published by each producer.
+    :param concurrency: The number of red clients connecting at once.
+    :param interval: The number of seconds between messages of a producer.
+
+    :return: A dict with the connect and message results.
+    """
+    rooms = [f"{800 + index:03d}" for index in range(producers)]
+    publishers, latencies, connect_times = [], [], []
+    for room_id in rooms:
+        publisher = AsyncClient(reconnection=False)
+        await publisher.connect(
+            "http://127.0.0.1:7100", namespaces=["/green"]
+        )
+        await publisher.emit("join", {"id": room_id}, namespace="/green")
+        publishers.append(publisher)
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    clients = await asyncio.gather(*(
+        connect_consumer(
+            rooms[index % producers], semaphore, latencies, connect_times
+        )
+        for index in range(consumers)
+    ))
+    connect_seconds = time.perf_counter() - start
+    connected = [client for client in clients if client is not None]
+    for number in range(messages):
+        for room_id, publisher in zip(rooms, publishers):
+            await publisher.emit(
+                "incoming_data",
+                {
+                    "id": room_id,
+                    "data": f"{room_id}:{number}:{time.perf_counter()}",
+                },
+                namespace="/green"
+            )
+        await asyncio.sleep(interval)
+    expected = len(connected) * messages
+    deadline = time.monotonic() + 30
+    while len(latencies) < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    for client in publishers + connected:
+        await client.disconnect()
+    return {
+        "connected": len(connected),
+        "failed": consumers - len(connected),
+        "connects_per_second": len(connected) / connect_seconds,
+        "connect": summarize(connect_times),
+        "missing": expected - len(latencies),
+        "latency": summarize(latencies),
+    }
+
+
+def measure(use_asyncio, consumers, producers, messages, concurrency,
+            interval):
+    """Measures one variant of the servers.
+
+    :param use_asyncio: Whether the asyncio variant is measured.
+    :param consumers: The number of red clients.
+    :param producers: The number of producers, each with its own room.
+    :param messages: The number of messages published by each producer.
+    :param concurrency: The number of red clients connecting at once.
+    :param interval: The number of seconds between messages of a producer.
+
+    :return: A dict with the results of the variant.
+    """
+    green = start_server("green", port="7100", use_asyncio=use_asyncio)
+    red = start_server(
+        "red", port="6100", grn_server_port="7100", use_asyncio=use_asyncio
+    )
+    try:
+        result = asyncio.run(
+            drive(consumers, producers, messages, concurrency, interval)
+        )
+        result["green_server"] = process_usage(green.pid)
+        result["red_server"] = process_usage(red.pid)
+    finally:
+        stop_servers(red, green)
+    return {"variant": "asyncio" if use_asyncio else "eventlet", **result}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--consumers", type=int, default=1000)
+    parser.add_argument("--producers", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.01)
+    args = parser.parse_args()
+
+    results = [
+        measure(
+            use_asyncio,
+            args.consumers,
+            args.producers,
+            args.messages,
+            args.concurrency,
+            args.interval
+        )
+        for use_asyncio in (False, True)
+    ]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,116 @@
+#!/bin/env python
+"""This file benchmarks the streaming publisher of green clients.
+
+For each window size, a green apple server is started and a `GreenClient`
+publishes a stream of messages through a `BulkPublisher`, with at most that
+many unacknowledged batches in flight. It reports the sustained rate of
+acknowledged messages. With `--restart`, the green apple server is restarted
+while publishing, which the publisher has to survive by emitting the
+unacknowledged batches again. With `--publish-rate`, the green apple server
+throttles the publisher, and it checks that the messages emitted stay within
+`--max-amplification` times the messages published, i.e. that the dropped
+batches aren't emitted again all at once. Usage:
+
+    $ python benchmarks/bulk_publish.py --windows 1 8 64 --messages 100000
+    $ python benchmarks/bulk_publish.py --windows 64 --restart 2
+    $ python benchmarks/bulk_publish.py --windows 64 --messages 5000 \\
+        --batch-size 1 --publish-rate 1000 --publish-burst 100
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+
+from common import add_src_path, start_server, stop_servers
+
+
+def measure(window, messages, payload, batch_size, restart, **options):
+    """Measures the publishing of messages with a window size.
+
+    :param window: The number of unacknowledged batches in flight.
+    :param messages: The number of messages to be published.
+    :param payload: The number of bytes of every message.
+    :param batch_size: The number of messages per batch.
+    :param restart: The number of seconds after which the green apple server
+                    is restarted, or `None`.
+    :param options: The keyword arguments passed to the green apple server,
+                    such as its `publish_rate`.
+
+    :return: A dict with the results of the `BulkPublisher`.
+    """
+    from listener import GreenClient
+    from publisher import BulkPublisher
+
+    servers = [start_server("green", port="7100", log_dir=None, **options)]
+
+    def restart_server():
+        time.sleep(restart)
+        stop_servers(servers.pop())
+        servers.append(
+            start_server("green", port="7100", log_dir=None, **options)
+        )
+
+    client = GreenClient(
+        host="127.0.0.1",
+        port="7100",
+        client_namespace="/green",
+        server_namespace="/green",
+        batch_size=batch_size,
+        batch_delay=0.005,
+        num_id="700",
+        interactive=False,
+        reconnection=True,
+        max_in_flight=window
+    )
+    filler = "x" * payload
+    try:
+        client.run()
+        if restart is not None:
+            threading.Thread(target=restart_server, daemon=True).start()
+        stats = BulkPublisher(client, report_interval=0).publish(
+            f"{number}:{filler}" for number in range(messages)
+        )
+        client.disconnect_from_server()
+    finally:
+        stop_servers(*servers)
+    return {
+        "window": window,
+        **stats,
+        "amplification": stats["emitted"] / stats["sent"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--windows", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--payload", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--restart", type=float, default=None)
+    parser.add_argument("--publish-rate", type=float, default=None)
+    parser.add_argument("--publish-burst", type=int, default=1000)
+    parser.add_argument("--max-amplification", type=float, default=2.0)
+    args = parser.parse_args()
+
+    add_src_path("green_client")
+    results = [
+        measure(
+            window,
+            args.messages,
+            args.payload,
+            args.batch_size,
+            args.restart,
+            publish_rate=args.publish_rate,
+            publish_burst=args.publish_burst
+        )
+        for window in args.windows
+    ]
+    print(json.dumps(results, indent=2))
+    if args.publish_rate and any(
+        result["amplification"] > args.max_amplification for result in results
+    ):
+        print(f"ERROR: More than {args.max_amplification} emits per message "
+              f"while throttled")
+        sys.exit(1)
@@ -0,0 +1,138 @@
+#!/bin/env python
+"""This file has helpers shared by the benchmarks.
+
+It starts the apple servers as separate processes through `runner.py`, waits
+for them to accept connections and summarizes the measured samples.
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+SHARED_DIR = os.path.join(REPO_ROOT, "shared")
+
+
+def add_src_path(component):
+    """Makes the modules of a component importable, e.g. `red_server`.
+
+    The modules shared by the components are made importable as well.
+
+    :param component: The name of the component directory.
+
+    :return: None
+    """
+    path = os.path.join(REPO_ROOT, component, "src")
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    if SHARED_DIR not in sys.path:
+        sys.path.append(SHARED_DIR)
+
+
+def wait_for_port(port, host="127.0.0.1", timeout=10.0):
+    """Waits till a server accepts connections on the given port.
+
+    :param port: The port to be checked.
+    :param host: The host to be checked. Defaults to `127.0.0.1`.
+    :param timeout: The number of seconds to wait for.
+
+    :return: None
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, int(port)), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Nothing is listening on '{host}:{port}'")
+
+
+def start_server(component, **options):
+    """Starts an apple server in a new process.
+
+    :param component: Either `green` or `red`.
+    :param options: The keyword arguments passed to the server, see
+                    `runner.py`. A `port` is mandatory.
+
+    :return: The `subprocess.Popen` instance of the started server.
+    """
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(BENCH_DIR, "runner.py"),
+            component,
+            json.dumps(options)
+        ],
+        stdout=subprocess.DEVNULL
+    )
+    wait_for_port(options["port"])
+    return process
+
+
+def stop_servers(*processes):
+    """Terminates the given server processes.
+
+    :param processes: The `subprocess.Popen` instances to be stopped.
+
+    :return: None
+    """
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+def percentile(samples, pct):
+    """Returns the percentile of the samples by nearest rank.
+
+    :param samples: The list of numbers.
+    :param pct: The percentile to be computed, between 0 and 100.
+
+    :return: The value at the given percentile, or `None` without samples.
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(samples):
+    """Summarizes latency samples given in seconds.
+
+    :param samples: The list of latencies in seconds.
+
+    :return: A dict with number of samples and percentiles in milliseconds.
+    """
+    summary = {"count": len(samples)}
+    for name, pct in (("p50", 50), ("p99", 99), ("p999", 99.9)):
+        value = percentile(samples, pct)
+        summary[f"{name}_ms"] = None if value is None else value * 1000
+    return summary
+
+
+def process_usage(pid):
+    """Returns the CPU time and memory of a running process, on Linux only.
+
+    :param pid: The id of the process.
+
+    :return: A dict with the CPU seconds spent so far, the current and the
+             peak resident set size in megabytes.
+    """
+    with open(f"/proc/{pid}/stat") as stat:
+        # The command name in parentheses may contain spaces
+        fields = stat.read().rsplit(")", 1)[1].split()
+    ticks = os.sysconf("SC_CLK_TCK")
+    usage = {"cpu_seconds": (int(fields[11]) + int(fields[12])) / ticks}
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            name, _, value = line.partition(":")
+            if name in ("VmRSS", "VmHWM"):
+                key = "rss_mb" if name == "VmRSS" else "peak_rss_mb"
+                usage[key] = int(value.split()[0]) / 1024
+    return usage
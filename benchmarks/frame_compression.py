@@ -0,0 +1,84 @@
+#!/bin/env python
+"""This file benchmarks the compression of frames above a size threshold.
+
+For frames of data items below and above the threshold, it reports the time
+`Compressor.compress` takes per frame and whether the frame was compressed,
+including frames whose first item is much smaller than the others, which
+have to be compressed all the same. It fails if a frame at least as large as
+the threshold is sent uncompressed. Usage:
+
+    $ python benchmarks/frame_compression.py --threshold 4096 --frames 1000
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from common import add_src_path
+
+add_src_path("red_server")
+from compression import Compressor
+
+
+def make_frames(threshold):
+    """Builds frames of data items around the threshold.
+
+    :param threshold: The size in bytes from which frames are compressed.
+
+    :return: A dict of the name of every frame -> the frame.
+    """
+    item = "x" * 64
+    return {
+        "small": [["001", item]] * 4,
+        "large": [["001", item]] * (threshold // 32),
+        "small_first_item": [["001", "x"]] + [["002", "x" * threshold]] * 20,
+        "small_first_dict": {
+            "id": "001", "data": ["x"] + ["x" * threshold] * 20
+        },
+    }
+
+
+def measure(name, frame, threshold, frames):
+    """Measures the compression of a frame.
+
+    :param name: The name of the frame.
+    :param frame: The frame.
+    :param threshold: The size in bytes from which frames are compressed.
+    :param frames: The number of times the frame is compressed.
+
+    :return: A dict with the results.
+    """
+    compressor = Compressor(threshold)
+    start = time.perf_counter()
+    for _ in range(frames):
+        result = compressor.compress(frame)
+    seconds = time.perf_counter() - start
+    return {
+        "frame": name,
+        "bytes": len(json.dumps(frame).encode("utf-8")),
+        "compressed": result is not frame,
+        "us_per_frame": seconds / frames * 1e6,
+        "ratio": compressor.stats()["ratio"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threshold", type=int, default=4096)
+    parser.add_argument("--frames", type=int, default=1000)
+    args = parser.parse_args()
+
+    results = [
+        measure(name, frame, args.threshold, args.frames)
+        for name, frame in make_frames(args.threshold).items()
+    ]
+    print(json.dumps(results, indent=2))
+    uncompressed = [
+        result["frame"] for result in results
+        if result["bytes"] >= args.threshold and not result["compressed"]
+    ]
+    if uncompressed:
+        print(f"ERROR: Frames above the threshold sent uncompressed: "
+              f"{', '.join(uncompressed)}")
+        sys.exit(1)
@@ -0,0 +1,151 @@
+#!/bin/env python
+"""This file benchmarks the ingest throughput of green apple server workers.
+
+For each number of workers, a green apple server is started with its workers
+and producer processes publish messages through green clients connected to
+the worker owning their id. A consumer subscribed like a red apple server
+counts the messages pushed by the green apple server, which reports how many
+messages per second the green apple server ingests. Usage:
+
+    $ python benchmarks/green_workers.py --workers 1 2 4 --producers 4
+"""
+
+import argparse
+import json
+import multiprocessing
+import time
+
+from socketio import Client
+
+from common import add_src_path, start_server, stop_servers
+
+add_src_path("green_server")
+from worker import worker_for
+
+
+def produce(port, workers, green_ids, messages, payload, ready, start, done):
+    """Publishes messages through one green client per green id.
+
+    :param port: The port of the green apple server.
+    :param workers: The number of workers of the green apple server.
+    :param green_ids: The list of three digit ids of the green clients.
+    :param messages: The number of messages published per green client.
+    :param payload: The published string.
+    :param ready: The queue on which the process tells it has joined.
+    :param start: The event which starts publishing.
+    :param done: The event after which the clients disconnect.
+
+    :return: None
+    """
+    clients = []
+    for green_id in green_ids:
+        client = Client()
+        owner_port = int(port) + worker_for(green_id, workers)
+        client.connect(
+            f"http://127.0.0.1:{owner_port}", namespaces=["/green"]
+        )
+        client.emit("join", {"id": green_id}, namespace="/green")
+        clients.append((green_id, client))
+    ready.put(True)
+    start.wait()
+    for _ in range(messages):
+        for green_id, client in clients:
+            client.emit(
+                "incoming_data",
+                {"id": green_id, "data": payload},
+                namespace="/green"
+            )
+    done.wait()
+    for _, client in clients:
+        client.disconnect()
+
+
+def measure(workers, producers, clients_per_producer, messages, payload_size):
+    """Measures the messages per second ingested by a green apple server.
+
+    :param workers: The number of workers of the green apple server.
+    :param producers: The number of producer processes.
+    :param clients_per_producer: The number of green clients per producer.
+    :param messages: The number of messages published per green client.
+    :param payload_size: The number of characters of every message.
+
+    :return: A dict with the received messages and messages per second.
+    """
+    green = start_server(
+        "green", port="7100", workers=workers, log_dir=None,
+        push_enabled=True
+    )
+    received = []
+    consumer = Client()
+
+    def on_push_data(data):
+        received.append(len(data["data"] or ()))
+        return True
+
+    consumer.on("push_data", on_push_data, namespace="/red")
+    ready, start, done = (
+        multiprocessing.Queue(), multiprocessing.Event(),
+        multiprocessing.Event()
+    )
+    processes = []
+    total = producers * clients_per_producer * messages
+    try:
+        # Workers connect to the green apple server in the background
+        time.sleep(2)
+        consumer.connect("http://127.0.0.1:7100", namespaces=["/red"])
+        consumer.emit("subscribe", {"codec": "json"}, namespace="/red")
+        for index in range(producers):
+            green_ids = [
+                f"{index * clients_per_producer + number:03d}"
+                for number in range(clients_per_producer)
+            ]
+            process = multiprocessing.Process(
+                target=produce,
+                args=(
+                    "7100", workers, green_ids, messages, "x" * payload_size,
+                    ready, start, done
+                )
+            )
+            process.start()
+            processes.append(process)
+        for _ in processes:
+            ready.get(timeout=30)
+        # Let the joins reach the green apple server before measuring
+        time.sleep(1)
+        received.clear()
+        started_at = time.perf_counter()
+        start.set()
+        deadline = time.monotonic() + 60
+        while sum(received) < total and time.monotonic() < deadline:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started_at
+    finally:
+        done.set()
+        for process in processes:
+            process.join()
+        consumer.disconnect()
+        stop_servers(green)
+    return {
+        "workers": workers,
+        "received": sum(received),
+        "messages_per_second": sum(received) / elapsed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--producers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=25)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--payload-size", type=int, default=64)
+    args = parser.parse_args()
+
+    results = [
+        measure(
+            workers, args.producers, args.clients, args.messages,
+            args.payload_size
+        )
+        for workers in args.workers
+    ]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,94 @@
+#!/bin/env python
+"""This file benchmarks the partitioning of rooms over red apple servers.
+
+For each number of red apple servers on the consistent-hash ring, it reports
+the share of the published messages each server receives, when all 1000 rooms
+publish at the same rate, and the share of rooms moved to another server when
+a server is added or removed. Usage:
+
+    $ python benchmarks/hash_ring.py --nodes 1 2 4 8 --vnodes 100
+"""
+
+import argparse
+import json
+import time
+
+from common import add_src_path
+
+add_src_path("red_server")
+from ring import HashRing
+
+ROOMS = [f"{room:03d}" for room in range(1000)]
+
+
+def owners(ring):
+    """Returns the owner of every room.
+
+    :param ring: The `HashRing` instance.
+
+    :return: A dict of room id -> node name.
+    """
+    return {room_id: ring.node_for(room_id) for room_id in ROOMS}
+
+
+def moved_share(before, after):
+    """Returns the share of rooms which changed owner.
+
+    :param before: The dict of room owners before the change.
+    :param after: The dict of room owners after the change.
+
+    :return: Float share between `0` and `1`.
+    """
+    moved = sum(before[room_id] != after[room_id] for room_id in ROOMS)
+    return moved / len(ROOMS)
+
+
+def measure(nodes, vnodes):
+    """Measures the partitioning of the rooms over a number of servers.
+
+    :param nodes: The number of red apple servers.
+    :param vnodes: The number of virtual nodes of every server.
+
+    :return: A dict with the shares of messages per server and moved rooms.
+    """
+    names = [f"127.0.0.1:{6100 + index}" for index in range(nodes + 1)]
+    ring = HashRing(names[:nodes], vnodes)
+    current = owners(ring)
+    shares = [
+        sum(owner == name for owner in current.values()) / len(ROOMS)
+        for name in names[:nodes]
+    ]
+    # Time the lookups which aren't cached yet
+    ring.room_owners.clear()
+    start = time.perf_counter()
+    for room_id in ROOMS:
+        ring.node_for(room_id)
+    lookup_us = (time.perf_counter() - start) / len(ROOMS) * 1e6
+
+    ring.add(names[nodes])
+    added = moved_share(current, owners(ring))
+    ring.remove(names[nodes])
+    removed = None
+    if nodes > 1:
+        ring.remove(names[0])
+        removed = moved_share(current, owners(ring))
+    return {
+        "nodes": nodes,
+        "max_message_share": max(shares),
+        "min_message_share": min(shares),
+        "ideal_message_share": 1 / nodes,
+        "moved_share_on_add": added,
+        "ideal_moved_share_on_add": 1 / (nodes + 1),
+        "moved_share_on_remove": removed,
+        "lookup_us": lookup_us,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--vnodes", type=int, default=100)
+    args = parser.parse_args()
+
+    results = [measure(nodes, args.vnodes) for nodes in args.nodes]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,93 @@
+#!/bin/env python
+"""This file benchmarks the bytes sent to red servers with interest filtering.
+
+A green apple server is started and green clients publish messages, of which
+only some rooms are watched. A consumer subscribed like a red apple server
+counts the items and bytes pushed to it, once telling the watched rooms as its
+interest and once without. Usage:
+
+    $ python benchmarks/interest_filtering.py --producers 100 --watched 10
+"""
+
+import argparse
+import json
+import time
+
+from socketio import Client
+
+from common import start_server, stop_servers
+
+
+def measure(interest, producers, watched, messages, payload_size):
+    """Measures the data pushed to a red apple server.
+
+    :param interest: Boolean, whether the watched rooms are told.
+    :param producers: The number of green clients, each with its own room.
+    :param watched: The number of rooms watched by red clients.
+    :param messages: The number of messages published per green client.
+    :param payload_size: The number of characters of every message.
+
+    :return: A dict with the number of pushed items and bytes.
+    """
+    green = start_server("green", port="7100", log_dir=None, push_enabled=True)
+    rooms = [f"{index:03d}" for index in range(producers)]
+    pushed = {"items": 0, "bytes": 0}
+    consumer = Client()
+
+    def on_push_data(data):
+        pushed["items"] += len(data["data"] or ())
+        pushed["bytes"] += len(json.dumps(data))
+        return True
+
+    consumer.on("push_data", on_push_data, namespace="/red")
+    publishers = []
+    try:
+        consumer.connect("http://127.0.0.1:7100", namespaces=["/red"])
+        if interest:
+            consumer.emit(
+                "interest", {"rooms": rooms[:watched]}, namespace="/red"
+            )
+        consumer.emit("subscribe", {"codec": "json"}, namespace="/red")
+        for room_id in rooms:
+            publisher = Client()
+            publisher.connect("http://127.0.0.1:7100", namespaces=["/green"])
+            publisher.emit("join", {"id": room_id}, namespace="/green")
+            publishers.append((room_id, publisher))
+        time.sleep(1)
+        for number in range(messages):
+            for room_id, publisher in publishers:
+                publisher.emit(
+                    "incoming_data",
+                    {"id": room_id, "data": f"{number}".ljust(payload_size)},
+                    namespace="/green"
+                )
+        expected = (watched if interest else producers) * messages
+        deadline = time.monotonic() + 30
+        while pushed["items"] < expected and time.monotonic() < deadline:
+            time.sleep(0.05)
+        # Pushes of unwatched rooms would still be arriving
+        time.sleep(1)
+    finally:
+        for _, publisher in publishers:
+            publisher.disconnect()
+        consumer.disconnect()
+        stop_servers(green)
+    return {"interest": interest, **pushed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--producers", type=int, default=100)
+    parser.add_argument("--watched", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--payload-size", type=int, default=64)
+    args = parser.parse_args()
+
+    results = [
+        measure(
+            interest, args.producers, args.watched, args.messages,
+            args.payload_size
+        )
+        for interest in (False, True)
+    ]
+    print(json.dumps(results, indent=2))
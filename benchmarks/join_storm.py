@@ -0,0 +1,190 @@
+#!/bin/env python
+"""This file benchmarks a storm of red clients joining at once.
+
+A green apple server and a red apple server are started, producers publish
+timestamped messages at a steady rate and a set of existing red clients time
+the messages they receive. After a quiet period, a storm of new red clients
+connects and joins at once, like after a restart of the red apple server. It
+reports the latencies of the existing red clients before and during the storm,
+how long the storm took to join and how many joins were told to retry, with
+and without admission control of joins. The number of open files may have to
+be raised for the storm, e.g. by `ulimit -n 65536`. Usage:
+
+    $ python benchmarks/join_storm.py --storm 10000 --join-rate 500
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from socketio import AsyncClient
+
+from common import process_usage, start_server, stop_servers, summarize
+
+
+async def join(client, room_id, stats):
+    """Joins a red client to a room, retrying while it is throttled.
+
+    :param client: The connected `AsyncClient`.
+    :param room_id: The three digit room id.
+    :param stats: The dict counting the ``retries`` of throttled joins.
+
+    :return: None
+    """
+    while True:
+        response = asyncio.get_running_loop().create_future()
+        await client.emit(
+            "join",
+            {"id": room_id},
+            namespace="/red",
+            callback=lambda reply=None: response.set_result(reply)
+        )
+        reply = await response
+        if reply is None or "retry_after" not in reply:
+            return
+        stats["retries"] += 1
+        await asyncio.sleep(reply["retry_after"])
+
+
+async def connect_consumer(room_id, latencies, stats):
+    """Connects and joins a red client which times the received messages.
+
+    :param room_id: The three digit room id.
+    :param latencies: The dict with the list of latencies in seconds of the
+                      current ``phase``, or `None` if they aren't recorded.
+    :param stats: The dict counting the ``retries`` of throttled joins and
+                  the ``failed`` connects.
+
+    :return: The connected `AsyncClient`, or `None` if it failed to connect.
+    """
+    client = AsyncClient(reconnection=False)
+
+    async def on_broadcast_message(data):
+        samples = latencies.get(latencies["phase"])
+        if samples is None:
+            return
+        now = time.perf_counter()
+        for message in data["data"]:
+            samples.append(now - float(message.split(":")[1]))
+
+    client.on("broadcast_message", on_broadcast_message, namespace="/red")
+    try:
+        await client.connect("http://127.0.0.1:6100", namespaces=["/red"])
+    except Exception:
+        stats["failed"] += 1
+        return None
+    await join(client, room_id, stats)
+    return client
+
+
+async def publish(publishers, rooms, rate, running):
+    """Publishes timestamped messages to every room at a steady rate.
+
+    :param publishers: The list of `AsyncClient` joined to the green server.
+    :param rooms: The list of three digit room ids, one per publisher.
+    :param rate: The number of messages per second and room.
+    :param running: The `asyncio.Event` which is cleared to stop.
+
+    :return: None
+    """
+    while running.is_set():
+        for room_id, publisher in zip(rooms, publishers):
+            await publisher.emit(
+                "incoming_data",
+                {"id": room_id, "data": f"{room_id}:{time.perf_counter()}"},
+                namespace="/green"
+            )
+        await asyncio.sleep(1.0 / rate)
+
+
+async def drive(args):
+    """Publishes to existing red clients before and during a join storm.
+
+    :param args: The parsed command line arguments.
+
+    :return: A dict with the latencies of both phases and the storm results.
+    """
+    rooms = [f"{600 + index:03d}" for index in range(args.producers)]
+    latencies = {"phase": None, "before": [], "during": []}
+    stats = {"retries": 0, "failed": 0}
+    publishers = []
+    for room_id in rooms:
+        publisher = AsyncClient(reconnection=False)
+        await publisher.connect(
+            "http://127.0.0.1:7100", namespaces=["/green"]
+        )
+        await publisher.emit("join", {"id": room_id}, namespace="/green")
+        publishers.append(publisher)
+    # Let the red server learn about the green clients
+    await asyncio.sleep(1)
+    existing = await asyncio.gather(*(
+        connect_consumer(rooms[index % len(rooms)], latencies, stats)
+        for index in range(args.existing)
+    ))
+    running = asyncio.Event()
+    running.set()
+    publishing = asyncio.ensure_future(
+        publish(publishers, rooms, args.rate, running)
+    )
+    latencies["phase"] = "before"
+    await asyncio.sleep(args.quiet)
+    latencies["phase"] = "during"
+    stats["retries"] = 0
+    start = time.perf_counter()
+    storm = await asyncio.gather(*(
+        connect_consumer(rooms[index % len(rooms)], {"phase": None}, stats)
+        for index in range(args.storm)
+    ))
+    storm_seconds = time.perf_counter() - start
+    running.clear()
+    await publishing
+    clients = [
+        client for client in publishers + existing + storm
+        if client is not None
+    ]
+    await asyncio.gather(*(client.disconnect() for client in clients))
+    return {
+        "before": summarize(latencies["before"]),
+        "during": summarize(latencies["during"]),
+        "storm_joined": sum(client is not None for client in storm),
+        "storm_failed": stats["failed"],
+        "storm_seconds": storm_seconds,
+        "join_retries": stats["retries"],
+    }
+
+
+def measure(args, join_rate):
+    """Measures a join storm with or without admission control.
+
+    :param args: The parsed command line arguments.
+    :param join_rate: The joins admitted per second, or `None`.
+
+    :return: A dict with the results.
+    """
+    admission = {"join_rate": join_rate, "join_burst": args.join_burst}
+    green = start_server("green", port="7100", log_dir=None, **admission)
+    red = start_server("red", port="6100", grn_server_port="7100", **admission)
+    try:
+        result = asyncio.run(drive(args))
+        result["red_server"] = process_usage(red.pid)
+    finally:
+        stop_servers(red, green)
+    return {"join_rate": join_rate, **result}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--storm", type=int, default=10000)
+    parser.add_argument("--existing", type=int, default=100)
+    parser.add_argument("--producers", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=20.0)
+    parser.add_argument("--quiet", type=float, default=5.0)
+    parser.add_argument("--join-rate", type=float, default=500.0)
+    parser.add_argument("--join-burst", type=int, default=100)
+    args = parser.parse_args()
+
+    results = [
+        measure(args, join_rate) for join_rate in (None, args.join_rate)
+    ]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,82 @@
+#!/bin/env python
+"""This file benchmarks the codecs of the link between the apple servers.
+
+For realistic batch sizes, it reports the cost of encoding and decoding a
+payload and its size on the wire. The size of a `json` payload is the size of
+its JSON text, as sent by Socket.IO. Usage:
+
+    $ python benchmarks/link_codec.py --batches 1 10 100 1000
+"""
+
+import argparse
+import json
+import time
+
+from common import add_src_path
+
+add_src_path("green_server")
+from codec import BinaryCodec, JsonCodec, decode_payload
+
+
+def make_payload(batch_size, payload_size=32, active=100):
+    """Builds a payload with new data of random rooms and a roster delta.
+
+    :param batch_size: The number of published data items.
+    :param payload_size: The number of characters of every data item.
+    :param active: The number of active green ids the data is spread over.
+
+    :return: The payload dict.
+    """
+    return {
+        "data": [
+            (f"{i % active:03d}", f"{i:08d}".ljust(payload_size, "x"))
+            for i in range(batch_size)
+        ],
+        "roster": {"version": 42, "changes": [(42, "join", "123")]},
+    }
+
+
+def measure(codec, payload, rounds):
+    """Measures the cost and size of a payload encoded by a codec.
+
+    :param codec: The codec class.
+    :param payload: The payload dict.
+    :param rounds: The number of encode and decode rounds to average.
+
+    :return: A dict with microseconds per encode and decode, and bytes.
+    """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        encoded = codec.encode(payload)
+        if codec is JsonCodec:
+            # Socket.IO serializes JSON payloads itself
+            encoded = json.dumps(encoded)
+    encode_us = (time.perf_counter() - start) / rounds * 1e6
+    start = time.perf_counter()
+    for _ in range(rounds):
+        if codec is JsonCodec:
+            decode_payload(json.loads(encoded))
+        else:
+            decode_payload(encoded)
+    decode_us = (time.perf_counter() - start) / rounds * 1e6
+    size = len(encoded.encode("utf-8") if codec is JsonCodec else encoded)
+    return {"encode_us": encode_us, "decode_us": decode_us, "bytes": size}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--batches", type=int, nargs="+", default=[1, 10, 100, 1000]
+    )
+    parser.add_argument("--payload-size", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    results = []
+    for batch_size in args.batches:
+        payload = make_payload(batch_size, args.payload_size)
+        result = {"batch_size": batch_size}
+        for codec in (JsonCodec, BinaryCodec):
+            result[codec.name] = measure(codec, payload, args.rounds)
+        results.append(result)
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,185 @@
+#!/bin/env python
+"""This file checks that the red listener resumes after the green server drops.
+
+A green apple server with a message log and a red apple server are started, a
+producer publishes messages to a room joined by a red client, and the green
+apple server is then restarted on the same message log. The listener of the
+red apple server has to reconnect and resume from the offset of the last
+message it received, so that the messages published after the restart reach
+the red client, without the messages before the restart being replayed again.
+It reports the missing and duplicate messages and fails if there are any, and
+the seconds from restarting the green apple server till the first message
+published after it reached the red client. Usage:
+
+    $ python benchmarks/listener_reconnect.py --before 100 --after 100
+"""
+
+import argparse
+import asyncio
+import json
+import shutil
+import sys
+import tempfile
+import time
+
+from socketio import AsyncClient
+
+from common import start_server, stop_servers
+
+ROOM_ID = "400"
+
+
+async def join_when_ready(received):
+    """Connects a red client and joins the room till the join is admitted.
+
+    :param received: The list receiving the broadcasted data.
+
+    :return: The connected `AsyncClient`.
+    """
+    client = AsyncClient(reconnection=False)
+    client.rejected = False
+
+    async def on_broadcast_message(data):
+        received.extend(data["data"])
+
+    async def on_abort_connection(error):
+        client.rejected = True
+
+    client.on("broadcast_message", on_broadcast_message, namespace="/red")
+    client.on("abort_connection", on_abort_connection, namespace="/red")
+    await client.connect("http://127.0.0.1:6400", namespaces=["/red"])
+    while True:
+        client.rejected = False
+        response = asyncio.get_running_loop().create_future()
+        await client.emit(
+            "join",
+            {"id": ROOM_ID},
+            namespace="/red",
+            callback=lambda reply=None: response.set_result(reply)
+        )
+        reply = await response
+        if not client.rejected and reply is None:
+            return client
+        await asyncio.sleep(0.05)
+
+
+async def connect_producer():
+    """Connects a green client, which joins with the id of the room.
+
+    :return: The connected `AsyncClient`.
+    """
+    producer = AsyncClient(reconnection=False)
+    await producer.connect("http://127.0.0.1:7400", namespaces=["/green"])
+    await producer.emit("join", {"id": ROOM_ID}, namespace="/green")
+    return producer
+
+
+async def publish(producer, numbers):
+    """Publishes numbered messages to the room.
+
+    :param producer: The connected `AsyncClient` of the green client.
+    :param numbers: The iterable of message numbers.
+
+    :return: None
+    """
+    for number in numbers:
+        await producer.emit(
+            "incoming_data",
+            {"id": ROOM_ID, "data": f"{ROOM_ID}:{number}"},
+            namespace="/green"
+        )
+
+
+async def wait_for(received, count, timeout):
+    """Waits till the red client received a number of messages.
+
+    :param received: The list receiving the broadcasted data.
+    :param count: The number of messages to wait for.
+    :param timeout: The number of seconds to wait at most.
+
+    :return: None
+    """
+    deadline = time.monotonic() + timeout
+    while len(received) < count and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+
+async def drive(args, servers, log_dir):
+    """Publishes, restarts the green apple server and publishes again.
+
+    :param args: The parsed command line arguments.
+    :param servers: The dict of the running server processes, whose ``green``
+                    server is replaced by the restarted one.
+    :param log_dir: The directory of the message log.
+
+    :return: A dict with the results.
+    """
+    loop = asyncio.get_running_loop()
+    received = []
+    producer = await connect_producer()
+    client = await join_when_ready(received)
+    await publish(producer, range(args.before))
+    await wait_for(received, args.before, args.timeout)
+    received_before = len(received)
+    await loop.run_in_executor(None, stop_servers, servers.pop("green"))
+    start = time.perf_counter()
+    servers["green"] = await loop.run_in_executor(
+        None, lambda: start_server("green", port="7400", log_dir=log_dir)
+    )
+    await producer.disconnect()
+    producer = await connect_producer()
+    await publish(producer, range(args.before, args.before + args.after))
+    await wait_for(received, received_before + 1, args.timeout)
+    resume_seconds = time.perf_counter() - start
+    await wait_for(received, args.before + args.after, args.timeout)
+    # Let late replays arrive, which would be duplicates
+    await asyncio.sleep(args.settle)
+    await asyncio.gather(producer.disconnect(), client.disconnect())
+    expected = [
+        f"{ROOM_ID}:{number}" for number in range(args.before + args.after)
+    ]
+    return {
+        "before": args.before,
+        "after": args.after,
+        "received": len(received),
+        "missing": len(set(expected) - set(received)),
+        "duplicates": len(received) - len(set(received)),
+        "resume_seconds": resume_seconds,
+    }
+
+
+def measure(args):
+    """Runs both servers and checks the messages of the red client.
+
+    :param args: The parsed command line arguments.
+
+    :return: A dict with the results.
+    """
+    log_dir = tempfile.mkdtemp(prefix="listener_reconnect_")
+    servers = {"green": start_server("green", port="7400", log_dir=log_dir)}
+    try:
+        servers["red"] = start_server(
+            "red",
+            port="6400",
+            grn_server_port="7400",
+            interest_filtering=False
+        )
+        return asyncio.run(drive(args, servers, log_dir))
+    finally:
+        stop_servers(*servers.values())
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--before", type=int, default=100)
+    parser.add_argument("--after", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=15.0)
+    parser.add_argument("--settle", type=float, default=1.0)
+    args = parser.parse_args()
+
+    result = measure(args)
+    print(json.dumps(result, indent=2))
+    if result["missing"] or result["duplicates"]:
+        print("ERROR: The listener didn't resume from its last offset")
+        sys.exit(1)
@@ -0,0 +1,404 @@
+#!/bin/env python
+"""This file load tests the whole pipeline with many simulated clients.
+
+A green apple server and a red apple server are started, and green and red
+clients are simulated by the `GreenClient` and `RedClient` classes in their
+non-interactive mode, spread over several client processes. Every green client
+publishes timestamped payloads at a fixed rate, which are timed when the red
+clients of its room receive them. It reports the throughput, the latency
+percentiles and the CPU time and peak RSS of every process as JSON, and exits
+with status 1 if a result regressed against a stored baseline. Usage:
+
+    $ python benchmarks/load_test.py --greens 100 --reds 1000 --rate 10
+    $ python benchmarks/load_test.py --output baseline.json
+    $ python benchmarks/load_test.py --baseline baseline.json --tolerance 0.2
+
+The client processes run this file too, with the role and the options of
+their clients, and talk to the benchmark over their stdin and stdout:
+
+    $ python load_test.py green '{"ids": ["000", "001"], "rate": 10, ...}'
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from common import (add_src_path, process_usage, start_server, stop_servers,
+                    summarize)
+
+# Results compared to the baseline, and whether higher values are better
+CHECKS = (
+    (("throughput", "delivered_per_s"), True),
+    (("latency", "p50_ms"), False),
+    (("latency", "p99_ms"), False),
+    (("latency", "p999_ms"), False),
+    (("processes", "green_server", "cpu_seconds"), False),
+    (("processes", "green_server", "peak_rss_mb"), False),
+    (("processes", "red_server", "cpu_seconds"), False),
+    (("processes", "red_server", "peak_rss_mb"), False),
+)
+
+
+def report(stream, data):
+    """Writes one line of JSON to the benchmark, see `read_report`.
+
+    :param stream: The stdout of the client process.
+    :param data: The dict to be reported.
+
+    :return: None
+    """
+    stream.write(json.dumps(data) + "\n")
+    stream.flush()
+
+
+def own_usage():
+    """Returns the CPU time and peak memory of the current process.
+
+    :return: A dict like the one of `process_usage`, without the current RSS.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "cpu_seconds": usage.ru_utime + usage.ru_stime,
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+    }
+
+
+def wait_until(condition, timeout, interval=0.1):
+    """Waits till a condition holds.
+
+    :param condition: The callable returning whether the condition holds.
+    :param timeout: The number of seconds to wait for.
+    :param interval: The number of seconds between checks.
+
+    :return: Boolean, whether the condition held in time.
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(interval)
+    return True
+
+
+def run_green_clients(options):
+    """Runs green clients which publish once the benchmark says so.
+
+    The process reports when all its clients have joined, waits for a line on
+    its stdin, publishes for the given duration and reports the number of
+    published messages together with its own usage.
+
+    :param options: The dict with the three digit ``ids`` of the clients, the
+                    ``port`` of the green apple server, the ``rate`` of every
+                    client, the ``payload`` size, the ``duration`` and the
+                    ``batch_size`` and ``batch_delay`` of the clients.
+
+    :return: None
+    """
+    add_src_path("green_client")
+    from listener import GreenClient
+    from settings import GreenClientConstants as consts
+
+    out, sys.stdout = sys.stdout, open(os.devnull, "w")
+    clients = []
+    for num_id in options["ids"]:
+        client = GreenClient(
+            host="127.0.0.1",
+            port=options["port"],
+            client_namespace=consts.green_client_nmsp,
+            server_namespace=consts.green_server_nmsp,
+            batch_size=options["batch_size"],
+            batch_delay=options["batch_delay"],
+            num_id=num_id,
+            interactive=False
+        )
+        client.run()
+        clients.append(client)
+    joined = wait_until(lambda: all(c.joined for c in clients), 30)
+    report(out, {"ready": joined})
+    sys.stdin.readline()
+
+    filler = "x" * options["payload"]
+    interval = 1.0 / options["rate"]
+    sent = 0
+    start = next_at = time.monotonic()
+    while next_at < start + options["duration"]:
+        for client in clients:
+            if client.publish(f"{time.time()!r}:{filler}"):
+                sent += 1
+        next_at += interval
+        time.sleep(max(next_at - time.monotonic(), 0))
+    for client in clients:
+        client.batcher.flush()
+    report(out, {
+        "sent": sent,
+        "seconds": time.monotonic() - start,
+        "usage": own_usage(),
+    })
+    for client in clients:
+        client.disconnect_from_server()
+
+
+def run_red_clients(options):
+    """Runs red clients which time the data they receive.
+
+    The process reports when all its clients have joined, waits for a line on
+    its stdin and reports the latencies of the received messages together
+    with its own usage.
+
+    :param options: The dict with the three digit ``ids`` of the rooms of the
+                    clients and the ``port`` of the red apple server.
+
+    :return: None
+    """
+    add_src_path("red_client")
+    from listener import RedClient
+    from settings import RedClientConstants as consts
+
+    out, sys.stdout = sys.stdout, open(os.devnull, "w")
+    latencies = []
+
+    def on_data(data):
+        latencies.append(time.time() - float(data.split(":", 1)[0]))
+
+    clients = []
+    for num_id in options["ids"]:
+        client = RedClient(
+            host="127.0.0.1",
+            port=options["port"],
+            client_namespace=consts.red_client_nmsp,
+            server_namespace=consts.red_server_nmsp,
+            compression=consts.compression,
+            num_id=num_id,
+            data_handler=on_data
+        )
+        client.run()
+        clients.append(client)
+    # Red server rejects the join till it learns about the green client, and
+    # the rejected clients disconnect
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        time.sleep(1)
+        rejected = [c for c in clients if not c.sio_client.connected]
+        if not rejected:
+            break
+        for client in rejected:
+            client.connect_to_server()
+    report(out, {"ready": all(c.sio_client.connected for c in clients)})
+    sys.stdin.readline()
+
+    report(out, {
+        "latencies": [round(latency, 6) for latency in latencies],
+        "usage": own_usage(),
+    })
+    for client in clients:
+        client.disconnect_from_server()
+
+
+def start_clients(role, options):
+    """Starts a client process running this file.
+
+    :param role: Either `green` or `red`.
+    :param options: The options of the clients, see `run_green_clients` and
+                    `run_red_clients`.
+
+    :return: The `subprocess.Popen` instance of the client process.
+    """
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), role, json.dumps(options)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        universal_newlines=True
+    )
+
+
+def read_report(process):
+    """Reads one report of a client process, see `report`.
+
+    :param process: The `subprocess.Popen` instance of the client process.
+
+    :return: The reported dict.
+    """
+    line = process.stdout.readline()
+    if not line:
+        raise RuntimeError(
+            f"Client process exited with status {process.wait()}"
+        )
+    return json.loads(line)
+
+
+def tell(processes):
+    """Tells client processes to go on, see `run_green_clients`.
+
+    :param processes: The list of `subprocess.Popen` instances.
+
+    :return: None
+    """
+    for process in processes:
+        process.stdin.write("\n")
+        process.stdin.flush()
+
+
+def chunks(items, size):
+    """Returns consecutive slices of a list.
+
+    :param items: The list to be sliced.
+    :param size: The maximum number of items per slice.
+
+    :return: The list of slices.
+    """
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def measure(args):
+    """Runs the load test once.
+
+    :param args: The parsed command line arguments.
+
+    :return: The dict of results.
+    """
+    green = start_server(
+        "green", port="7100", log_dir=None, push_enabled=args.push,
+        tracing=False
+    )
+    red = start_server(
+        "red", port="6100", grn_server_port="7100", push_enabled=args.push,
+        tracing=False
+    )
+    green_ids = [f"{room:03d}" for room in range(args.greens)]
+    red_ids = [green_ids[client % args.greens] for client in range(args.reds)]
+    producers, consumers = [], []
+    try:
+        for ids in chunks(green_ids, args.clients_per_process):
+            producers.append(start_clients("green", {
+                "ids": ids,
+                "port": "7100",
+                "rate": args.rate,
+                "payload": args.payload,
+                "duration": args.duration,
+                "batch_size": args.batch_size,
+                "batch_delay": args.batch_delay,
+            }))
+        if not all(read_report(p)["ready"] for p in producers):
+            raise RuntimeError("Green clients failed to join")
+        for ids in chunks(red_ids, args.clients_per_process):
+            consumers.append(
+                start_clients("red", {"ids": ids, "port": "6100"})
+            )
+        if not all(read_report(p)["ready"] for p in consumers):
+            raise RuntimeError("Red clients failed to join")
+
+        servers = {"green_server": green.pid, "red_server": red.pid}
+        before = {name: process_usage(pid) for name, pid in servers.items()}
+        tell(producers)
+        published = [read_report(p) for p in producers]
+        time.sleep(args.drain)
+        tell(consumers)
+        received = [read_report(p) for p in consumers]
+        after = {name: process_usage(pid) for name, pid in servers.items()}
+    finally:
+        for process in producers + consumers:
+            process.kill()
+            process.wait()
+        stop_servers(red, green)
+
+    processes = {}
+    for name in servers:
+        processes[name] = dict(after[name])
+        processes[name]["cpu_seconds"] -= before[name]["cpu_seconds"]
+    for role, reports in (("green", published), ("red", received)):
+        for number, result in enumerate(reports):
+            processes[f"{role}_clients_{number}"] = result["usage"]
+    latencies = [
+        latency for result in received for latency in result["latencies"]
+    ]
+    sent = sum(result["sent"] for result in published)
+    seconds = max(result["seconds"] for result in published)
+    # Every message is delivered to every red client of its room
+    expected = sent * args.reds / args.greens
+    return {
+        "config": vars(args),
+        "published": sent,
+        "delivered": len(latencies),
+        "delivery_ratio": len(latencies) / expected if expected else None,
+        "throughput": {
+            "published_per_s": sent / seconds,
+            "delivered_per_s": len(latencies) / seconds,
+        },
+        "latency": summarize(latencies),
+        "processes": processes,
+    }
+
+
+def regressions(results, baseline, tolerance):
+    """Compares results to a baseline, see `CHECKS`.
+
+    :param results: The dict of results of `measure`.
+    :param baseline: The dict of results of an earlier run.
+    :param tolerance: The fraction by which a result may be worse than the
+                      baseline.
+
+    :return: The list of dicts with the ``metric``, ``baseline`` and
+             ``result`` of every regressed result.
+    """
+    found = []
+    for path, higher_is_better in CHECKS:
+        old, new = baseline, results
+        for key in path:
+            old = old.get(key) if isinstance(old, dict) else None
+            new = new.get(key) if isinstance(new, dict) else None
+        if old is None or new is None:
+            continue
+        if higher_is_better:
+            regressed = new < old * (1 - tolerance)
+        else:
+            regressed = new > old * (1 + tolerance)
+        if regressed:
+            found.append({
+                "metric": ".".join(path), "baseline": old, "result": new
+            })
+    return found
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] in ("green", "red"):
+        role, options = sys.argv[1], json.loads(sys.argv[2])
+        if role == "green":
+            run_green_clients(options)
+        else:
+            run_red_clients(options)
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--greens", type=int, default=100)
+    parser.add_argument("--reds", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=10.0)
+    parser.add_argument("--payload", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--drain", type=float, default=5.0)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--batch-delay", type=float, default=0.0)
+    parser.add_argument("--clients-per-process", type=int, default=250)
+    parser.add_argument("--push", action="store_true")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+    if not 0 < args.greens <= 1000:
+        parser.error("--greens must be between 1 and 1000")
+
+    results = measure(args)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            results["regressions"] = regressions(
+                results, json.load(baseline), args.tolerance
+            )
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    print(json.dumps(results, indent=2))
+    if results.get("regressions"):
+        sys.exit(1)
@@ -0,0 +1,77 @@
+#!/bin/env python
+"""This file benchmarks the write and replay paths of the message log.
+
+Messages are appended to a log in a temporary directory, once per size of the
+fsync batch, and then replayed sequentially from the first offset. Usage:
+
+    $ python benchmarks/message_log.py --messages 200000 --fsync-batch 1 1000
+"""
+
+import argparse
+import json
+import tempfile
+import time
+
+from common import add_src_path
+
+add_src_path("green_server")
+from message_log import MessageLog
+
+
+def measure(messages, payload_size, fsync_batch, replay_batch=1000):
+    """Measures appending and replaying messages of a log.
+
+    :param messages: The number of messages to be appended.
+    :param payload_size: The number of characters of every message.
+    :param fsync_batch: The number of messages written per fsync.
+    :param replay_batch: The number of messages read per replay call.
+
+    :return: A dict of messages and megabytes per second.
+    """
+    payload = "x" * payload_size
+    with tempfile.TemporaryDirectory() as directory:
+        log = MessageLog(
+            directory,
+            segment_bytes=16 * 1024 * 1024,
+            fsync_batch=fsync_batch,
+            fsync_interval=3600
+        )
+        start = time.perf_counter()
+        for i in range(messages):
+            log.append(f"{i % 1000:03d}", payload)
+        log.sync()
+        write_seconds = time.perf_counter() - start
+        size = sum(segment.size for segment in log.segments)
+
+        start = time.perf_counter()
+        offset = replayed = 0
+        while True:
+            records = log.read(offset, replay_batch)
+            if not records:
+                break
+            replayed += len(records)
+            offset = records[-1][0] + 1
+        replay_seconds = time.perf_counter() - start
+        log.close()
+    return {
+        "fsync_batch": fsync_batch,
+        "write_msgs_per_s": messages / write_seconds,
+        "write_mb_per_s": size / write_seconds / 1e6,
+        "replay_msgs_per_s": replayed / replay_seconds,
+        "replay_mb_per_s": size / replay_seconds / 1e6,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--payload-size", type=int, default=64)
+    parser.add_argument(
+        "--fsync-batch", type=int, nargs="+", default=[1, 100, 1000]
+    )
+    args = parser.parse_args()
+    results = [
+        measure(args.messages, args.payload_size, batch)
+        for batch in args.fsync_batch
+    ]
+    print(json.dumps(results, indent=2))
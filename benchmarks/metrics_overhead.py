@@ -0,0 +1,92 @@
+#!/bin/env python
+"""This file benchmarks the hot-path cost of the server metrics.
+
+It times an event handler called directly, as registered with metrics
+disabled, and wrapped to be counted and timed, as registered with metrics
+enabled, together with the counter of received data the handler of published
+data updates. It also times rendering the `/metrics` route with pending data
+in every room. Usage:
+
+    $ python benchmarks/metrics_overhead.py --calls 1000000
+"""
+
+import argparse
+import json
+import time
+
+from common import add_src_path
+
+add_src_path("green_server")
+from metrics import MetricsRegistry
+
+ROOMS = [f"{room:03d}" for room in range(1000)]
+
+
+def time_calls(handler, calls):
+    """Returns the nanoseconds per call of a handler.
+
+    :param handler: The callable taking one argument.
+    :param calls: The number of calls.
+
+    :return: Float nanoseconds per call.
+    """
+    data = {"id": "123", "data": "x"}
+    start = time.perf_counter()
+    for _ in range(calls):
+        handler(data)
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def measure(enabled, calls):
+    """Measures the cost of the metrics of one event handler.
+
+    :param enabled: Boolean, whether the metrics are enabled.
+    :param calls: The number of handler calls.
+
+    :return: A dict with the nanoseconds per call and per render.
+    """
+    metrics = MetricsRegistry("bench", enabled=enabled)
+    received = metrics.counter(
+        "events_received_total", "Events.", ("namespace", "event")
+    )
+    seconds = metrics.histogram(
+        "handler_seconds", "Handler time.", ("namespace", "event")
+    )
+    data_received = metrics.counter("data_received_total", "Data.").labels()
+    metrics.gauge(
+        "pending_items", "Pending data.",
+        lambda: {room_id: 10 for room_id in ROOMS}, ("room",)
+    )
+    pending = []
+
+    def on_incoming_client_data(data):
+        data_received.inc()
+        pending.append(data["data"])
+        if len(pending) > 1000:
+            pending.clear()
+
+    handler = metrics.timed(
+        on_incoming_client_data, seconds, received, "/green", "incoming_data"
+    )
+    ns_per_call = time_calls(handler, calls)
+    start = time.perf_counter()
+    body = metrics.render()
+    render_ms = (time.perf_counter() - start) * 1000
+    return {
+        "enabled": enabled,
+        "ns_per_call": ns_per_call,
+        "render_ms": render_ms,
+        "render_bytes": len(body),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=1000000)
+    args = parser.parse_args()
+
+    results = [measure(enabled, args.calls) for enabled in (False, True)]
+    results[1]["overhead_ns_per_call"] = (
+        results[1]["ns_per_call"] - results[0]["ns_per_call"]
+    )
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,80 @@
+#!/bin/env python
+"""This file benchmarks the presence index against the former linear scans.
+
+Sessions are spread over the 1000 possible three digit rooms. For each size,
+the cost per operation of joining, checking the subscribers of a room and
+leaving is reported, next to the `room_id in sid_to_rooms_map.values()` scan
+which the red apple server used to run on every tick. Usage:
+
+    $ python benchmarks/presence_index.py --sessions 10000 100000 1000000
+"""
+
+import argparse
+import json
+import time
+
+from common import add_src_path
+
+add_src_path("red_server")
+from presence import PresenceIndex
+
+
+def per_op(func, ops):
+    """Returns the mean number of nanoseconds per operation of a function.
+
+    :param func: The callable running `ops` operations.
+    :param ops: The number of operations run by `func`.
+
+    :return: Float nanoseconds per operation.
+    """
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) / ops * 1e9
+
+
+def measure(sessions, scan_ops=100):
+    """Measures operations of the presence index for a number of sessions.
+
+    :param sessions: The number of simulated sessions.
+    :param scan_ops: The number of linear scans measured for comparison.
+
+    :return: A dict of nanoseconds per operation.
+    """
+    sids = [f"sid{i}" for i in range(sessions)]
+    rooms = [f"{i % 1000:03d}" for i in range(sessions)]
+    index = PresenceIndex()
+    sid_to_rooms_map = dict(zip(sids, rooms))
+
+    def join():
+        for sid, room_id in zip(sids, rooms):
+            index.add(sid, room_id)
+
+    def count():
+        for room_id in rooms:
+            index.count(room_id)
+
+    def scan():
+        # Room without sessions, which scans all the values
+        for _ in range(scan_ops):
+            "XXX" in sid_to_rooms_map.values()
+
+    def leave():
+        for sid in sids:
+            index.remove(sid)
+
+    return {
+        "sessions": sessions,
+        "join_ns": per_op(join, sessions),
+        "count_ns": per_op(count, sessions),
+        "leave_ns": per_op(leave, sessions),
+        "linear_scan_ns": per_op(scan, scan_ops),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sessions", type=int, nargs="+", default=[10000, 100000, 1000000]
+    )
+    args = parser.parse_args()
+    print(json.dumps([measure(n) for n in args.sessions], indent=2))
@@ -0,0 +1,94 @@
+#!/bin/env python
+"""This file benchmarks the cost of sampling the stacks of a busy server.
+
+It times a CPU bound workload shaped like a broadcast, which encodes batches
+of data for many rooms, without profiling and while a `StackSampler` samples
+the stacks at several intervals, as `/admin/profile` does. It reports the
+slowdown of the workload, the number of samples and the share of samples
+attributed to the workload. Usage:
+
+    $ python benchmarks/profiling_overhead.py --seconds 2
+"""
+
+import argparse
+import json
+import time
+
+from common import add_src_path
+
+add_src_path("red_server")
+from profiling import StackSampler
+
+ROOMS = [f"{room:03d}" for room in range(1000)]
+
+
+def broadcast_rooms(batch):
+    """Encodes a batch of data for every room, like a broadcast does.
+
+    :param batch: The list of data.
+
+    :return: The number of encoded bytes.
+    """
+    size = 0
+    for room_id in ROOMS:
+        size += len(json.dumps({"id": room_id, "data": batch}))
+    return size
+
+
+def run_workload(seconds):
+    """Runs broadcasts for a number of seconds.
+
+    :param seconds: The number of seconds.
+
+    :return: The number of broadcasts per second.
+    """
+    batch = [f"data-{index}" for index in range(10)]
+    rounds = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        broadcast_rooms(batch)
+        rounds += 1
+    return rounds / (time.perf_counter() - start)
+
+
+def measure(interval, seconds):
+    """Measures the workload while sampling at an interval.
+
+    :param interval: The seconds between samples, or `None` to not sample.
+    :param seconds: The number of seconds to run the workload.
+
+    :return: A dict with the broadcasts per second and the samples.
+    """
+    if interval is None:
+        return {"interval": None, "rounds_per_second": run_workload(seconds)}
+    sampler = StackSampler(interval)
+    sampler.start()
+    try:
+        rounds_per_second = run_workload(seconds)
+    finally:
+        sampler.stop()
+    in_workload = sum(
+        count for stack, count in sampler.stacks.items()
+        if "broadcast_rooms" in stack
+    )
+    return {
+        "interval": interval,
+        "rounds_per_second": rounds_per_second,
+        "samples": sampler.samples,
+        "workload_share": in_workload / max(sampler.samples, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    results = [
+        measure(interval, args.seconds)
+        for interval in (None, 0.01, 0.005, 0.001)
+    ]
+    baseline = results[0]["rounds_per_second"]
+    for result in results[1:]:
+        result["slowdown"] = 1 - result["rounds_per_second"] / baseline
+    print(json.dumps(results, indent=2))
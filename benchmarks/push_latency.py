@@ -0,0 +1,86 @@
+#!/bin/env python
+"""This file benchmarks end-to-end latency of the polling and push paths.
+
+For each mode, a green apple server and a red apple server are started and a
+producer publishes timestamped messages through the green server, which are
+timed when a consumer receives them from the red server. Usage:
+
+    $ python benchmarks/push_latency.py --messages 500 --rate 50
+"""
+
+import argparse
+import json
+import time
+
+from socketio import Client
+
+from common import start_server, stop_servers, summarize
+
+
+def measure(push_enabled, messages, rate, room_id="901"):
+    """Measures latency of messages sent from a producer to a consumer.
+
+    :param push_enabled: Boolean, whether push mode is used.
+    :param messages: The number of messages to be published.
+    :param rate: The number of messages published per second.
+    :param room_id: The three digit id used by producer and consumer.
+
+    :return: The list of latencies in seconds.
+    """
+    green = start_server("green", port="7100", push_enabled=push_enabled)
+    red = start_server(
+        "red", port="6100", grn_server_port="7100", push_enabled=push_enabled
+    )
+    latencies = []
+    joined = []
+    producer, consumer = Client(), Client()
+
+    def on_broadcast_message(data):
+        received_at = time.time()
+        latencies.extend(
+            received_at - float(sent_at) for sent_at in data["data"]
+        )
+
+    def on_abort_connection(error):
+        joined.clear()
+
+    consumer.on("broadcast_message", on_broadcast_message, namespace="/red")
+    consumer.on("abort_connection", on_abort_connection, namespace="/red")
+    try:
+        producer.connect("http://127.0.0.1:7100", namespaces=["/green"])
+        producer.emit("join", {"id": room_id}, namespace="/green")
+        consumer.connect("http://127.0.0.1:6100", namespaces=["/red"])
+        # Red server rejects the join till it learns about the green client
+        while not joined:
+            joined.append(True)
+            consumer.emit("join", {"id": room_id}, namespace="/red")
+            time.sleep(1)
+        consumer.emit("new_data", namespace="/red")
+        for _ in range(messages):
+            producer.emit(
+                "incoming_data",
+                {"id": room_id, "data": repr(time.time())},
+                namespace="/green"
+            )
+            time.sleep(1.0 / rate)
+        deadline = time.monotonic() + 10
+        while len(latencies) < messages and time.monotonic() < deadline:
+            time.sleep(0.1)
+    finally:
+        producer.disconnect()
+        consumer.disconnect()
+        stop_servers(red, green)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=50.0)
+    args = parser.parse_args()
+
+    results = {}
+    for mode, push_enabled in (("poll", False), ("push", True)):
+        latencies = measure(push_enabled, args.messages, args.rate)
+        results[mode] = summarize(latencies)
+    print(json.dumps(results, indent=2))
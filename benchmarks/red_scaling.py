@@ -0,0 +1,148 @@
+#!/bin/env python
+"""This file benchmarks several red apple servers sharing a Redis bus.
+
+For each number of red apple server processes, a green apple server is started
+together with the red servers, of which the first one listens to the green
+server. Red clients are spread over the red servers and producers publish
+messages, which are counted when the red clients receive them. It reports the
+delivery throughput and checks that every red client received every message of
+its room exactly once. A Redis compatible broker must be running. Usage:
+
+    $ python benchmarks/red_scaling.py --nodes 1 2 4 --consumers 200
+"""
+
+import argparse
+import json
+import time
+from collections import Counter
+
+from socketio import Client
+
+from common import start_server, stop_servers
+
+
+def connect_consumers(nodes, rooms, consumers):
+    """Connects red clients spread over the red servers to the rooms.
+
+    :param nodes: The number of red servers, listening from port 6100 on.
+    :param rooms: The list of three digit room ids.
+    :param consumers: The number of red clients.
+
+    :return: A tuple of the list of clients and the list of `Counter` of the
+             received messages of each client.
+    """
+    clients, received = [], []
+    for index in range(consumers):
+        client, counter = Client(), Counter()
+
+        def on_broadcast_message(data, counter=counter):
+            counter.update(data["data"])
+
+        def on_abort_connection(error, client=client):
+            client.rejected = True
+
+        client.on(
+            "broadcast_message", on_broadcast_message, namespace="/red"
+        )
+        client.on("abort_connection", on_abort_connection, namespace="/red")
+        client.connect(
+            f"http://127.0.0.1:{6100 + index % nodes}", namespaces=["/red"]
+        )
+        client.room_id = rooms[index % len(rooms)]
+        client.rejected = True
+        clients.append(client)
+        received.append(counter)
+    # Red servers reject joins till they learn about the green clients
+    pending = clients
+    while pending:
+        for client in pending:
+            client.rejected = False
+            client.emit("join", {"id": client.room_id}, namespace="/red")
+        time.sleep(1)
+        pending = [client for client in pending if client.rejected]
+    return clients, received
+
+
+def measure(nodes, consumers, producers, messages, bus_url):
+    """Measures delivery of messages through several red servers.
+
+    :param nodes: The number of red server processes.
+    :param consumers: The number of red clients.
+    :param producers: The number of green clients, each with its own room.
+    :param messages: The number of messages published by each producer.
+    :param bus_url: The URL of the Redis compatible broker.
+
+    :return: A dict with the deliveries per second and the number of missing
+             and duplicated deliveries.
+    """
+    green = start_server("green", port="7100")
+    reds = [
+        start_server(
+            "red",
+            port=str(6100 + index),
+            grn_server_port="7100",
+            bus="redis",
+            bus_url=bus_url,
+            bus_channel=f"red_scaling_{nodes}",
+            listen_to_green=index == 0,
+            presence_interval=1.0
+        )
+        for index in range(nodes)
+    ]
+    rooms = [f"{900 + index:03d}" for index in range(producers)]
+    publishers, clients = [], []
+    try:
+        for room_id in rooms:
+            publisher = Client()
+            publisher.connect("http://127.0.0.1:7100", namespaces=["/green"])
+            publisher.emit("join", {"id": room_id}, namespace="/green")
+            publishers.append(publisher)
+        clients, received = connect_consumers(nodes, rooms, consumers)
+        # Let the red servers learn about the rooms watched by each other
+        time.sleep(2)
+        expected = consumers * messages
+        start = time.perf_counter()
+        for number in range(messages):
+            for room_id, publisher in zip(rooms, publishers):
+                publisher.emit(
+                    "incoming_data",
+                    {"id": room_id, "data": f"{room_id}:{number}"},
+                    namespace="/green"
+                )
+        deadline = time.monotonic() + 30
+        while (sum(sum(counter.values()) for counter in received) < expected
+               and time.monotonic() < deadline):
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+    finally:
+        for client in publishers + clients:
+            client.disconnect()
+        stop_servers(*reds, green)
+    delivered = sum(len(counter) for counter in received)
+    duplicated = sum(
+        count - 1 for counter in received for count in counter.values()
+    )
+    return {
+        "nodes": nodes,
+        "deliveries_per_second": delivered / elapsed,
+        "missing": expected - delivered,
+        "duplicated": duplicated,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--consumers", type=int, default=200)
+    parser.add_argument("--producers", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--bus-url", default="redis://127.0.0.1:6379/0")
+    args = parser.parse_args()
+
+    results = [
+        measure(
+            nodes, args.consumers, args.producers, args.messages, args.bus_url
+        )
+        for nodes in args.nodes
+    ]
+    print(json.dumps(results, indent=2))
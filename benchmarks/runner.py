@@ -0,0 +1,196 @@
+#!/bin/env python
+"""This file runs one apple server with options supplied by a benchmark.
+
+The benchmarks start every server in its own process through this file, so
+that the server classes can be instantiated with keyword arguments other than
+the constants in their `settings` modules. Usage:
+
+    $ python runner.py green '{"port": "7100", "push_enabled": true}'
+    $ python runner.py green '{"port": "7100", "workers": 4}'
+    $ python runner.py red '{"port": "6100", "grn_server_port": "7100"}'
+    $ python runner.py red '{"port": "6100", "use_asyncio": true}'
+    $ python runner.py red '{"port": "6100", "bus": "shm"}'
+"""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules shared by the components are kept in the `shared` directory
+sys.path.append(os.path.join(REPO_ROOT, "shared"))
+
+
+def run_green_server(options):
+    """Runs a green apple server built from the given options.
+
+    :param options: The dict of keyword arguments for `GreenAppleServer`.
+                    Settings which aren't given are read from the constants
+                    of the green server. With more than one of `workers`, the
+                    other workers are started as processes of their own. With
+                    `use_asyncio`, the `AsyncGreenAppleServer` is run.
+
+    :return: None
+    """
+    sys.path.insert(0, os.path.join(REPO_ROOT, "green_server", "src"))
+    from settings import GreenServerConstants as consts
+    from settings import server_kwargs
+
+    if options.pop("use_asyncio", consts.use_asyncio):
+        from async_server import AsyncGreenAppleServer as GreenAppleServer
+    else:
+        from server import GreenAppleServer
+
+    kwargs = server_kwargs(options)
+    workers = [
+        subprocess.Popen([
+            sys.executable,
+            os.path.abspath(__file__),
+            "green_worker",
+            json.dumps({
+                "port": kwargs["port"],
+                "worker_index": index,
+                "workers": kwargs["workers"],
+            })
+        ])
+        for index in range(1, kwargs["workers"])
+    ]
+    # Stop like on Ctrl-C, so that the workers are stopped as well
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        GreenAppleServer(**kwargs).run()
+    finally:
+        for worker in workers:
+            worker.terminate()
+
+
+def run_green_worker(options):
+    """Runs a worker of a green apple server built from the given options.
+
+    :param options: The dict of keyword arguments for `GreenWorker`, with the
+                    `port` of the green apple server.
+
+    :return: None
+    """
+    import eventlet
+    eventlet.monkey_patch()
+
+    sys.path.insert(0, os.path.join(REPO_ROOT, "green_server", "src"))
+    from settings import worker_kwargs
+    from worker import GreenWorker
+
+    GreenWorker(**worker_kwargs(options)).run()
+
+
+def run_red_server(options):
+    """Runs a red apple server and its listener built from the given options.
+
+    :param options: The dict of keyword arguments. Keys prefixed with `grn_`
+                    and the listener settings are used for the `Listener`,
+                    keys prefixed with `buffer_` for the shared buffers, keys
+                    prefixed with `bus` for the message bus, keys prefixed
+                    with `ring_` for the ring of red servers, the key
+                    `metrics_enabled` for the shared metrics and rest of
+                    them for the `RedAppleServer`. Without `listen_to_green`,
+                    no listener is started. With the `shm` bus, the listener
+                    is started as a process of its own. With `use_asyncio`,
+                    both run on asyncio instead of eventlet.
+
+    :return: None
+    """
+    sys.path.insert(0, os.path.join(REPO_ROOT, "red_server", "src"))
+    from settings import RedServerConstants as consts
+    from settings import buffer_kwargs, bus_kwargs, listener_kwargs
+    from settings import server_kwargs
+
+    use_asyncio = options.pop("use_asyncio", consts.use_asyncio)
+    if not use_asyncio:
+        import eventlet
+        eventlet.monkey_patch()
+
+    from bus import get_bus
+    from datasource import SharedResource
+    from shm import SHARED_MEMORY
+
+    if use_asyncio:
+        from async_listener import AsyncListener as Listener
+        from async_server import AsyncRedAppleServer as RedAppleServer
+    else:
+        from listener import Listener
+        from server import RedAppleServer
+
+    # Every benchmark starts a new green server, so no offset is kept
+    options.setdefault("offset_path", None)
+    buffers = buffer_kwargs(options)
+    bus_name, bus_options = bus_kwargs(options)
+    listen_to_green = options.pop("listen_to_green", consts.listen_to_green)
+    ring_nodes = options.pop("ring_nodes", consts.ring_nodes)
+    ring_vnodes = options.pop("ring_vnodes", consts.ring_vnodes)
+    metrics_enabled = options.pop("metrics_enabled", consts.metrics_enabled)
+    listener_options = listener_kwargs(options)
+    options.setdefault("node_address", f"127.0.0.1:{options['port']}")
+    server_options = server_kwargs(options)
+    SharedResource.configure_buffers(**buffers)
+    SharedResource.configure_bus(get_bus(bus_name, **bus_options))
+    SharedResource.configure_ring(ring_nodes, ring_vnodes)
+    SharedResource.configure_metrics(metrics_enabled)
+    server = RedAppleServer(**server_options)
+    listener = None
+    if listen_to_green and bus_name == SHARED_MEMORY:
+        listener = subprocess.Popen([
+            sys.executable,
+            os.path.abspath(__file__),
+            "red_listener",
+            json.dumps({"bus": bus_options, "listener": listener_options})
+        ])
+    elif listen_to_green:
+        Listener(**listener_options).run()
+    # Stop like on Ctrl-C, so that the last snapshot is written
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.run()
+    finally:
+        if listener is not None:
+            listener.terminate()
+        SharedResource.bus.close()
+
+
+def run_red_listener(options):
+    """Runs the listener of a red apple server using the `shm` bus.
+
+    :param options: The dict with the keyword arguments of the `Listener` as
+                    ``listener``, and of the shared memory created by the red
+                    apple server as ``bus``.
+
+    :return: None
+    """
+    import eventlet
+    eventlet.monkey_patch()
+
+    sys.path.insert(0, os.path.join(REPO_ROOT, "red_server", "src"))
+    from bus import get_bus
+    from datasource import SharedResource
+    from listener import Listener
+    from shm import SHARED_MEMORY
+
+    SharedResource.configure_bus(
+        get_bus(SHARED_MEMORY, owner=False, **options["bus"])
+    )
+    Listener(**options["listener"]).run()
+    Listener.sio_client.wait()
+
+
+if __name__ == "__main__":
+    component, options = sys.argv[1], json.loads(sys.argv[2])
+    if component == "green":
+        run_green_server(options)
+    elif component == "green_worker":
+        run_green_worker(options)
+    elif component == "red":
+        run_red_server(options)
+    elif component == "red_listener":
+        run_red_listener(options)
+    else:
+        sys.exit(f"ERROR: unknown component '{component}'")
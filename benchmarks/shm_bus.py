@@ -0,0 +1,154 @@
+#!/bin/env python
+"""This file benchmarks the handoff of data from the listener to the server.
+
+A producer decodes batches of data for many rooms, as the listener does with
+the payloads of the green apple server, and publishes them on a bus, whose
+subscriber encodes every item for its room, as a broadcast does. With the
+`memory` bus, both run in one process, as the red apple server does by
+default. With the `shm` bus, the producer runs in a process of its own. It
+reports the items handed over per second and the latency from decoding an
+item till the subscriber receives it. Usage:
+
+    $ python benchmarks/shm_bus.py --batches 2000 --batch-size 50
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+
+from common import add_src_path, summarize
+
+add_src_path("red_server")
+from bus import MemoryBus
+from shm import SharedMemoryBus
+
+SEGMENT = "red_apple_bench"
+
+
+def produce(bus, batches, batch_size, rooms):
+    """Decodes and publishes batches of data, then a message to stop.
+
+    :param bus: The bus to publish on.
+    :param batches: The number of batches.
+    :param batch_size: The number of items of every batch.
+    :param rooms: The number of rooms the items are spread over.
+
+    :return: None
+    """
+    for number in range(batches):
+        raw = json.dumps([
+            [f"{(number + index) % rooms:03d}", {"n": number, "sent": None}]
+            for index in range(batch_size)
+        ])
+        new_data = json.loads(raw)
+        sent = time.monotonic()
+        for (_, item) in new_data:
+            item["sent"] = sent
+        bus.publish({"kind": "data", "data": new_data})
+    bus.publish({"kind": "stop"})
+
+
+class Consumer:
+    """Class for the subscriber of the bus, timing every received item.
+
+    :param self: The reference to class instance.
+    """
+
+    def __init__(self):
+        self.items = 0
+        self.latencies = []
+        self.stopped = threading.Event()
+
+    def on_message(self, message):
+        """Encodes every received item for its room.
+
+        :param self: The reference to class instance.
+        :param message: The dict published on the bus.
+
+        :return: None
+        """
+        if message["kind"] == "stop":
+            self.stopped.set()
+            return
+        if message["kind"] != "data":
+            return
+        received = time.monotonic()
+        for (room_id, item) in message["data"]:
+            json.dumps({"id": room_id, "data": [item]})
+            self.latencies.append(received - item["sent"])
+        self.items += len(message["data"])
+
+
+def start_thread(target, *args):
+    """Starts a daemon thread, like `start_background_task` does.
+
+    :param target: The callable run by the thread.
+    :param args: The positional arguments of the callable.
+
+    :return: The started `threading.Thread`.
+    """
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def measure(args, bus_name):
+    """Measures the handoff of all batches over a bus.
+
+    :param args: The parsed command line arguments.
+    :param bus_name: Either `memory` or `shm`.
+
+    :return: A dict with the results.
+    """
+    consumer = Consumer()
+    start = time.perf_counter()
+    if bus_name == "memory":
+        bus = MemoryBus()
+        bus.subscribe(consumer.on_message)
+        produce(bus, args.batches, args.batch_size, args.rooms)
+    else:
+        bus = SharedMemoryBus(name=SEGMENT, ring_bytes=args.ring_bytes)
+        bus.subscribe(consumer.on_message, start_thread)
+        start = time.perf_counter()
+        producer = subprocess.Popen([
+            sys.executable, __file__, "--producer", json.dumps(vars(args))
+        ])
+        consumer.stopped.wait()
+        producer.wait()
+    seconds = time.perf_counter() - start
+    bus.close()
+    return {
+        "bus": bus_name,
+        "items": consumer.items,
+        "items_per_second": consumer.items / seconds,
+        "latency": summarize(consumer.latencies),
+    }
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--producer"]:
+        options = json.loads(sys.argv[2])
+        producer_bus = SharedMemoryBus(
+            name=SEGMENT, ring_bytes=options["ring_bytes"], owner=False
+        )
+        produce(
+            producer_bus,
+            options["batches"],
+            options["batch_size"],
+            options["rooms"]
+        )
+        producer_bus.close()
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batches", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--ring-bytes", type=int, default=16384)
+    args = parser.parse_args()
+
+    results = [measure(args, bus_name) for bus_name in ("memory", "shm")]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,142 @@
+#!/bin/env python
+"""This file benchmarks latency of red clients sharing a room with laggards.
+
+For each slow-consumer policy, and once with broadcasts emitted to the whole
+room, a green apple server and a red apple server are started. A producer
+publishes timestamped messages which are timed when the fast red clients of the
+room receive them, while one slow red client takes a while to handle every
+broadcast. It reports the latency of the fast red clients and what the slow
+red client received. Usage:
+
+    $ python benchmarks/slow_consumer.py --consumers 20 --slow-delay 0.05
+"""
+
+import argparse
+import json
+import time
+
+from socketio import Client
+
+from common import start_server, stop_servers, summarize
+
+MODES = ("room", "drop_oldest", "conflate", "disconnect")
+
+
+def connect_consumer(room_id, on_broadcast_message):
+    """Connects a red client and joins it to a room.
+
+    :param room_id: The three digit id of the room.
+    :param on_broadcast_message: The handler of the broadcasts.
+
+    :return: The client, with a `state` dict counting the broadcasts with a
+             ``gap`` and telling whether the client was ``aborted``.
+    """
+    client = Client()
+    client.state = {"gaps": 0, "aborted": None, "joined": False}
+
+    def on_message(data):
+        if data.get("gap"):
+            client.state["gaps"] += 1
+        on_broadcast_message(data)
+
+    def on_abort_connection(error):
+        client.state["aborted"] = error
+        client.state["joined"] = False
+
+    client.on("broadcast_message", on_message, namespace="/red")
+    client.on("abort_connection", on_abort_connection, namespace="/red")
+    client.connect("http://127.0.0.1:6100", namespaces=["/red"])
+    # Red server rejects the join till it learns about the green client
+    while not client.state["joined"]:
+        client.state["joined"] = True
+        client.emit("join", {"id": room_id}, namespace="/red")
+        time.sleep(1)
+    client.state["aborted"] = None
+    return client
+
+
+def measure(mode, consumers, messages, rate, slow_delay, high_water,
+            room_id="902"):
+    """Measures latency of fast red clients sharing a room with a slow one.
+
+    :param mode: Either `room`, which emits broadcasts to the whole room, or
+                 the slow-consumer policy of the outbound queues.
+    :param consumers: The number of fast red clients.
+    :param messages: The number of messages to be published.
+    :param rate: The number of messages published per second.
+    :param slow_delay: The seconds the slow red client takes per broadcast.
+    :param high_water: The high-water mark of the outbound queues.
+    :param room_id: The three digit id used by producer and consumers.
+
+    :return: A dict with the latency summary of the fast red clients and the
+             counters of the slow red client.
+    """
+    green = start_server("green", port="7100", log_dir=None)
+    red = start_server(
+        "red", port="6100", grn_server_port="7100",
+        outbound_high_water=None if mode == "room" else high_water,
+        slow_consumer_policy="drop_oldest" if mode == "room" else mode
+    )
+    latencies, slow_received = [], []
+
+    def on_fast_message(data):
+        received_at = time.time()
+        latencies.extend(
+            received_at - float(sent_at) for sent_at in data["data"]
+        )
+
+    def on_slow_message(data):
+        slow_received.extend(data["data"])
+        time.sleep(slow_delay)
+
+    producer = Client()
+    clients = []
+    try:
+        producer.connect("http://127.0.0.1:7100", namespaces=["/green"])
+        producer.emit("join", {"id": room_id}, namespace="/green")
+        slow = connect_consumer(room_id, on_slow_message)
+        clients.append(slow)
+        for _ in range(consumers):
+            clients.append(connect_consumer(room_id, on_fast_message))
+        for _ in range(messages):
+            producer.emit(
+                "incoming_data",
+                {"id": room_id, "data": repr(time.time())},
+                namespace="/green"
+            )
+            time.sleep(1.0 / rate)
+        deadline = time.monotonic() + 10
+        while (len(latencies) < consumers * messages
+               and time.monotonic() < deadline):
+            time.sleep(0.1)
+    finally:
+        for client in [producer] + clients:
+            client.disconnect()
+        stop_servers(red, green)
+    return {
+        "mode": mode,
+        "fast": summarize(latencies),
+        "slow_received": len(slow_received),
+        "slow_gaps": slow.state["gaps"],
+        "slow_aborted": slow.state["aborted"] is not None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=list(MODES))
+    parser.add_argument("--consumers", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=200.0)
+    parser.add_argument("--slow-delay", type=float, default=0.05)
+    parser.add_argument("--high-water", type=int, default=50)
+    args = parser.parse_args()
+
+    results = [
+        measure(
+            mode, args.consumers, args.messages, args.rate, args.slow_delay,
+            args.high_water
+        )
+        for mode in args.modes
+    ]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,66 @@
+#!/bin/env python
+"""This file soaks the bounded room buffers under a steady publish load.
+
+A producer publishes into a set of rooms of which none is ever drained, the
+case which used to grow memory without limit. The memory held by the buffers
+is sampled with `tracemalloc` and must stay flat once the capacities are
+reached. The exit status is non-zero if it keeps growing. Usage:
+
+    $ python benchmarks/soak_buffers.py --messages 1000000 --rooms 1000
+"""
+
+import argparse
+import json
+import sys
+import tracemalloc
+
+from common import add_src_path
+
+add_src_path("red_server")
+from buffers import RoomBuffers
+
+
+def soak(messages, rooms, room_capacity, total_capacity, samples=10):
+    """Publishes messages without draining and samples the held memory.
+
+    :param messages: The number of messages to be published.
+    :param rooms: The number of rooms the messages are spread over.
+    :param room_capacity: The capacity of each room buffer.
+    :param total_capacity: The capacity of all room buffers.
+    :param samples: The number of memory samples taken.
+
+    :return: A dict with memory samples in bytes and eviction counters.
+    """
+    buffers = RoomBuffers(
+        room_capacity=room_capacity, total_capacity=total_capacity
+    )
+    room_ids = [f"{i % 1000:03d}" for i in range(rooms)]
+    payload = "x" * 64
+    memory = []
+    tracemalloc.start()
+    for i in range(messages):
+        buffers.append(room_ids[i % rooms], payload + str(i))
+        if (i + 1) % (messages // samples) == 0:
+            memory.append(tracemalloc.get_traced_memory()[0])
+    tracemalloc.stop()
+    stats = buffers.stats()
+    return {"memory": memory, "pending": stats["pending"],
+            "evicted": stats["evicted"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--room-capacity", type=int, default=1000)
+    parser.add_argument("--total-capacity", type=int, default=100000)
+    args = parser.parse_args()
+
+    result = soak(
+        args.messages, args.rooms, args.room_capacity, args.total_capacity
+    )
+    # Second half of the run happens after the capacities are reached
+    steady = result["memory"][len(result["memory"]) // 2:]
+    result["flat"] = max(steady) <= min(steady) * 1.05
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["flat"] else 1)
@@ -0,0 +1,114 @@
+#!/bin/env python
+"""This file breaks down the end-to-end latency of messages by stage.
+
+A green apple server and a red apple server are started with tracing. A
+producer publishes messages like a green client sampling every n-th one for
+tracing, and a consumer receives them like a red client, which stamps and
+keeps the traces. It reports the latency between consecutive stages, from the
+green client emit till the red client receive, together with the traces kept
+by the servers on their `/traces` routes. Usage:
+
+    $ python benchmarks/trace_latency.py --messages 1000 --every 10
+"""
+
+import argparse
+import json
+import time
+import urllib.request
+
+from socketio import Client
+
+from common import add_src_path, start_server, stop_servers
+
+add_src_path("green_client")
+from tracing import (GREEN_CLIENT, RED_CLIENT, Sampler, TraceRing, is_traced,
+                     stamp)
+
+
+def fetch_traces(port):
+    """Returns the dump of the traces kept by a server.
+
+    :param port: The port of the server.
+
+    :return: The dict served on the `/traces` route.
+    """
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/traces") as reply:
+        return json.loads(reply.read())
+
+
+def measure(push_enabled, messages, rate, every, room_id="903"):
+    """Measures the latency of every stage of traced messages.
+
+    :param push_enabled: Boolean, whether push mode is used.
+    :param messages: The number of messages to be published.
+    :param rate: The number of messages published per second.
+    :param every: The number of messages per traced message.
+    :param room_id: The three digit id used by producer and consumer.
+
+    :return: A dict with the stage latencies seen by the consumer and the
+             traces kept by both servers.
+    """
+    green = start_server(
+        "green", port="7100", log_dir=None, push_enabled=push_enabled,
+        tracing=True
+    )
+    red = start_server(
+        "red", port="6100", grn_server_port="7100", push_enabled=push_enabled,
+        tracing=True
+    )
+    traces, sampler, joined = TraceRing(), Sampler(room_id, every), []
+    producer, consumer = Client(), Client()
+
+    def on_broadcast_message(data):
+        for item in data["data"]:
+            if is_traced(item):
+                traces.record(stamp(item, RED_CLIENT))
+
+    def on_abort_connection(error):
+        joined.clear()
+
+    consumer.on("broadcast_message", on_broadcast_message, namespace="/red")
+    consumer.on("abort_connection", on_abort_connection, namespace="/red")
+    try:
+        producer.connect("http://127.0.0.1:7100", namespaces=["/green"])
+        producer.emit("join", {"id": room_id}, namespace="/green")
+        consumer.connect("http://127.0.0.1:6100", namespaces=["/red"])
+        # Red server rejects the join till it learns about the green client
+        while not joined:
+            joined.append(True)
+            consumer.emit("join", {"id": room_id}, namespace="/red")
+            time.sleep(1)
+        for number in range(messages):
+            data = sampler.sample(str(number))
+            if is_traced(data):
+                stamp(data, GREEN_CLIENT)
+            producer.emit(
+                "incoming_data", {"id": room_id, "data": data},
+                namespace="/green"
+            )
+            time.sleep(1.0 / rate)
+        deadline = time.monotonic() + 10
+        while (traces.recorded < messages // every
+               and time.monotonic() < deadline):
+            time.sleep(0.1)
+        servers = {"green": fetch_traces(7100), "red": fetch_traces(6100)}
+    finally:
+        producer.disconnect()
+        consumer.disconnect()
+        stop_servers(red, green)
+    return {"red_client": traces.dump(), **servers}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=100.0)
+    parser.add_argument("--every", type=int, default=10)
+    args = parser.parse_args()
+
+    results = {}
+    for mode, push_enabled in (("poll", False), ("push", True)):
+        results[mode] = measure(
+            push_enabled, args.messages, args.rate, args.every
+        )
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,197 @@
+#!/bin/env python
+"""This file benchmarks warm restarts of the red apple server by snapshots.
+
+A green apple server and a red apple server are started, producers join and
+publish a backlog of messages for rooms without any red client yet, which the
+red apple server keeps pending. The red apple server is then stopped and
+started again, and a red client joins as soon as the server accepts
+connections. It reports the time from starting the server till it accepts
+connections and till it admits the first join, i.e. till it is ready, and how
+many of the backlog messages the red client still receives, with snapshots
+disabled and enabled. A producer then publishes timestamped messages to the
+joined room for `--probe-seconds`, while the rest of the backlog is kept in
+the snapshots, and it reports their broadcast latency, whose maximum is the
+longest stall of broadcasts, such as by writing a snapshot. Usage:
+
+    $ python benchmarks/warm_restart.py --producers 10 --backlog 100
+    $ python benchmarks/warm_restart.py --backlog 20000 --probe-seconds 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from socketio import AsyncClient
+
+from common import start_server, stop_servers, summarize
+
+
+async def join_when_ready(room_id, received):
+    """Connects a red client and joins a room till the join is admitted.
+
+    :param room_id: The three digit room id.
+    :param received: The list receiving the broadcasted data.
+
+    :return: The connected `AsyncClient` and the number of join attempts.
+    """
+    client = AsyncClient(reconnection=False)
+    client.rejected = False
+
+    async def on_broadcast_message(data):
+        for item in data["data"]:
+            if isinstance(item, dict):
+                item["latency"] = time.time() - item["sent"]
+        received.extend(data["data"])
+
+    async def on_abort_connection(error):
+        client.rejected = True
+
+    client.on("broadcast_message", on_broadcast_message, namespace="/red")
+    client.on("abort_connection", on_abort_connection, namespace="/red")
+    await client.connect("http://127.0.0.1:6300", namespaces=["/red"])
+    attempts = 0
+    while True:
+        attempts += 1
+        client.rejected = False
+        response = asyncio.get_running_loop().create_future()
+        await client.emit(
+            "join",
+            {"id": room_id},
+            namespace="/red",
+            callback=lambda reply=None: response.set_result(reply)
+        )
+        reply = await response
+        if not client.rejected and reply is None:
+            return client, attempts
+        await asyncio.sleep(0.01)
+
+
+async def probe(publisher, room_id, received, seconds):
+    """Publishes timestamped messages to a room and times their broadcasts.
+
+    :param publisher: The connected `AsyncClient` of the green client.
+    :param room_id: The three digit room id, joined by a red client.
+    :param received: The list receiving the broadcasted data.
+    :param seconds: The number of seconds to publish for.
+
+    :return: The list of broadcast latencies in seconds.
+    """
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        await publisher.emit(
+            "incoming_data",
+            {"id": room_id, "data": {"sent": time.time()}},
+            namespace="/green"
+        )
+        await asyncio.sleep(0.01)
+    # Let the last messages arrive
+    await asyncio.sleep(0.5)
+    return [item["latency"] for item in received if isinstance(item, dict)]
+
+
+async def drive(args, red_options, servers):
+    """Publishes a backlog, restarts the red apple server and joins it.
+
+    :param args: The parsed command line arguments.
+    :param red_options: The options of the red apple server.
+    :param servers: The dict of the running server processes, whose ``red``
+                    server is replaced by the restarted one.
+
+    :return: A dict with the restart results.
+    """
+    loop = asyncio.get_running_loop()
+    rooms = [f"{300 + index:03d}" for index in range(args.producers)]
+    publishers = []
+    for room_id in rooms:
+        publisher = AsyncClient(reconnection=False)
+        await publisher.connect(
+            "http://127.0.0.1:7300", namespaces=["/green"]
+        )
+        await publisher.emit("join", {"id": room_id}, namespace="/green")
+        publishers.append(publisher)
+    for number in range(args.backlog):
+        for room_id, publisher in zip(rooms, publishers):
+            await publisher.emit(
+                "incoming_data",
+                {"id": room_id, "data": f"{room_id}:{number}"},
+                namespace="/green"
+            )
+    # Let the red server take the backlog from the green server
+    await asyncio.sleep(args.settle)
+    await loop.run_in_executor(None, stop_servers, servers.pop("red"))
+    start = time.perf_counter()
+    servers["red"] = await loop.run_in_executor(
+        None, lambda: start_server("red", **red_options)
+    )
+    port_seconds = time.perf_counter() - start
+    received = []
+    client, attempts = await join_when_ready(rooms[0], received)
+    ready_seconds = time.perf_counter() - start
+    await client.emit("new_data", namespace="/red")
+    deadline = time.monotonic() + args.settle
+    while len(received) < args.backlog and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    backlog_received = len(received)
+    latencies = await probe(
+        publishers[0], rooms[0], received, args.probe_seconds
+    )
+    await asyncio.gather(*(
+        publisher.disconnect() for publisher in publishers + [client]
+    ))
+    return {
+        "port_seconds": port_seconds,
+        "ready_seconds": ready_seconds,
+        "join_attempts": attempts,
+        "backlog": args.backlog,
+        "backlog_received": backlog_received,
+        "broadcast_latency": summarize(latencies),
+        "stall_ms": max(latencies, default=0.0) * 1000,
+    }
+
+
+def measure(args, snapshots):
+    """Measures a restart of the red apple server.
+
+    :param args: The parsed command line arguments.
+    :param snapshots: Boolean, whether the red apple server writes and
+                      restores snapshots.
+
+    :return: A dict with the results.
+    """
+    directory = tempfile.mkdtemp(prefix="warm_restart_")
+    snapshot_path = os.path.join(directory, "red.snapshot")
+    # Without interest filtering, the red server takes the backlog at once
+    red_options = {
+        "port": "6300", "grn_server_port": "7300", "interest_filtering": False
+    }
+    if snapshots:
+        red_options["snapshot_path"] = snapshot_path
+        red_options["snapshot_interval"] = args.snapshot_interval
+    servers = {"green": start_server("green", port="7300", log_dir=None)}
+    try:
+        servers["red"] = start_server("red", **red_options)
+        result = asyncio.run(drive(args, red_options, servers))
+    finally:
+        stop_servers(*servers.values())
+        snapshot_bytes = None
+        if os.path.exists(snapshot_path):
+            snapshot_bytes = os.path.getsize(snapshot_path)
+        shutil.rmtree(directory, ignore_errors=True)
+    return {"snapshots": snapshots, **result, "snapshot_bytes": snapshot_bytes}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--producers", type=int, default=10)
+    parser.add_argument("--backlog", type=int, default=100)
+    parser.add_argument("--settle", type=float, default=2.0)
+    parser.add_argument("--snapshot-interval", type=float, default=1.0)
+    parser.add_argument("--probe-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    results = [measure(args, snapshots) for snapshots in (False, True)]
+    print(json.dumps(results, indent=2))
@@ -1,15 +1,67 @@
 #!/bin/env python
 """This file has the code to connect a green client to the green apple server.
 
+With the `--publish` option and a three digit id, the client streams the data
+of a NDJSON file, or the lines of stdin without a file, instead of reading the
+console, see `publisher.py`. For example:
+
+    $ python green_client/src --publish 123 data.ndjson
+    $ tail -f app.log | python green_client/src --publish 123
+
 Author: sagarbhat94@gmail.com (Sagar Bhat)
 """
 
-from listener import GreenClient
+import os
+import sys
+
+# The modules shared by the components are kept in the `shared` directory
+sys.path.append(os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "shared"
+)))
+
 from settings import GreenClientConstants as consts
 
+if sys.argv[1:2] == ["--publish"]:
+    # Publishing blocks on the window of unacknowledged batches, so the
+    # client always runs on threads
+    from listener import GreenClient
+    from publisher import BulkPublisher, read_lines, read_ndjson
+
+    client = GreenClient(
+        host=consts.green_server_host,
+        port=consts.green_server_port,
+        client_namespace=consts.green_client_nmsp,
+        server_namespace=consts.green_server_nmsp,
+        batch_size=consts.batch_size,
+        batch_delay=consts.batch_delay,
+        trace_every=consts.trace_every,
+        num_id=sys.argv[2],
+        interactive=False,
+        reconnection=True,
+        max_in_flight=consts.max_in_flight
+    )
+    if len(sys.argv) > 3:
+        source = read_ndjson(open(sys.argv[3]))
+    else:
+        source = read_lines(sys.stdin)
+    client.run()
+    stats = BulkPublisher(
+        client, report_interval=consts.report_interval
+    ).publish(source)
+    client.disconnect_from_server()
+    sys.exit(1 if stats["unacked"] else 0)
+
+if consts.use_asyncio:
+    from async_listener import AsyncGreenClient as GreenClient
+else:
+    from listener import GreenClient
+
 GreenClient(
     host=consts.green_server_host,
     port=consts.green_server_port,
     client_namespace=consts.green_client_nmsp,
-    server_namespace=consts.green_server_nmsp
+    server_namespace=consts.green_server_nmsp,
+    batch_size=consts.batch_size,
+    batch_delay=consts.batch_delay,
+    trace_every=consts.trace_every
 ).run()
@@ -0,0 +1,111 @@
+#!/bin/env python
+"""This file has the asyncio variant of the green client.
+
+It runs the event handlers of `GreenClient` on `socketio.AsyncClient`, see
+`aio.py`. Batches are flushed by timers of the event loop, and the console is
+read in an executor, so that the event loop keeps emitting while waiting for
+the next input.
+"""
+
+import asyncio
+
+from aio import AsyncClientTransport, delayed, no_sleep, run_until_done
+from batching import MicroBatcher
+from listener import GreenClient
+
+
+class AsyncGreenClient(GreenClient):
+    """Class for publishing data to green apple server on asyncio.
+
+    It takes the same arguments as `GreenClient`, except `max_in_flight`,
+    since the window of unacknowledged batches blocks the publishing thread.
+    """
+
+    def __init__(self, host=None, port=None, *args, **kwargs):
+        super(AsyncGreenClient, self).__init__(host, port, *args, **kwargs)
+        if self.window is not None:
+            raise ValueError(
+                "The asyncio green client can't use `max_in_flight`"
+            )
+        self.sio_client = AsyncClientTransport(
+            reconnection=self.sio_client.reconnection
+        )
+        self.batcher = MicroBatcher(
+            self.send_batch,
+            delayed(self.batcher.max_delay),
+            no_sleep,
+            max_size=self.batcher.max_size,
+            max_delay=self.batcher.max_delay
+        )
+
+    def connect_to_server(self):
+        """Starts a task connecting to the green apple server.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.sio_client.start_background_task(
+            self.sio_client.connect_and_wait,
+            self.connect_url,
+            [self.server_namespace],
+            "green server"
+        )
+
+    async def reconnect_to_server(self):
+        """Disconnects and connects again to the current `connect_url`.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        await self.sio_client.client.disconnect()
+        await self.sio_client.connect_and_wait(
+            self.connect_url, [self.server_namespace], "green server"
+        )
+
+    async def join_later(self, seconds):
+        """Joins the green apple server again after a delay.
+
+        :param self: The reference to class instance.
+        :param seconds: The number of seconds to wait for.
+
+        :return: None
+        """
+        await asyncio.sleep(seconds)
+        if self.sio_client.connected:
+            self.join()
+
+    def send_data(self):
+        """Starts a task sending the data read from the console.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.sio_client.start_background_task(self.read_console)
+
+    async def read_console(self):
+        """Sends new data read from the console till `<q>` is put.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            inp = await loop.run_in_executor(None, input, f"{self.colID}> ")
+            if inp.strip() == "<q>" or not self.publish(inp):
+                break
+        self.batcher.flush()
+        self.disconnect_from_server()
+
+    def run(self):
+        """Runs the client till it is disconnected from green apple server.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        super(AsyncGreenClient, self).run()
+        run_until_done()
@@ -9,12 +9,26 @@ Author: sagarbhat94@gmail.com (Sagar Bhat)
 """
 
 import sys
+import time
+import uuid
 
 from socketio import Client, ClientNamespace
 from socketio import exceptions as sio_exceptions
 
+from batching import MicroBatcher
+from publisher import InFlightWindow
+from tracing import GREEN_CLIENT, Sampler, is_traced, stamped_copy
+
 class GreenClient(ClientNamespace):
     """Class for publishing data to green apple server.
+
+    The client asks for its three digit id and reads the data to be published
+    from the console, unless it is given the keyword `num_id` and `interactive`
+    is `False`. Then it only joins the server, and data is published by
+    calling `publish`, as done by the load test in `benchmarks`. With
+    `max_in_flight`, data is numbered by sequence numbers, at most that many
+    batches are unacknowledged at once and they are emitted again after
+    joining again, see `publisher.py`.
     """
 
     def __init__(self, host=None, port=None, *args, **kwargs):
@@ -23,10 +37,29 @@ class GreenClient(ClientNamespace):
         self.connect_url = f"http://{self.host}:{self.port}"
         self.client_namespace = kwargs.pop("client_namespace", "/")
         self.server_namespace = kwargs.pop("server_namespace", "/")
+        batch_size = kwargs.pop("batch_size", 1)
+        batch_delay = kwargs.pop("batch_delay", 0)
+        trace_every = kwargs.pop("trace_every", 0)
+        num_id = kwargs.pop("num_id", None)
+        self.interactive = kwargs.pop("interactive", True)
+        reconnection = kwargs.pop("reconnection", False)
+        max_in_flight = kwargs.pop("max_in_flight", 0)
+        self.window = InFlightWindow(max_in_flight) if max_in_flight else None
+        self.epoch = uuid.uuid4().hex   # Sequence numbers restart per epoch
+        self.joined = False
+        self.throttles = 0              # Number of `retry_after` events
         self.color = "GRN"
-        self.numID = input("Hello GRN, enter three digit ID: ")
+        self.numID = num_id or input("Hello GRN, enter three digit ID: ")
         self.colID = self.color + self.numID
-        self.sio_client = Client(reconnection=False)
+        self.sampler = Sampler(self.numID, trace_every)
+        self.sio_client = Client(reconnection=reconnection)
+        self.batcher = MicroBatcher(
+            self.send_batch,
+            self.sio_client.start_background_task,
+            self.sio_client.sleep,
+            max_size=batch_size,
+            max_delay=batch_delay
+        )
         super(GreenClient, self).__init__(namespace=self.client_namespace)
 
     def connect_to_server(self):
@@ -68,6 +101,81 @@ class GreenClient(ClientNamespace):
         except:
             pass
 
+    def send_batch(self, batch):
+        """Sends a batch of data to be received by green apple server.
+
+        With a `window`, the batch is added to it, which blocks while the
+        window is full.
+
+        :param self: The reference to class instance.
+        :param batch: The list of data to be sent in one message.
+
+        :return: None
+        """
+        if self.window is None and not self.sio_client.connected:
+            return
+        if self.window is None:
+            self.emit_batch(None, batch)
+        else:
+            self.window.add(batch, self.emit_batch)
+
+    def emit_batch(self, seq, batch):
+        """Emits a batch, numbered by the sequence number of its first data.
+
+        A batch of a single data is sent as a plain `incoming_data` message.
+        Sampled data is sent as a copy stamped with the time it is emitted,
+        so that a batch emitted again from the `window` is timed from then.
+
+        :param self: The reference to class instance.
+        :param seq: The sequence number of the first data, or `None`.
+        :param batch: The list of data to be sent in one message.
+
+        :return: None
+        """
+        batch = [
+            stamped_copy(data, GREEN_CLIENT) if is_traced(data) else data
+            for data in batch
+        ]
+        event = "incoming_batch"
+        data = {
+            "id": self.numID,
+            "data": batch
+        }
+        if len(batch) == 1:
+            event = "incoming_data"
+            data["data"] = batch[0]
+        if seq is not None:
+            data["seq"] = seq
+        self.sio_client.emit(event, data, namespace=self.server_namespace)
+
+    def on_publish_ack(self, data):
+        """Forgets the batches acknowledged by the green apple server.
+
+        :param self: The reference to class instance.
+        :param data: The dict with the ``seq`` up to which the server received
+                     all data. For example:
+                        {"seq": 1041}
+
+        :return: None
+        """
+        if self.window is not None:
+            self.window.ack(data["seq"])
+
+    def publish(self, data):
+        """Publishes one data, which is batched and sampled for tracing.
+
+        :param self: The reference to class instance.
+        :param data: The data to be published.
+
+        :return: Boolean, `False` if the client isn't connected anymore. With
+                 a `window`, data is kept till the client joins again, so it
+                 is always `True`.
+        """
+        if self.window is None and not self.sio_client.connected:
+            return False
+        self.batcher.add(self.sampler.sample(data))
+        return True
+
     def send_data(self):
         """Sends new data to be received by green apple server.
 
@@ -75,6 +183,9 @@ class GreenClient(ClientNamespace):
         till connection is alive. If input data is put as `<q>`, it breaks the
         loop and disconnects the client from server. Otherwise, emits the data
         to be further forwarded till it reaches the appropriate red clients.
+        With batching enabled, data is emitted in batches by the `batcher`.
+        With `trace_every`, every n-th data is wrapped in a trace envelope,
+        see `tracing.py`.
 
         :param self: The reference to class instance.
 
@@ -83,27 +194,19 @@ class GreenClient(ClientNamespace):
         while True:
             inp = input(f"{self.colID}> ")
             if inp.strip() == "<q>":
+                self.batcher.flush()
                 self.disconnect_from_server()
                 sys.exit(0)
-            data = {
-                "id": self.numID,
-                "data": inp
-            }
-            if self.sio_client.connected:
-                self.sio_client.emit(
-                    "incoming_data", data, namespace=self.server_namespace
-                )
+            if self.publish(inp):
                 continue
-            self.disconnect_server()
+            self.disconnect_from_server()
             break
 
     def on_connect(self):
         """Prints connection acknowledgement and starts publishing new data.
 
         This method gets invoked right before establishing a connection with
-        green apple server. It prints acknowledment and calls the `on_join`
-        method of green apple server, which as a callback calls the method
-        `send_data` of the client.
+        green apple server. It prints acknowledment and joins the server.
 
         :param self: The reference to class instance. This will be used to call
                      the instance methods and to access the instance variables.
@@ -111,23 +214,169 @@ class GreenClient(ClientNamespace):
         :return: None
         """
         print("<Connected to Green Apple Server >")
+        self.join()
+
+    def join(self):
+        """Joins the green apple server under the id of the client.
+
+        It calls the `on_join` method of green apple server, which as a
+        callback calls the method `on_join_response` of the client. With a
+        `window`, the epoch and the first unacknowledged sequence number are
+        sent along, so that the server drops the data it received before.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
         join_data = {
             "id": self.numID
         }
+        if self.window is not None:
+            join_data["epoch"] = self.epoch
+            join_data["seq"] = self.window.first_unacked()
         self.sio_client.emit(
             "join",
             join_data,
-            callback=self.send_data,
+            callback=self.on_join_response,
             namespace=self.server_namespace
         )
 
+    def on_join_response(self, redirect=None):
+        """Starts publishing new data, or moves to the worker owning the id.
+
+        A non-interactive client only marks itself as `joined`. The `window`
+        is opened, which emits the batches unacknowledged before joining.
+
+        A green apple server running several workers tells the port of the
+        worker owning the id of the client, if it isn't the joined one. A
+        server admitting no more joins for now tells when to join again.
+
+        :param self: The reference to class instance. This will be used to call
+                     the instance methods and to access the instance variables.
+        :param redirect: The optional dict with the ``port`` of the worker to
+                         join instead, or the seconds after which to join
+                         again. For example:
+                            {"worker": 2, "port": "7002"}
+                            {"retry_after": 0.25}
+
+        :return: None
+        """
+        if redirect is not None and "retry_after" in redirect:
+            print(f"< Joining again in {redirect['retry_after']:.2f}s >")
+            self.sio_client.start_background_task(
+                self.join_later, redirect["retry_after"]
+            )
+            return
+        if redirect is None:
+            self.joined = True
+            if self.window is not None:
+                self.window.open(self.emit_batch)
+            if self.interactive:
+                self.send_data()
+            return
+        print(f"< Moving to worker {redirect['worker']} >")
+        self.port = redirect["port"]
+        self.connect_url = f"http://{self.host}:{self.port}"
+        self.sio_client.start_background_task(self.reconnect_to_server)
+
+    def join_later(self, seconds):
+        """Joins the green apple server again after a delay.
+
+        :param self: The reference to class instance.
+        :param seconds: The number of seconds to wait for.
+
+        :return: None
+        """
+        self.sio_client.sleep(seconds)
+        if self.sio_client.connected:
+            self.join()
+
+    def on_retry_after(self, data):
+        """Pauses publishing while the green apple server drops the data.
+
+        The green apple server drops the data of a client exceeding its
+        publish rate. With a `window`, the dropped data is emitted again once
+        the client may publish again, otherwise it is lost. Given the publish
+        ``rate`` of the server, it is emitted again no faster than that rate.
+
+        :param self: The reference to class instance.
+        :param data: The dict with the number of ``seconds`` after which to
+                     publish again, and the optional ``rate`` of messages per
+                     second the server admits. For example:
+                        {"seconds": 0.25, "rate": 100.0}
+
+        :return: None
+        """
+        if self.window is None:
+            print(f"WARNING: Publishing too fast, data is dropped for "
+                  f"{data['seconds']:.2f}s")
+            return
+        self.window.close()
+        self.throttles += 1
+        self.sio_client.start_background_task(
+            self.resume_later,
+            data["seconds"],
+            data.get("rate"),
+            self.throttles
+        )
+
+    def resume_later(self, seconds, rate=None, throttle=None):
+        """Opens the `window` again after a delay, if the client is joined.
+
+        With a `rate`, the unacknowledged batches are emitted again one by
+        one, each once the server got the tokens to admit all of its data, as
+        its token bucket holds a single token when the delay is over. They
+        are no longer emitted once the server throttles the client again.
+
+        :param self: The reference to class instance.
+        :param seconds: The number of seconds to wait for.
+        :param rate: The optional number of messages admitted per second.
+        :param throttle: The number of the `retry_after` event it resumes
+                         from, see `throttles`.
+
+        :return: None
+        """
+        self.sio_client.sleep(seconds)
+        if not self.joined or throttle != self.throttles:
+            return
+        self.window.open(self.emit_batch, paced=rate is not None)
+        tokens = 1.0
+        last = time.monotonic()
+        while rate is not None and throttle == self.throttles:
+            size = self.window.next_size()
+            if not size:
+                return
+            now = time.monotonic()
+            tokens = min(size, tokens + (now - last) * rate)
+            last = now
+            if tokens < size:
+                self.sio_client.sleep((size - tokens) / rate)
+                tokens = size
+                last = time.monotonic()
+            tokens -= self.window.emit_next(self.emit_batch)
+
+    def reconnect_to_server(self):
+        """Disconnects and connects again to the current `connect_url`.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.disconnect_from_server()
+        self.connect_to_server()
+
     def on_disconnect(self):
         """Prints disconnect acknowledgement.
 
+        The `window` is closed till the client joins again.
+
         :param self: The reference to class instance.
 
         :return: None
         """
+        self.joined = False
+        if self.window is not None:
+            self.window.close()
         print("< Disconnected from Green Apple Server >")
 
     def on_duplicate_connection(self):
@@ -155,6 +404,7 @@ class GreenClient(ClientNamespace):
 
         :return: None
         """
-        print("======== GREEN CLIENT CONSOLE [use <q> to Exit] ==========")
+        if self.interactive:
+            print("======== GREEN CLIENT CONSOLE [use <q> to Exit] ==========")
         self.sio_client.register_namespace(self)
         self.connect_to_server()
@@ -0,0 +1,275 @@
+#!/bin/env python
+"""This file has the streaming publisher of green clients.
+
+A `BulkPublisher` publishes data read from stdin, a NDJSON file or any Python
+iterator through a non-interactive `GreenClient`, instead of one message per
+line typed on the console. The client keeps an `InFlightWindow` of batches
+emitted but not acknowledged yet by the green apple server, so that emits are
+pipelined while a slow server still throttles the publisher. Data is numbered
+by a sequence number per client, which the green apple server acknowledges
+cumulatively every few messages. Batches which are unacknowledged when the
+connection drops are emitted again once the client joined again, so that
+publishing goes on across transient disconnects, while the server drops the
+data it already received. After the server throttled the client, the batches
+are emitted again one by one at the publish rate of the server, instead of the
+whole window at once, which the server would mostly drop again.
+"""
+
+import json
+import time
+from threading import Condition
+
+
+def read_lines(stream):
+    """Yields the non-empty lines of a text stream, such as `sys.stdin`.
+
+    :param stream: The text stream.
+
+    :return: The generator of lines without their line break.
+    """
+    for line in stream:
+        line = line.rstrip("\n")
+        if line.strip():
+            yield line
+
+
+def read_ndjson(stream):
+    """Yields the values of a newline delimited JSON stream.
+
+    :param stream: The text stream with one JSON value per line.
+
+    :return: The generator of decoded values.
+    """
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+class InFlightWindow:
+    """Class bounding the number of emitted but unacknowledged batches.
+
+    Every data of a batch gets the next sequence number, and a batch is
+    identified by the number of its first data. While the window is closed,
+    i.e. the client isn't joined, batches are only kept, and they are all
+    emitted in order once the window is opened again. A window opened again
+    as `paced` only emits them one by one, by `emit_next`.
+
+    :param self: The reference to class instance.
+    :param size: The number of unacknowledged batches which blocks `add`.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.pending = {}               # Unacknowledged batches by seq
+        self.next_seq = 0               # Number of the next data
+        self.is_open = False            # Whether batches are emitted
+        self.acked = 0                  # Number of acknowledged messages
+        self.emitted = 0                # Number of emitted messages
+        self.unsent = None              # Seq of the next batch to emit again
+        self.condition = Condition()
+
+    def add(self, batch, emit):
+        """Adds a batch, and emits it right away while the window is open.
+
+        It blocks while `size` batches are unacknowledged. While batches are
+        still to be emitted again by `emit_next`, it is emitted after them.
+
+        :param self: The reference to class instance.
+        :param batch: The list of data.
+        :param emit: The callable emitting a batch, given the sequence number
+                     of its first data and the batch.
+
+        :return: None
+        """
+        with self.condition:
+            while len(self.pending) >= self.size:
+                self.condition.wait()
+            seq = self.next_seq
+            self.next_seq += len(batch)
+            self.pending[seq] = batch
+            if self.is_open and self.unsent is None:
+                emit(seq, batch)
+                self.emitted += len(batch)
+
+    def ack(self, seq):
+        """Forgets the batches acknowledged up to a sequence number.
+
+        Acknowledgements are cumulative, and a batch is only forgotten once
+        its last data is acknowledged, which unblocks `add`.
+
+        :param self: The reference to class instance.
+        :param seq: The number up to which all data was received.
+
+        :return: None
+        """
+        with self.condition:
+            acked = 0
+            for first, batch in list(self.pending.items()):
+                if first + len(batch) - 1 > seq:
+                    break
+                del self.pending[first]
+                acked += len(batch)
+            if acked:
+                self.acked += acked
+                if self.unsent is not None:
+                    first = next(iter(self.pending), None)
+                    if first is None:
+                        self.unsent = None
+                    else:
+                        self.unsent = max(self.unsent, first)
+                self.condition.notify_all()
+
+    def first_unacked(self):
+        """Returns the sequence number of the first unacknowledged data.
+
+        :param self: The reference to class instance.
+
+        :return: The sequence number.
+        """
+        with self.condition:
+            return next(iter(self.pending), self.next_seq)
+
+    def open(self, emit, paced=False):
+        """Opens the window and emits the unacknowledged batches again.
+
+        :param self: The reference to class instance.
+        :param emit: The callable emitting a batch, see `add`.
+        :param paced: Whether the batches are left to `emit_next` instead.
+
+        :return: None
+        """
+        with self.condition:
+            self.is_open = True
+            self.unsent = None
+            if paced and self.pending:
+                self.unsent = next(iter(self.pending))
+                return
+            for seq, batch in list(self.pending.items()):
+                emit(seq, batch)
+                self.emitted += len(batch)
+
+    def next_size(self):
+        """Returns the number of data of the next batch to emit again.
+
+        :param self: The reference to class instance.
+
+        :return: The number of data, `0` when no batch is left or the window
+                 is closed.
+        """
+        with self.condition:
+            if not self.is_open or self.unsent is None:
+                return 0
+            return len(self.pending[self.unsent])
+
+    def emit_next(self, emit):
+        """Emits the next batch left by a `paced` opening of the window.
+
+        :param self: The reference to class instance.
+        :param emit: The callable emitting a batch, see `add`.
+
+        :return: The number of emitted data, `0` when no batch is left or the
+                 window is closed.
+        """
+        with self.condition:
+            if not self.is_open or self.unsent is None:
+                return 0
+            seq = self.unsent
+            batch = self.pending[seq]
+            self.unsent = seq + len(batch)
+            if self.unsent >= self.next_seq:
+                self.unsent = None
+            emit(seq, batch)
+            self.emitted += len(batch)
+            return len(batch)
+
+    def close(self):
+        """Closes the window, after which batches are only kept.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        with self.condition:
+            self.is_open = False
+
+    def wait_until_empty(self, timeout=None):
+        """Waits till every batch is acknowledged.
+
+        :param self: The reference to class instance.
+        :param timeout: The optional number of seconds to wait for.
+
+        :return: Boolean, `False` if batches are still unacknowledged.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending, timeout)
+
+
+class BulkPublisher:
+    """Class publishing a stream of data through a green client.
+
+    :param self: The reference to class instance.
+    :param client: The `GreenClient` created with `interactive` set to
+                   `False` and a `max_in_flight`. It should be created with
+                   `reconnection`, so that it survives transient disconnects.
+    :param report_interval: The number of seconds between printed rates, `0`
+                            disables them.
+    :param drain_timeout: The number of seconds to wait for the last
+                          acknowledgements.
+    """
+
+    def __init__(self, client, report_interval=5.0, drain_timeout=30.0):
+        self.client = client
+        self.report_interval = report_interval
+        self.drain_timeout = drain_timeout
+
+    def publish(self, source):
+        """Publishes all data of an iterable and waits till it is acknowledged.
+
+        Publishing blocks while the window of the client is full, so the
+        source is read only as fast as the green apple server acknowledges.
+
+        :param self: The reference to class instance.
+        :param source: The iterable of data, such as `read_lines(sys.stdin)`.
+
+        :return: A dict with the number of published, emitted, acknowledged
+                 and unacknowledged messages and the sustained rate, where
+                 messages emitted again count once per emit. For example:
+                    {"sent": 1000, "emitted": 1000, "acked": 1000,
+                     "unacked": 0, "seconds": 0.5,
+                     "messages_per_second": 2000.0}
+        """
+        window = self.client.window
+        sent = 0
+        start = last_report = time.monotonic()
+        for data in source:
+            self.client.publish(data)
+            sent += 1
+            now = time.monotonic()
+            if (self.report_interval
+                    and now - last_report >= self.report_interval):
+                self.print_rate(window.acked, now - start)
+                last_report = now
+        self.client.batcher.flush()
+        window.wait_until_empty(self.drain_timeout)
+        seconds = time.monotonic() - start
+        self.print_rate(window.acked, seconds)
+        return {
+            "sent": sent,
+            "emitted": window.emitted,
+            "acked": window.acked,
+            "unacked": sent - window.acked,
+            "seconds": seconds,
+            "messages_per_second": window.acked / seconds if seconds else 0.0,
+        }
+
+    def print_rate(self, acked, seconds):
+        """Prints the number of acknowledged messages and their rate.
+
+        :param self: The reference to class instance.
+        :param acked: The number of acknowledged messages.
+        :param seconds: The number of seconds since publishing started.
+
+        :return: None
+        """
+        rate = acked / seconds if seconds else 0.0
+        print(f"< {acked} messages acknowledged, {rate:.0f} messages/s >")
@@ -14,3 +14,13 @@ class GreenClientConstants:
     green_server_nmsp = "/green"    # Namespace for connecting to green server
     green_server_port = "7000"      # Port for running green server
     green_server_host = "0.0.0.0"   # Host for running green server
+
+    batch_size = 100                # Messages which flush a batch right away
+    batch_delay = 0.005             # Seconds after which a batch is flushed
+
+    trace_every = 0                 # Messages per traced message, 0 disables
+
+    max_in_flight = 64              # Unacknowledged batches when publishing
+    report_interval = 5.0           # Seconds between rates when publishing
+
+    use_asyncio = False             # Run on asyncio instead of eventlet
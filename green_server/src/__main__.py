@@ -1,16 +1,55 @@
 #!/bin/env python
 """This file has the code for running the green apple server.
 
+With more than one of `workers`, the other workers are started as processes
+running this file with the `--worker` option and the index of the worker, and
+stopped with the green apple server.
+
 Author: sagarbhat94@gmail.com (Sagar Bhat)
 """
 
-from server import GreenAppleServer
+import os
+import signal
+import subprocess
+import sys
+
+# The modules shared by the components are kept in the `shared` directory
+sys.path.append(os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "shared"
+)))
+
 from settings import GreenServerConstants as consts
+from settings import server_kwargs, worker_kwargs
+
+if sys.argv[1:2] == ["--worker"]:
+    # Workers run a SocketIO client next to the server, like red servers
+    import eventlet
+    eventlet.monkey_patch()
+
+    from worker import GreenWorker
+
+    GreenWorker(**worker_kwargs({"worker_index": int(sys.argv[2])})).run()
+    sys.exit(0)
+
+if consts.use_asyncio:
+    from async_server import AsyncGreenAppleServer as GreenAppleServer
+else:
+    from server import GreenAppleServer
 
+workers = [
+    subprocess.Popen([
+        sys.executable,
+        os.path.dirname(os.path.abspath(__file__)),
+        "--worker",
+        str(index)
+    ])
+    for index in range(1, consts.workers)
+]
+# Stop like on Ctrl-C, so that the workers are stopped as well
+signal.signal(signal.SIGTERM, signal.default_int_handler)
 
-GreenAppleServer(
-    host=consts.grn_server_host,
-    port=consts.grn_server_port,
-    producer_namespace=consts.grn_client_nmsp,
-    consumer_namespace=consts.red_server_nmsp
-).run()
+try:
+    GreenAppleServer(**server_kwargs()).run()
+finally:
+    for worker in workers:
+        worker.terminate()
@@ -0,0 +1,135 @@
+#!/bin/env python
+"""This file has the asyncio variant of the green apple server.
+
+It runs the event handlers of `GreenAppleServer` on `socketio.AsyncServer`,
+see `aio.py`. Pushes and acknowledgements are flushed by timers of the event
+loop, and the message log is synced by a task awaiting the sync interval.
+Workers keep running on eventlet, as they only talk to the server over
+Socket.IO.
+"""
+
+import asyncio
+import time
+
+from aiohttp import web
+
+from aio import AsyncServerTransport, delayed, no_sleep
+from batching import MicroBatcher
+from metrics import CONTENT_TYPE
+from server import GreenAppleServer
+
+
+class AsyncGreenAppleServer(GreenAppleServer):
+    """Class for the green apple server running on asyncio.
+
+    It takes the same arguments as `GreenAppleServer`.
+    """
+
+    def __init__(self, host=None, port=None, *args, **kwargs):
+        if kwargs.get("admin_token"):
+            raise ValueError("The admin routes need the eventlet green server")
+        super(AsyncGreenAppleServer, self).__init__(
+            host, port, *args, **kwargs
+        )
+        self.push_batcher = MicroBatcher(
+            self.push_batcher.flush_batch,
+            delayed(self.push_batcher.max_delay),
+            no_sleep,
+            max_size=self.push_batcher.max_size,
+            max_delay=self.push_batcher.max_delay
+        )
+        self.ack_batcher = MicroBatcher(
+            self.ack_batcher.flush_batch,
+            delayed(self.ack_batcher.max_delay),
+            no_sleep,
+            max_size=self.ack_batcher.max_size,
+            max_delay=self.ack_batcher.max_delay
+        )
+
+    def create_app(self):
+        """Creates the `aiohttp` app and its Socket.IO server.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.sio_server = AsyncServerTransport()
+        self.app = self.sio_server.app
+
+    def add_route(self, path, view):
+        """Serves the response of a view on an HTTP route of the app.
+
+        :param self: The reference to class instance.
+        :param path: The path of the route, such as `/metrics`.
+        :param view: The callable returning the response.
+
+        :return: None
+        """
+        async def handler(request):
+            return view()
+
+        self.app.router.add_get(path, handler)
+
+    def session_id(self):
+        """Returns the session id of the client whose event is handled.
+
+        :param self: The reference to class instance.
+
+        :return: The session id.
+        """
+        return self.sio_server.sid
+
+    def on_metrics(self):
+        """Serves the metrics of the server in the Prometheus text format.
+
+        :param self: The reference to class instance.
+
+        :return: The `aiohttp` response.
+        """
+        return web.Response(
+            body=self.metrics.render().encode(),
+            headers={"Content-Type": CONTENT_TYPE}
+        )
+
+    def on_traces(self):
+        """Serves the latencies of the last traced messages as JSON.
+
+        :param self: The reference to class instance.
+
+        :return: The `aiohttp` response, see `TraceRing.dump`.
+        """
+        return web.json_response(self.traces.dump())
+
+    async def write_snapshots_periodically(self):
+        """Writes a snapshot every `snapshot_interval` seconds in a loop.
+
+        The state is copied in the event loop, and written in a thread of its
+        default executor, so that events are handled meanwhile.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.snapshots.interval)
+            start = time.perf_counter()
+            await loop.run_in_executor(
+                None, self.snapshots.write, self.snapshot_state()
+            )
+            self.snapshot_seconds.observe(time.perf_counter() - start)
+
+    async def sync_message_log(self):
+        """Syncs the message log and applies its retention periodically.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        last_retention = time.monotonic()
+        while True:
+            await asyncio.sleep(self.message_log.fsync_interval)
+            self.message_log.sync()
+            if time.monotonic() - last_retention >= 60:
+                self.message_log.enforce_retention()
+                last_retention = time.monotonic()
@@ -0,0 +1,279 @@
+#!/bin/env python
+"""This file has the durable append-only log of the published messages.
+
+Every message published by the green clients is appended to the log with a
+monotonically increasing offset, so that a red apple server which reconnects
+can resume from the offset it last received, even across restarts of the
+green apple server.
+
+The log is a directory of segment files, each named by the offset of its first
+record, e.g. `00000000000000001024.log`. A record is a header of offset, body
+length and CRC32 of the body, followed by the JSON body `[room_id, data]`.
+Writes are buffered and synced to disk in batches, reads memory-map the
+segments, and old segments are deleted by total size and age. A torn record
+at the end of the last segment, left by a crash, is truncated on startup.
+"""
+
+import json
+import mmap
+import os
+import time
+import zlib
+from bisect import bisect_right
+from struct import Struct
+
+RECORD = Struct("!QII")         # Offset, body length, CRC32 of body
+INDEX_INTERVAL = 256            # Records between two entries of the index
+SEGMENT_SUFFIX = ".log"
+
+
+class Segment:
+    """Class for one segment file of the log.
+
+    :param self: The reference to class instance.
+    :param directory: The directory of the log.
+    :param base_offset: The offset of the first record of the segment.
+    """
+
+    def __init__(self, directory, base_offset):
+        self.base_offset = base_offset
+        self.next_offset = base_offset
+        self.path = os.path.join(
+            directory, f"{base_offset:020d}{SEGMENT_SUFFIX}"
+        )
+        self.size = 0
+        self.index_offsets = []     # Sparse index of offsets...
+        self.index_positions = []   # ...and of their positions in the file
+
+    def add_to_index(self, offset, position):
+        """Indexes the position of every `INDEX_INTERVAL`-th record.
+
+        :param self: The reference to class instance.
+        :param offset: The offset of the record.
+        :param position: The file position of the record.
+
+        :return: None
+        """
+        if (offset - self.base_offset) % INDEX_INTERVAL == 0:
+            self.index_offsets.append(offset)
+            self.index_positions.append(position)
+
+    def position_of(self, offset):
+        """Returns a file position at or before the record of an offset.
+
+        :param self: The reference to class instance.
+        :param offset: The offset of the record.
+
+        :return: Integer file position to scan from.
+        """
+        index = bisect_right(self.index_offsets, offset) - 1
+        return self.index_positions[index] if index >= 0 else 0
+
+    def recover(self):
+        """Scans the segment file to rebuild the index and drop a torn tail.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        valid_size = 0
+        with open(self.path, "rb") as segment_file:
+            data = segment_file.read()
+        while valid_size + RECORD.size <= len(data):
+            offset, length, crc = RECORD.unpack_from(data, valid_size)
+            body_start = valid_size + RECORD.size
+            body = data[body_start:body_start + length]
+            if len(body) < length or zlib.crc32(body) != crc:
+                break
+            self.add_to_index(offset, valid_size)
+            self.next_offset = offset + 1
+            valid_size = body_start + length
+        if valid_size < len(data):
+            print(f"WARNING: Truncating torn tail of log '{self.path}'")
+            with open(self.path, "r+b") as segment_file:
+                segment_file.truncate(valid_size)
+        self.size = valid_size
+
+    def read(self, offset, max_records):
+        """Reads records from an offset through a memory map of the file.
+
+        :param self: The reference to class instance.
+        :param offset: The offset of the first record to be read.
+        :param max_records: The maximum number of records to be read.
+
+        :return: A list of tuples of offset, room id and data.
+        """
+        records = []
+        if not self.size or offset >= self.next_offset:
+            return records
+        with open(self.path, "rb") as segment_file:
+            with mmap.mmap(segment_file.fileno(), self.size,
+                           access=mmap.ACCESS_READ) as view:
+                position = self.position_of(offset)
+                while (position + RECORD.size <= self.size
+                       and len(records) < max_records):
+                    record_offset, length, _ = RECORD.unpack_from(
+                        view, position
+                    )
+                    body_start = position + RECORD.size
+                    position = body_start + length
+                    if record_offset < offset:
+                        continue
+                    room_id, data = json.loads(view[body_start:position])
+                    records.append((record_offset, room_id, data))
+        return records
+
+
+class MessageLog:
+    """Class for the segmented append-only log of published messages.
+
+    :param self: The reference to class instance.
+    :param directory: The directory holding the segment files, created if it
+                      doesn't exist.
+    :param segment_bytes: The size after which a new segment is started.
+    :param retention_bytes: The total size after which the oldest segments
+                            are deleted.
+    :param retention_seconds: The age after which segments are deleted.
+    :param fsync_batch: The number of appended records which triggers a sync.
+    :param fsync_interval: The number of seconds after which appended records
+                           are synced by the next append or `sync` call.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024,
+                 retention_bytes=1024 * 1024 * 1024,
+                 retention_seconds=7 * 24 * 3600, fsync_batch=1000,
+                 fsync_interval=0.05):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.retention_bytes = retention_bytes
+        self.retention_seconds = retention_seconds
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+        os.makedirs(directory, exist_ok=True)
+        self.segments = []
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(SEGMENT_SUFFIX):
+                segment = Segment(directory, int(name[:-len(SEGMENT_SUFFIX)]))
+                segment.recover()
+                self.segments.append(segment)
+        if not self.segments:
+            self.segments.append(Segment(directory, 0))
+        self.active_file = open(self.segments[-1].path, "ab")
+
+    @property
+    def first_offset(self):
+        return self.segments[0].base_offset
+
+    @property
+    def next_offset(self):
+        return self.segments[-1].next_offset
+
+    def append(self, room_id, data):
+        """Appends a message to the log.
+
+        :param self: The reference to class instance.
+        :param room_id: The three digit id of the green client.
+        :param data: The published data, serializable as JSON.
+
+        :return: The offset of the appended record.
+        """
+        segment = self.segments[-1]
+        if segment.size >= self.segment_bytes:
+            segment = self.roll()
+        offset = segment.next_offset
+        body = json.dumps([room_id, data]).encode("utf-8")
+        header = RECORD.pack(offset, len(body), zlib.crc32(body))
+        self.active_file.write(header + body)
+        segment.add_to_index(offset, segment.size)
+        segment.size += RECORD.size + len(body)
+        segment.next_offset = offset + 1
+        self.unsynced += 1
+        if (self.unsynced >= self.fsync_batch
+                or time.monotonic() - self.last_sync >= self.fsync_interval):
+            self.sync()
+        return offset
+
+    def roll(self):
+        """Starts a new segment and applies the retention to the old ones.
+
+        :param self: The reference to class instance.
+
+        :return: The new active segment.
+        """
+        self.sync()
+        self.active_file.close()
+        segment = Segment(self.directory, self.next_offset)
+        self.segments.append(segment)
+        self.active_file = open(segment.path, "ab")
+        self.enforce_retention()
+        return segment
+
+    def sync(self):
+        """Writes the appended records to disk.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.last_sync = time.monotonic()
+        if not self.unsynced:
+            return
+        self.active_file.flush()
+        os.fsync(self.active_file.fileno())
+        self.unsynced = 0
+
+    def enforce_retention(self):
+        """Deletes the oldest segments exceeding the retention size or age.
+
+        The active segment is never deleted.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        total = sum(segment.size for segment in self.segments)
+        expired_at = time.time() - self.retention_seconds
+        while len(self.segments) > 1:
+            oldest = self.segments[0]
+            if (total <= self.retention_bytes
+                    and os.path.getmtime(oldest.path) >= expired_at):
+                break
+            os.remove(oldest.path)
+            total -= oldest.size
+            self.segments.pop(0)
+
+    def read(self, offset, max_records=1000):
+        """Reads records sequentially from an offset.
+
+        If the offset was already deleted by the retention, reading starts
+        from the first offset still kept.
+
+        :param self: The reference to class instance.
+        :param offset: The offset of the first record to be read.
+        :param max_records: The maximum number of records to be read.
+
+        :return: A list of tuples of offset, room id and data.
+        """
+        self.active_file.flush()
+        offset = max(offset, self.first_offset)
+        records = []
+        base_offsets = [segment.base_offset for segment in self.segments]
+        index = max(bisect_right(base_offsets, offset) - 1, 0)
+        for segment in self.segments[index:]:
+            records.extend(segment.read(offset, max_records - len(records)))
+            if len(records) >= max_records:
+                break
+        return records
+
+    def close(self):
+        """Syncs and closes the log.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.sync()
+        self.active_file.close()
@@ -0,0 +1,196 @@
+#!/bin/env python
+"""This file has the deduplication of data retransmitted by green clients.
+
+Green clients publishing with a window of unacknowledged batches number their
+data per producer, starting over with every epoch of the client, and emit the
+unacknowledged batches again after reconnecting. The server keeps a bounded
+window of the sequence numbers received from every producer, which drops the
+data it already received, and acknowledges the sequence number up to which it
+received all the data. Once data of a producer is dropped by its publish rate
+limit, the window holds out for the dropped data, which the producer emits
+again, so that the data of a producer is never reordered.
+"""
+
+import heapq
+
+
+class SequenceWindow:
+    """Class to track the sequence numbers received from one producer.
+
+    :param self: The reference to class instance.
+    :param epoch: The epoch of the producer, whose numbers start over.
+    :param acked: The sequence number up to which all data was received.
+    :param size: The number of sequence numbers after `acked` remembered.
+    """
+
+    def __init__(self, epoch, acked, size):
+        self.epoch = epoch
+        self.acked = acked
+        self.size = size
+        self.received = set()           # Received numbers after `acked`
+        self.oldest = []                # Heap of the numbers in `received`
+        self.in_order = False           # Only accept the number after `acked`
+
+    def accept(self, seq):
+        """Records a sequence number, unless it was received before.
+
+        `acked` never moves past a missing number, as the producer keeps the
+        data till it is acknowledged. To keep the window bounded, only the
+        oldest of more than `size` received numbers are forgotten, so that
+        their data is accepted twice if the producer emits it again.
+
+        :param self: The reference to class instance.
+        :param seq: The sequence number of the data.
+
+        :return: Boolean, `False` if the data is a duplicate or held.
+        """
+        if seq <= self.acked or seq in self.received:
+            return False
+        if self.in_order:
+            if seq != self.acked + 1:
+                return False
+            self.in_order = False
+        self.received.add(seq)
+        heapq.heappush(self.oldest, seq)
+        self.advance(self.acked)
+        while len(self.received) > self.size:
+            self.received.discard(heapq.heappop(self.oldest))
+        return True
+
+    def is_held(self, seq):
+        """Tells whether a number is refused as it would overtake held data.
+
+        :param self: The reference to class instance.
+        :param seq: The sequence number of the data.
+
+        :return: Boolean, `True` if the window holds out for earlier data.
+        """
+        return (
+            self.in_order and seq > self.acked + 1
+            and seq not in self.received
+        )
+
+    def advance(self, acked):
+        """Moves `acked` to a number, and on over the received numbers.
+
+        :param self: The reference to class instance.
+        :param acked: The number up to which all data counts as received.
+
+        :return: None
+        """
+        if acked > self.acked:
+            self.acked = acked
+            self.received = {
+                number for number in self.received if number > acked
+            }
+        while self.acked + 1 in self.received:
+            self.acked += 1
+            self.received.remove(self.acked)
+        while self.oldest and self.oldest[0] <= self.acked:
+            heapq.heappop(self.oldest)
+
+
+class ProducerSequences:
+    """Class to deduplicate the data of every green id by sequence numbers.
+
+    :param self: The reference to class instance.
+    :param window_size: The number of sequence numbers remembered per green
+                        id, see `SequenceWindow`.
+    """
+
+    def __init__(self, window_size=10000):
+        self.window_size = window_size
+        self.windows = {}               # Green id -> its `SequenceWindow`
+
+    def start(self, green_id, epoch, seq):
+        """Starts a new window for a joining producer, unless it resumes one.
+
+        :param self: The reference to class instance.
+        :param green_id: The three digit id of the green client.
+        :param epoch: The epoch of the green client.
+        :param seq: The first sequence number which is unacknowledged by the
+                    client, as all data before it was received.
+
+        :return: None
+        """
+        window = self.windows.get(green_id)
+        if window is None or window.epoch != epoch:
+            self.windows[green_id] = SequenceWindow(
+                epoch, seq - 1, self.window_size
+            )
+        else:
+            window.advance(seq - 1)
+
+    def hold(self, green_id):
+        """Drops the data of a green id till the next expected number arrives.
+
+        :param self: The reference to class instance.
+        :param green_id: The three digit id of the green client.
+
+        :return: None
+        """
+        if green_id in self.windows:
+            self.windows[green_id].in_order = True
+
+    def accept(self, green_id, seq):
+        """Records a sequence number of a green id.
+
+        :param self: The reference to class instance.
+        :param green_id: The three digit id of the green client.
+        :param seq: The sequence number of the data.
+
+        :return: Boolean, `False` if the data is a duplicate.
+        """
+        if green_id not in self.windows:
+            self.start(green_id, None, seq)
+        return self.windows[green_id].accept(seq)
+
+    def is_held(self, green_id, seq):
+        """Tells whether a number of a green id is refused to keep the order.
+
+        :param self: The reference to class instance.
+        :param green_id: The three digit id of the green client.
+        :param seq: The sequence number of the data.
+
+        :return: Boolean, see `SequenceWindow.is_held`.
+        """
+        window = self.windows.get(green_id)
+        return window is not None and window.is_held(seq)
+
+    def acked(self, green_id):
+        """Returns the number up to which all data of a green id was received.
+
+        :param self: The reference to class instance.
+        :param green_id: The three digit id of the green client.
+
+        :return: The acknowledged sequence number.
+        """
+        return self.windows[green_id].acked
+
+    def dump(self):
+        """Returns the windows of all green ids as JSON values.
+
+        :param self: The reference to class instance.
+
+        :return: A dict of green id -> list of epoch, acknowledged number and
+                 received numbers after it. For example:
+                    {"123": ["5f0c...", 1041, [1043]]}
+        """
+        return {
+            green_id: [window.epoch, window.acked, sorted(window.received)]
+            for green_id, window in self.windows.items()
+        }
+
+    def restore(self, windows):
+        """Restores the windows of green ids dumped before a restart.
+
+        :param self: The reference to class instance.
+        :param windows: The dict returned by `dump`.
+
+        :return: None
+        """
+        for green_id, (epoch, acked, received) in windows.items():
+            window = SequenceWindow(epoch, acked, self.window_size)
+            window.received.update(received)
+            window.oldest = sorted(received)
+            self.windows[green_id] = window
@@ -8,8 +8,28 @@ red apple server so that it may be further propogated to red clients.
 Author: sagarbhat94@gmail.com (Sagar Bhat)
 """
 
-from flask import Flask, request
-from flask_socketio import SocketIO, emit, join_room, leave_room
+import hmac
+import time
+from collections import deque
+from functools import partial
+from itertools import islice
+
+from flask import Flask, Response, jsonify, request
+from flask_socketio import SocketIO, join_room, leave_room
+
+from admission import RateLimiter, TokenBucket
+from batching import MicroBatcher
+from buffers import RoomBuffers
+from codec import JsonCodec, get_codec
+from compression import ZLIB, Compressor
+from message_log import MessageLog
+from metrics import CONTENT_TYPE, MetricsRegistry
+from presence import PresenceIndex
+from profiling import count_greenlets, profile
+from sequences import ProducerSequences
+from snapshot import Snapshots
+from tracing import GREEN_SERVER, TraceRing, is_traced, stamp
+from worker import redirect_for
 
 
 class GreenAppleServer:
@@ -27,8 +47,50 @@ class GreenAppleServer:
                    passed to the parent class init method. Keywords such
                    as `consumer_namespace` and `producer_namespace` are
                    used to define namespace in current class. If not found,
-                   both default to `/`. Rest of the keyworded arguments
-                   are passed to the parent init method.
+                   both default to `/`. The keyword `push_enabled` allows
+                   the red apple server to subscribe for pushed data, and
+                   `push_ack_timeout` is the number of seconds after which
+                   an unacknowledged pushed batch is handed out again on
+                   the next `listen` call. The keywords `push_batch_size`
+                   and `push_batch_delay` set when pushes are flushed, see
+                   `MicroBatcher`. Payloads larger than the number of bytes
+                   of the keyword `compression_threshold` are compressed
+                   for red apple servers accepting it. The keyword
+                   `roster_history` is the number of roster changes kept
+                   to answer red servers with deltas instead of snapshots.
+                   Keywords prefixed with `buffer_` set the limits of the
+                   pending data, see `RoomBuffers`. The keyword `log_dir`
+                   enables the durable message log in that directory, and
+                   the keywords prefixed with `log_` set its segments,
+                   retention and syncing, see `MessageLog`. The keyword
+                   `replay_batch_size` is the number of logged messages
+                   sent per `resume` call. With more than one `workers`,
+                   green clients are sharded over worker processes which
+                   forward their events on the `worker_namespace`, see
+                   `worker.py`. Unless the keyword `metrics_enabled` is
+                   `False`, the server counts and times its events, which
+                   are served on the `/metrics` route. With the keyword
+                   `tracing`, sampled messages are stamped on arrival and
+                   the last `trace_ring_size` of them are summarized on the
+                   `/traces` route, see `tracing.py`. Data numbered by
+                   green clients is deduplicated within `dedup_window`
+                   sequence numbers per green id, see `sequences.py`, and
+                   acknowledged by `publish_ack` events flushed after
+                   `ack_batch_size` messages or `ack_batch_delay` seconds.
+                   With `join_rate`, joins are admitted at that rate per
+                   second with a `join_burst`, and with `publish_rate`, the
+                   data of every green id is admitted at that rate with a
+                   `publish_burst`, see `admission.py`. With an
+                   `admin_token`, the `/admin/profile` and
+                   `/admin/greenlets` routes serve profiles of the server
+                   to requests carrying it, see `profiling.py`. With a
+                   `snapshot_path`, the pending data and the sequence
+                   windows of the green ids are written to a snapshot
+                   every `snapshot_interval` seconds and when the server
+                   stops, and restored unless older than
+                   `snapshot_max_age`, see `snapshot.py`. Rest of the
+                   keyworded arguments are passed to the parent init
+                   method.
     """
 
     def __init__(self, host=None, port=None, *args, **kwargs):
@@ -36,45 +98,361 @@ class GreenAppleServer:
         self.port = port or "5000"
         self.consumer_namespace = kwargs.pop("consumer_namespace", "/")
         self.producer_namespace = kwargs.pop("producer_namespace", "/")
+        self.worker_namespace = kwargs.pop("worker_namespace", "/worker")
+        self.workers = kwargs.pop("workers", 1)
+        self.worker_green_ids = {}      # Worker session id -> its green ids
+        self.push_enabled = kwargs.pop("push_enabled", False)
+        self.push_ack_timeout = kwargs.pop("push_ack_timeout", 5.0)
 
-        self.sid_to_rooms_map = {}
-        self.active_green_ids = []
-        self.new_published_data = []
+        self.presence = PresenceIndex()
+        self.active_green_ids = set()
+        self.sequences = ProducerSequences(kwargs.pop("dedup_window", 10000))
+        self.join_bucket = None
+        join_rate = kwargs.pop("join_rate", None)
+        join_burst = kwargs.pop("join_burst", 100)
+        if join_rate:
+            self.join_bucket = TokenBucket(join_rate, join_burst)
+        self.publish_limiter = None
+        publish_rate = kwargs.pop("publish_rate", None)
+        publish_burst = kwargs.pop("publish_burst", 1000)
+        if publish_rate:
+            self.publish_limiter = RateLimiter(publish_rate, publish_burst)
+        self.new_published_data = RoomBuffers(
+            room_capacity=kwargs.pop("buffer_room_capacity", 1000),
+            total_capacity=kwargs.pop("buffer_total_capacity", 100000),
+            policy=kwargs.pop("buffer_policy", "drop_oldest"),
+            ttl=kwargs.pop("buffer_ttl", None)
+        )
 
-        self.app = Flask(__name__)
-        self.sio_server = SocketIO(self.app)
+        self.message_log = None
+        log_dir = kwargs.pop("log_dir", None)
+        log_kwargs = {
+            key: kwargs.pop(f"log_{key}") for key in (
+                "segment_bytes", "retention_bytes", "retention_seconds",
+                "fsync_batch", "fsync_interval"
+            ) if f"log_{key}" in kwargs
+        }
+        if log_dir:
+            self.message_log = MessageLog(log_dir, **log_kwargs)
+        self.replay_batch_size = kwargs.pop("replay_batch_size", 1000)
+        self.replaying = False          # Red server is replaying the log
+
+        self.roster_version = 0
+        self.roster_changes = deque(maxlen=kwargs.pop("roster_history", 1000))
+        self.pushed_roster_version = None
+
+        self.red_server_connected = False
+        self.interest = None            # Rooms watched by red clients
+
+        self.red_server_sid = None      # Red server subscribed for pushes
+        self.red_server_codec = JsonCodec
+        self.red_server_compression = False
+        self.compressor = Compressor(
+            threshold=kwargs.pop("compression_threshold", None)
+        )
+        self.next_batch_id = 0
+        self.unacked_batches = {}       # Batch id -> (push time, batch)
+
+        self.metrics = MetricsRegistry(
+            "green_apple", enabled=kwargs.pop("metrics_enabled", True)
+        )
+        self.register_metrics()
+        self.tracing = kwargs.pop("tracing", False)
+        self.traces = TraceRing(kwargs.pop("trace_ring_size", 1000))
+        self.admin_token = kwargs.pop("admin_token", None)
+        self.profiling = False          # A profile is being sampled
+        self.snapshots = None
+        snapshot_path = kwargs.pop("snapshot_path", None)
+        snapshot_interval = kwargs.pop("snapshot_interval", 5.0)
+        snapshot_max_age = kwargs.pop("snapshot_max_age", None)
+        if snapshot_path:
+            self.snapshots = Snapshots(
+                snapshot_path, snapshot_interval, snapshot_max_age
+            )
+            self.restore_snapshot()
+
+        self.create_app()
+        if self.metrics.enabled:
+            self.add_route("/metrics", self.on_metrics)
+        if self.tracing:
+            self.add_route("/traces", self.on_traces)
+        if self.admin_token:
+            self.add_route("/admin/profile", self.on_profile)
+            self.add_route("/admin/greenlets", self.on_greenlets)
+        self.push_batcher = MicroBatcher(
+            lambda _: self.push_to_red_server(),
+            self.sio_server.start_background_task,
+            self.sio_server.sleep,
+            max_size=kwargs.pop("push_batch_size", 1),
+            max_delay=kwargs.pop("push_batch_delay", 0)
+        )
+        self.ack_batcher = MicroBatcher(
+            self.send_publish_acks,
+            self.sio_server.start_background_task,
+            self.sio_server.sleep,
+            max_size=kwargs.pop("ack_batch_size", 100),
+            max_delay=kwargs.pop("ack_batch_delay", 0.01)
+        )
         super(GreenAppleServer, self).__init__(*args, **kwargs)
 
         # For server-to-server interaction (RedServer-GreenServer)
         namespace = self.consumer_namespace
-        self.sio_server.on_event(
+        self.on_event(
             "connect", self.on_connect_red_server, namespace=namespace
         )
-        self.sio_server.on_event(
+        self.on_event(
             "disconnect", self.on_disconnect_red_server, namespace=namespace
         )
-        self.sio_server.on_event(
+        self.on_event(
             "listen", self.on_listen_for_red_server, namespace=namespace
         )
+        self.on_event(
+            "subscribe", self.on_subscribe_for_red_server, namespace=namespace
+        )
+        self.on_event(
+            "roster", self.on_roster_for_red_server, namespace=namespace
+        )
+        self.on_event(
+            "resume", self.on_resume_for_red_server, namespace=namespace
+        )
+        self.on_event(
+            "interest", self.on_interest_for_red_server, namespace=namespace
+        )
         # For server-to-client interaction (GreenServer-GreenClient)
         namespace = self.producer_namespace
-        self.sio_server.on_event(
+        self.on_event(
             "disconnect", self.on_disconnect_green_client, namespace=namespace
         )
-        self.sio_server.on_event(
+        self.on_event(
             "incoming_data", self.on_incoming_client_data, namespace=namespace
         )
-        self.sio_server.on_event(
+        self.on_event(
+            "incoming_batch",
+            self.on_incoming_client_batch,
+            namespace=namespace
+        )
+        self.on_event(
             "join", self.on_join_green_client, namespace=namespace
         )
+        # For server-to-worker interaction (GreenServer-GreenWorker)
+        namespace = self.worker_namespace
+        self.on_event(
+            "disconnect", self.on_disconnect_worker, namespace=namespace
+        )
+        self.on_event(
+            "worker_events", self.on_worker_events, namespace=namespace
+        )
+
+    def register_metrics(self):
+        """Creates the counters, gauges and histograms of the server.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.events_received = self.metrics.counter(
+            "events_received_total", "Socket.IO events received.",
+            ("namespace", "event")
+        )
+        self.pushes_sent = self.metrics.counter(
+            "events_sent_total", "Socket.IO events emitted.",
+            ("namespace", "event")
+        ).labels(self.consumer_namespace, "push_data")
+        self.data_received = self.metrics.counter(
+            "data_received_total", "Data published by green clients."
+        ).labels()
+        self.throttled = self.metrics.counter(
+            "throttled_total", "Joins and data refused by admission control.",
+            ("event",)
+        )
+        self.duplicates_dropped = self.metrics.counter(
+            "duplicates_dropped_total",
+            "Data retransmitted by green clients and dropped as duplicates."
+        ).labels()
+        self.data_forwarded = self.metrics.counter(
+            "data_forwarded_total", "Data handed to the red apple server."
+        ).labels()
+        self.handler_seconds = self.metrics.histogram(
+            "handler_seconds", "Execution time of the event handlers.",
+            ("namespace", "event")
+        )
+        self.push_round_trip = self.metrics.histogram(
+            "push_round_trip_seconds",
+            "Time from pushing data till the red apple server acknowledged it."
+        ).labels()
+        self.snapshot_seconds = self.metrics.histogram(
+            "snapshot_seconds", "Time to write a snapshot of the state."
+        ).labels()
+        self.metrics.gauge(
+            "sessions", "Connected sessions.",
+            lambda: {
+                self.producer_namespace: len(self.presence),
+                self.consumer_namespace: int(self.red_server_connected),
+                self.worker_namespace: len(self.worker_green_ids),
+            },
+            ("namespace",)
+        )
+        self.metrics.gauge(
+            "rooms", "Active green ids, including those of the workers.",
+            lambda: len(self.active_green_ids)
+        )
+        self.metrics.gauge(
+            "compression_bytes",
+            "Bytes of the compressed frames, before and after compression.",
+            lambda: {
+                "raw": self.compressor.raw_bytes,
+                "compressed": self.compressor.compressed_bytes,
+            },
+            ("stage",)
+        )
+        self.metrics.gauge(
+            "compression_ratio",
+            "Raw bytes per compressed byte of the compressed frames.",
+            lambda: self.compressor.stats()["ratio"] or 0.0
+        )
+        self.metrics.gauge(
+            "compression_cpu_seconds", "CPU time spent compressing frames.",
+            lambda: self.compressor.cpu_seconds
+        )
+        self.metrics.gauge(
+            "pending_items", "Data waiting to be handed out, per room.",
+            self.new_published_data.pending_per_room, ("room",)
+        )
+        self.metrics.gauge(
+            "unacked_push_batches", "Pushed batches not acknowledged yet.",
+            lambda: len(self.unacked_batches)
+        )
+
+    def on_event(self, event, handler, namespace):
+        """Registers an event handler, counted and timed by the metrics.
+
+        :param self: The reference to class instance.
+        :param event: The name of the event.
+        :param handler: The event handler.
+        :param namespace: The namespace of the event.
+
+        :return: None
+        """
+        self.sio_server.on_event(
+            event,
+            self.metrics.timed(
+                handler, self.handler_seconds, self.events_received,
+                namespace, event
+            ),
+            namespace=namespace
+        )
+
+    def create_app(self):
+        """Creates the Flask app and its Socket.IO server.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.app = Flask(__name__)
+        self.sio_server = SocketIO(self.app)
+
+    def add_route(self, path, view):
+        """Serves the response of a view on an HTTP route of the app.
+
+        :param self: The reference to class instance.
+        :param path: The path of the route, such as `/metrics`.
+        :param view: The callable returning the response.
+
+        :return: None
+        """
+        self.app.add_url_rule(path, path.strip("/"), view)
+
+    def session_id(self):
+        """Returns the session id of the client whose event is handled.
+
+        :param self: The reference to class instance.
+
+        :return: The session id.
+        """
+        return request.sid
+
+    def on_metrics(self):
+        """Serves the metrics of the server in the Prometheus text format.
+
+        :param self: The reference to class instance.
+
+        :return: The Flask response.
+        """
+        return Response(self.metrics.render(), content_type=CONTENT_TYPE)
+
+    def on_traces(self):
+        """Serves the latencies of the last traced messages as JSON.
+
+        :param self: The reference to class instance.
+
+        :return: The Flask response, see `TraceRing.dump`.
+        """
+        return jsonify(self.traces.dump())
+
+    def is_admin(self):
+        """Tells whether the HTTP request carries the admin token.
+
+        The token is read from the `X-Admin-Token` header.
+
+        :param self: The reference to class instance.
+
+        :return: Boolean, `True` if the token matches `admin_token`.
+        """
+        token = request.headers.get("X-Admin-Token", "")
+        return hmac.compare_digest(
+            token.encode(), str(self.admin_token).encode()
+        )
+
+    def on_profile(self):
+        """Samples the stacks of the server and serves them collapsed.
+
+        The query arguments `seconds` and `interval` set for how long and how
+        often the stacks are sampled, by default for 10 seconds every 5 ms.
+        Only one profile is sampled at a time.
+
+        :param self: The reference to class instance.
+
+        :return: The Flask response, see `StackSampler.collapsed`.
+        """
+        if not self.is_admin():
+            return Response("Forbidden\n", status=403)
+        if self.profiling:
+            return Response("A profile is already running\n", status=409)
+        self.profiling = True
+        try:
+            sampler = profile(
+                request.args.get("seconds", 10.0, type=float),
+                request.args.get("interval", 0.005, type=float),
+                self.sio_server.sleep
+            )
+        finally:
+            self.profiling = False
+        return Response(
+            sampler.collapsed(),
+            content_type="text/plain; charset=utf-8",
+            headers={"X-Samples": str(sampler.samples)}
+        )
+
+    def on_greenlets(self):
+        """Serves the number of live greenlets per handler as JSON.
+
+        :param self: The reference to class instance.
+
+        :return: The Flask response, see `count_greenlets`.
+        """
+        if not self.is_admin():
+            return Response("Forbidden\n", status=403)
+        return jsonify(count_greenlets(self))
 
     def on_connect_red_server(self):
         """Connects red apple server to green apple server.
 
         This method gets called right before connecting red apple server to
         green apple server so as to forward the data published by the green
-        clients, to the red clients. Upon collecting the data variable is
-        reset to only publish fresh data after red server connected.
+        clients, to the red clients. The data still pending, including the
+        batches requeued when the red server disconnected, is handed out to
+        it, as the buffers bound it and expire it after their time to live.
 
         :param self: The reference to class instance. This will be used to call
                      the instance methods and to access the instance variables.
@@ -82,42 +460,393 @@ class GreenAppleServer:
         :return: None
         """
         print("< Red Apple Server connected >")
-        self.new_published_data = []
+        self.red_server_connected = True
+        self.pushed_roster_version = None
+        self.interest = None
 
     def on_disconnect_red_server(self):
         """Prints acknowledgement of disconnecting the red apple server.
 
+        The batches pushed to it which it never acknowledged are put back in
+        front of the pending data, to be handed out once it reconnects.
+
         :param self: The reference to class instance.
 
         :return: None
         """
+        if self.session_id() == self.red_server_sid:
+            self.red_server_sid = None
+            self.requeue_unacked_batches(expired_only=False)
+        self.red_server_connected = False
+        self.replaying = False
         print("< Red Apple Server disconnected >")
 
-    def on_listen_for_red_server(self):
+    def on_subscribe_for_red_server(self, data=None):
+        """Subscribes the red apple server for pushed data.
+
+        This method is called by the red apple server right after connecting.
+        If push mode is enabled, every batch of data published by the green
+        clients is emitted to the subscribed red apple server as soon as it
+        is received, instead of waiting for the next `listen` call.
+
+        :param self: The reference to class instance. This will be used to call
+                     the instance methods and to access the instance variables.
+        :param data: The optional dict with the name of the ``codec`` of the
+                     pushed data, see `codec.py`, and the ``compression`` the
+                     red apple server accepts. For example:
+                        {"codec": "binary", "compression": "zlib"}
+
+        :return: Boolean, `True` if the subscription was accepted.
+        """
+        if not self.push_enabled:
+            return False
+        self.red_server_sid = self.session_id()
+        self.red_server_codec = self.codec_for(data)
+        self.red_server_compression = self.accepts_compression(data)
+        return True
+
+    @staticmethod
+    def accepts_compression(data):
+        """Returns whether the red apple server accepts compressed payloads.
+
+        :param data: The optional dict of the request with the ``compression``.
+
+        :return: Boolean, `True` if zlib compression is accepted.
+        """
+        return (data or {}).get("compression") == ZLIB
+
+    def encode_for_red_server(self, data, codec, compression):
+        """Encodes a payload by a codec and compresses it if it is accepted.
+
+        :param self: The reference to class instance.
+        :param data: The payload dict.
+        :param codec: The codec of the payload.
+        :param compression: Boolean, whether compression is accepted.
+
+        :return: The encoded payload.
+        """
+        self.data_forwarded.inc(amount=len(data["data"] or ()))
+        data = codec.encode(data)
+        if compression:
+            data = self.compressor.compress(data)
+        return data
+
+    @staticmethod
+    def codec_for(data):
+        """Returns the codec requested by the red apple server.
+
+        :param data: The optional dict of the request with the ``codec`` name.
+
+        :return: The requested codec, or the `json` codec if it is unknown.
+        """
+        try:
+            return get_codec((data or {}).get("codec", JsonCodec.name))
+        except ValueError as ex:
+            print(f"ERROR: {ex} (falling back to json)")
+            return JsonCodec
+
+    def on_push_ack(self, batch_id, pushed_at, *args):
+        """Discards a pushed batch once the red apple server acknowledges it.
+
+        :param self: The reference to class instance.
+        :param batch_id: The id of the acknowledged batch.
+        :param pushed_at: The `time.perf_counter()` of the push.
+        :param args: The optional acknowledgement arguments sent by the red
+                     apple server.
+
+        :return: None
+        """
+        self.push_round_trip.observe(time.perf_counter() - pushed_at)
+        self.unacked_batches.pop(batch_id, None)
+
+    def requeue_unacked_batches(self, expired_only=True):
+        """Moves pushed batches which were never acknowledged back in queue.
+
+        Batches pushed more than `push_ack_timeout` seconds ago, which still
+        haven't been acknowledged, are put in front of the newly published
+        data so that the next `listen` call delivers them again.
+
+        :param self: The reference to class instance. This will be used to call
+                     the instance methods and to access the instance variables.
+        :param expired_only: Boolean, `False` to requeue all unacknowledged
+                             batches, such as when the red server is gone.
+
+        :return: None
+        """
+        expired_at = time.monotonic() - self.push_ack_timeout
+        expired = [
+            batch_id for batch_id, (pushed_at, _) in
+            self.unacked_batches.items()
+            if not expired_only or pushed_at < expired_at
+        ]
+        stale_data = []
+        for batch_id in expired:
+            stale_data.extend(self.unacked_batches.pop(batch_id)[1])
+        if stale_data:
+            self.new_published_data.prepend(stale_data)
+
+    def push_to_red_server(self):
+        """Pushes newly published data to the subscribed red apple server.
+
+        This method drains the newly published data, the same way a `listen`
+        call does, and emits it to the red apple server. The batch is kept
+        until the red apple server acknowledges it.
+
+        :param self: The reference to class instance. This will be used to call
+                     the instance methods and to access the instance variables.
+
+        :return: None
+        """
+        if self.red_server_sid is None or self.replaying:
+            return
+        self.requeue_unacked_batches()
+        data = {
+            "data": self.take_forwarded_data() or None,
+            "roster": self.roster_since(self.pushed_roster_version),
+            "offset": self.log_offset()
+        }
+        self.pushed_roster_version = self.roster_version
+        batch_id = self.next_batch_id
+        self.next_batch_id += 1
+        if data["data"]:
+            self.unacked_batches[batch_id] = (time.monotonic(), data["data"])
+        self.sio_server.emit(
+            "push_data",
+            self.encode_for_red_server(
+                data, self.red_server_codec, self.red_server_compression
+            ),
+            room=self.red_server_sid,
+            namespace=self.consumer_namespace,
+            callback=partial(
+                self.on_push_ack, batch_id, time.perf_counter()
+            )
+        )
+        self.pushes_sent.inc()
+
+    def record_roster_change(self, change, green_id):
+        """Records a green client joining or leaving under a new version.
+
+        :param self: The reference to class instance.
+        :param change: Either `join` or `leave`.
+        :param green_id: The three digit id of the green client.
+
+        :return: None
+        """
+        self.roster_version += 1
+        self.roster_changes.append((self.roster_version, change, green_id))
+
+    def roster_since(self, version):
+        """Returns the changes of active green clients since a roster version.
+
+        If the changes since the given version are no longer kept, or the
+        version is unknown, a full snapshot of the active ids is returned.
+
+        :param self: The reference to class instance.
+        :param version: The roster version known by the red apple server, or
+                        `None` if it doesn't know any.
+
+        :return: A dict with the current version and either the changes or the
+                 snapshot. For example:
+                    {"version": 7, "changes": [(7, "join", "123")]}
+                    {"version": 7, "active": ["123", "456"]}
+        """
+        oldest = self.roster_version - len(self.roster_changes)
+        if version is None or not oldest <= version <= self.roster_version:
+            return {
+                "version": self.roster_version,
+                "active": list(self.active_green_ids)
+            }
+        return {
+            "version": self.roster_version,
+            "changes": list(islice(
+                self.roster_changes, version - oldest, None
+            ))
+        }
+
+    def on_roster_for_red_server(self):
+        """Returns a full snapshot of the active green clients.
+
+        This method is called by the red apple server right after connecting,
+        and whenever it detects a gap in the roster versions it received.
+
+        :param self: The reference to class instance.
+
+        :return: A dict with the current roster version and active ids.
+        """
+        return self.roster_since(None)
+
+    def on_interest_for_red_server(self, data):
+        """Updates the rooms watched by red clients of the red apple server.
+
+        Once a red apple server tells its interest, only the data of the rooms
+        watched by its red clients is handed out. The data of other rooms is
+        held till a red client watches the room, or till it expires. A red
+        apple server which never tells its interest receives the data of all
+        the rooms.
+
+        :param self: The reference to class instance. This will be used to call
+                     the instance methods and to access the instance variables.
+        :param data: The dict with either all the watched ``rooms``, or the
+                     rooms to ``add`` to and ``remove`` from them. For example:
+                        {"rooms": ["123", "456"]}
+                        {"add": ["789"], "remove": ["123"]}
+
+        :return: Boolean `True` as acknowledgement.
+        """
+        if "rooms" in data:
+            self.interest = set(data["rooms"])
+        else:
+            if self.interest is None:
+                self.interest = set()
+            self.interest.update(data.get("add", ()))
+            self.interest.difference_update(data.get("remove", ()))
+        held = [
+            room_id for room_id in data.get("add", data.get("rooms", ()))
+            if self.new_published_data.pending(room_id)
+        ]
+        if held and self.red_server_sid is not None:
+            self.push_to_red_server()
+        return True
+
+    def is_forwarded(self, room_id):
+        """Returns whether the data of a room is handed out to red servers.
+
+        :param self: The reference to class instance.
+        :param room_id: The three digit id of the room.
+
+        :return: Boolean, `True` if the room is watched or interest unknown.
+        """
+        return self.interest is None or room_id in self.interest
+
+    def take_forwarded_data(self):
+        """Removes and returns the pending data of the watched rooms.
+
+        :param self: The reference to class instance.
+
+        :return: The list of tuples of room id and data.
+        """
+        if self.interest is None:
+            return self.new_published_data.take_all()
+        return self.new_published_data.take_rooms(self.interest)
+
+    def log_offset(self):
+        """Returns the offset up to which published data was handed out.
+
+        While a replay is in progress, the data between the replayed page and
+        the end of the log wasn't handed out yet, so no offset is returned.
+
+        :param self: The reference to class instance.
+
+        :return: The next offset of the message log, or `None` without log or
+                 while replaying.
+        """
+        if self.message_log is None or self.replaying:
+            return None
+        return self.message_log.next_offset
+
+    def on_resume_for_red_server(self, data):
+        """Replays the logged messages from an offset to the red apple server.
+
+        This method is called by a red apple server which reconnects, with
+        the offset it last received. Each call returns the next page of at most
+        `replay_batch_size` messages read sequentially from the message log,
+        and the offset to resume from on the next call. Pushes and `listen`
+        calls hand out no new data till the last page is returned, which also
+        discards the pending data already contained in the replay. Only the
+        data of the rooms watched by red clients is replayed. An offset past
+        the end of the log, saved by a red apple server before the log was
+        replaced, resumes from the end of the log and keeps the pending data.
+
+        :param self: The reference to class instance. This will be used to call
+                     the instance methods and to access the instance variables.
+        :param data: The dict with the ``offset`` to resume from, and the
+                     ``codec`` and ``compression`` as for `listen` calls. For
+                     example:
+                        {"offset": 1024, "codec": "json"}
+
+        :return: The payload with the replayed data, encoded like the response
+                 of a `listen` call. Example -
+                    {
+                        "data": [("123", "data1"), ("456", "data2")],
+                        "roster": None,
+                        "offset": 1026,
+                        "done": True
+                    }
+        """
+        codec = self.codec_for(data)
+        compression = self.accepts_compression(data)
+        if self.message_log is None:
+            payload = {
+                "data": None,
+                "roster": None,
+                "offset": None,
+                "done": True
+            }
+            return self.encode_for_red_server(payload, codec, compression)
+        offset = data["offset"]
+        contained = True
+        if offset < self.message_log.first_offset:
+            print(f"WARNING: Messages before offset {offset} were deleted")
+        elif offset > self.message_log.next_offset:
+            # The offset was received from an earlier message log
+            print(f"WARNING: Offset {offset} is past the end of the log")
+            offset = self.message_log.next_offset
+            contained = False
+        records = self.message_log.read(offset, self.replay_batch_size)
+        if records:
+            offset = records[-1][0] + 1
+        done = offset >= self.message_log.next_offset
+        self.replaying = not done
+        if done and contained:
+            # Data of the watched rooms is already contained in the replay
+            self.take_forwarded_data()
+            self.unacked_batches = {}
+        payload = {
+            "data": [
+                (room_id, item) for (_, room_id, item) in records
+                if self.is_forwarded(room_id)
+            ],
+            "roster": None,
+            "offset": offset,
+            "done": done
+        }
+        return self.encode_for_red_server(payload, codec, compression)
+
+    def on_listen_for_red_server(self, data=None):
         """Listens to new incoming data published by any green clients.
 
         This method reads the class instance variable which holds the newly
         published data everytime it is called, parses the data and returns
-        the active id of green clients and their published data.
+        the changes of active green clients and their published data. In push
+        mode it is only used as a fallback, which also hands out the batches
+        that were pushed but never acknowledged.
 
         :param self: The reference to class instance. This will be used to call
                      the instance methods and to access the instance variables.
+        :param data: The optional dict with the ``roster_version`` known by the
+                     red apple server, the name of the ``codec`` of the
+                     response and the ``compression`` it accepts. Example -
+                        {"roster_version": 6, "codec": "json"}
 
-        :return: A dictionary with active green clients and the data. Example -
+        :return: A dictionary with the roster changes and the data, encoded by
+                 the requested codec and possibly compressed. Example -
                     {
                         "data": [("123", data1), ("456", "data2")],
-                        "active": ["123", "456", "789"]
+                        "roster": {"version": 7, "changes": []}
                     }
         """
+        self.requeue_unacked_batches()
+        codec = self.codec_for(data)
+        compression = self.accepts_compression(data)
+        version = (data or {}).get("roster_version")
         data = {
             "data": None,
-            "active": self.active_green_ids
+            "roster": self.roster_since(version),
+            "offset": self.log_offset()
         }
-        if self.new_published_data:
-            new_data = self.new_published_data.copy()
-            self.new_published_data = []
-            data["data"] = new_data
-        return data
+        if self.new_published_data and not self.replaying:
+            data["data"] = self.take_forwarded_data()
+        return self.encode_for_red_server(data, codec, compression)
 
     def on_disconnect_green_client(self):
         """Removes the connected client and discards it as an inactive client.
@@ -131,58 +860,342 @@ class GreenAppleServer:
 
         :return: None
         """
-        room_id = self.sid_to_rooms_map.pop(request.sid, "XXX")
-        try:
-            self.active_green_ids.remove(room_id)
-        except ValueError:
-            pass
+        room_id = self.presence.remove(self.session_id())
+        if room_id is None:
+            print("< Client 'GRNXXX' disconnected >")
+            return
+        self.deactivate_green_id(room_id)
         print(f"< Client 'GRN{room_id}' disconnected >")
 
+    def activate_green_id(self, green_id):
+        """Marks a green id as active and tells the red apple server.
+
+        :param self: The reference to class instance.
+        :param green_id: The three digit id of the green client.
+
+        :return: None
+        """
+        self.active_green_ids.add(green_id)
+        self.record_roster_change("join", green_id)
+        self.push_to_red_server()
+
+    def deactivate_green_id(self, green_id):
+        """Marks a green id as inactive and tells the red apple server.
+
+        :param self: The reference to class instance.
+        :param green_id: The three digit id of the green client.
+
+        :return: None
+        """
+        self.active_green_ids.discard(green_id)
+        if self.publish_limiter is not None:
+            self.publish_limiter.forget(green_id)
+        self.record_roster_change("leave", green_id)
+        self.push_to_red_server()
+
     def on_join_green_client(self, data):
         """Registers a new green client and validates duplicate connections.
 
         This method should be called as soon as a green client connects to the
         server to register its id as an active id.  If a green client with the
         same id is already connected, abort connection because duplicate id is
-        not allowed.
+        not allowed. With several workers, a client whose id is owned by
+        another worker is told to join that worker instead. Joins exceeding
+        the `join_rate` are told when to join again.
 
         :param self: The reference to class instance. This will be used to call
                      the instance methods and to access the instance variables.
         :param data: The dict data which holds the three digit ``id`` of the
-                     new client. For example:
+                     new client and, for clients numbering their data, its
+                     ``epoch`` and the first unacknowledged ``seq``. For
+                     example:
                         {"id": "123"}
+                        {"id": "123", "epoch": "5f0c...", "seq": 400}
 
-        :return: None
+        :return: The dict with the ``port`` of the owning worker, or the
+                 seconds after which to join again, or `None`. For example:
+                    {"worker": 2, "port": "7002"}
+                    {"retry_after": 0.25}
         """
+        if self.join_bucket is not None:
+            retry_after = self.join_bucket.take()
+            if retry_after:
+                self.throttled.labels("join").inc()
+                return {"retry_after": retry_after}
+        if self.workers > 1:
+            redirect = redirect_for(data["id"], self.workers, 0, self.port)
+            if redirect is not None:
+                return redirect
         if data["id"] in self.active_green_ids:
-            emit("duplicate_connection", namespace=self.producer_namespace)
-            return
-        self.sid_to_rooms_map[request.sid] = data["id"]
-        self.active_green_ids.append(data["id"])
+            self.sio_server.emit(
+                "duplicate_connection",
+                room=self.session_id(),
+                namespace=self.producer_namespace
+            )
+            return None
+        self.presence.add(self.session_id(), data["id"])
+        if "seq" in data:
+            self.sequences.start(data["id"], data.get("epoch"), data["seq"])
         print(f"< Client 'GRN{data['id']}' connected >")
+        self.activate_green_id(data["id"])
+        return None
+
+    def on_worker_events(self, data):
+        """Applies the events forwarded by a worker in order.
+
+        Workers admit the joins and the data of their green clients.
+
+        :param self: The reference to class instance. This will be used to call
+                     the instance methods and to access the instance variables.
+        :param data: The dict with the list of ``events`` of the green clients
+                     of the worker. For example:
+                        {"events": [["join", "123"], ["data", "123", "x"]]}
+
+        :return: None
+        """
+        green_ids = self.worker_green_ids.setdefault(
+            self.session_id(), set()
+        )
+        for event in data["events"]:
+            if event[0] == "data":
+                self.store_published_data(
+                    {"id": event[1], "data": event[2]}
+                )
+            elif event[0] == "join":
+                green_ids.add(event[1])
+                self.activate_green_id(event[1])
+            else:
+                green_ids.discard(event[1])
+                self.deactivate_green_id(event[1])
+
+    def on_disconnect_worker(self):
+        """Marks the green ids of a disconnected worker as inactive.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        print("< Green worker disconnected >")
+        for green_id in self.worker_green_ids.pop(self.session_id(), ()):
+            self.deactivate_green_id(green_id)
 
     def on_incoming_client_data(self, data):
         """Listens to new incoming data received from connected green clients.
 
         This method should get called everytime a green client publishes data.
-        It appends the incoming data to class instance variable which is also
-        shared by other connected clients.
+        Data exceeding the `publish_rate` of its green id is dropped, see
+        `admit_publish`. Data with a ``seq`` is acknowledged, and dropped if
+        it is a duplicate. The rest is stored by `store_published_data`.
 
         :param self: The reference to class instance. This will be used to call
                      the instance methods and to access the instance variables.
+        :param data: The dict which holds the three digit ``id`` of the sender
+                     client, the published data and its optional sequence
+                     number. For example:
+                        {"id": "123", "data": "some_data"}
+                        {"id": "123", "data": "some_data", "seq": 41}
+
+        :return: None
+        """
+        if self.publish_limiter is not None and not self.admit_publish(data):
+            return
+        if "seq" in data:
+            accepted = self.sequences.accept(data["id"], data["seq"])
+            self.ack_batcher.add((self.session_id(), data["id"]))
+            if not accepted:
+                if self.sequences.is_held(data["id"], data["seq"]):
+                    self.throttled.labels("incoming_data").inc()
+                else:
+                    self.duplicates_dropped.inc()
+                return
+        self.store_published_data(data)
+
+    def store_published_data(self, data):
+        """Stores data published by a green client for the red apple server.
+
+        It appends the incoming data to class instance variable which is also
+        shared by other connected clients, and hands it to the push batcher
+        if a red apple server is subscribed and interested in the room. While
+        no red apple server is connected or interested in a room, its pending
+        data older than the buffer time to live expires.
+        With the message log enabled, the data is appended to it first.
+        Sampled messages are stamped with their arrival time when tracing.
+
+        :param self: The reference to class instance.
         :param data: The dict which holds the three digit ``id`` of the sender
                      client and the published data. For example:
                         {"id": "123", "data": "some_data"}
 
         :return: None
         """
-        self.new_published_data.append((data["id"], data["data"]))
+        self.data_received.inc()
+        if self.tracing and is_traced(data["data"]):
+            self.traces.record(stamp(data["data"], GREEN_SERVER))
+        if self.message_log is not None:
+            self.message_log.append(data["id"], data["data"])
+        self.new_published_data.append(data["id"], data["data"])
+        self.new_published_data.expire(
+            lambda room_id: self.red_server_connected
+            and self.is_forwarded(room_id)
+        )
+        if self.red_server_sid is not None and self.is_forwarded(data["id"]):
+            self.push_batcher.add(data["id"])
+
+    def on_incoming_client_batch(self, data):
+        """Listens to a batch of data received from a connected green client.
+
+        :param self: The reference to class instance.
+        :param data: The dict which holds the three digit ``id`` of the sender
+                     client, the list of published data and the optional
+                     sequence number of its first data. For example:
+                        {"id": "123", "data": ["data1", "data2"]}
+                        {"id": "123", "data": ["data1", "data2"], "seq": 40}
+
+        :return: None
+        """
+        seq = data.get("seq")
+        for offset, new_data in enumerate(data["data"]):
+            item = {"id": data["id"], "data": new_data}
+            if seq is not None:
+                item["seq"] = seq + offset
+            self.on_incoming_client_data(item)
+
+    def admit_publish(self, data):
+        """Admits published data within the `publish_rate` of its green id.
+
+        The green client is told once per throttled period when to publish
+        again by a `retry_after` event, along with the publish rate at which
+        it emits the dropped data again. The sequence number of the data is
+        held, so that numbered data is only accepted again in order, once the
+        client emits the dropped data again.
+
+        :param self: The reference to class instance.
+        :param data: The dict with the three digit ``id`` of the sender client,
+                     as for `on_incoming_client_data`.
+
+        :return: Boolean, `False` if the data is dropped.
+        """
+        admitted, retry_after = self.publish_limiter.admit(data["id"])
+        if admitted:
+            return True
+        self.throttled.labels("incoming_data").inc()
+        if "seq" in data:
+            self.sequences.hold(data["id"])
+        if retry_after is not None:
+            self.sio_server.emit(
+                "retry_after",
+                {
+                    "seconds": retry_after,
+                    "rate": self.publish_limiter.rate
+                },
+                room=self.session_id(),
+                namespace=self.producer_namespace
+            )
+        return False
+
+    def send_publish_acks(self, batch):
+        """Acknowledges the data received since the last acks, per session.
+
+        :param self: The reference to class instance.
+        :param batch: The list of tuples of session id and green id.
+
+        :return: None
+        """
+        for sid, green_id in dict.fromkeys(batch):
+            self.sio_server.emit(
+                "publish_ack",
+                {"seq": self.sequences.acked(green_id)},
+                room=sid,
+                namespace=self.producer_namespace
+            )
+
+    def snapshot_state(self):
+        """Returns the state of the server to be kept across restarts.
+
+        Data pushed to the red apple server but not acknowledged yet is kept
+        in front of the pending data, as when it is handed out again. Green
+        clients aren't kept, as their sessions end with the server. The state
+        is a copy, which the server doesn't change while it is written.
+
+        :param self: The reference to class instance.
+
+        :return: A dict of JSON values. For example:
+                    {
+                        "pending_data": [("123", "data1")],
+                        "sequences": {"123": ["5f0c...", 1041, []]}
+                    }
+        """
+        unacked_data = [
+            item for (_, batch) in self.unacked_batches.values()
+            for item in batch
+        ]
+        return {
+            "pending_data": unacked_data + self.new_published_data.peek_all(),
+            "sequences": self.sequences.dump()
+        }
+
+    def restore_snapshot(self):
+        """Restores the state of the server from its last snapshot.
+
+        Green clients emitting their unacknowledged data again after joining
+        are deduplicated by the restored sequence windows.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        start = time.perf_counter()
+        state = self.snapshots.read()
+        if state is None:
+            return
+        self.new_published_data.extend(state["pending_data"])
+        self.sequences.restore(state["sequences"])
+        print(
+            f"< Restored {len(state['pending_data'])} pending data and "
+            f"{len(state['sequences'])} sequence windows in "
+            f"{(time.perf_counter() - start) * 1000:.1f}ms >"
+        )
+
+    def write_snapshot(self, off_hub=False):
+        """Writes the state of the server to a new snapshot.
+
+        The state is copied on the hub, and with `off_hub`, it is encoded,
+        compressed and synced to disk in a native thread of `eventlet.tpool`,
+        so that events are handled meanwhile.
+
+        :param self: The reference to class instance.
+        :param off_hub: Boolean, whether to write in a native thread.
+
+        :return: None
+        """
+        start = time.perf_counter()
+        state = self.snapshot_state()
+        if off_hub:
+            from eventlet import tpool
+            tpool.execute(self.snapshots.write, state)
+        else:
+            self.snapshots.write(state)
+        self.snapshot_seconds.observe(time.perf_counter() - start)
+
+    def write_snapshots_periodically(self):
+        """Writes a snapshot every `snapshot_interval` seconds in a loop.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        while True:
+            self.sio_server.sleep(self.snapshots.interval)
+            self.write_snapshot(off_hub=True)
 
     def run(self):
         """Runs an instance of green apple server.
 
         This method runs a Flask-SocketIO server and servers as the source of
         incoming data for the connected red apple server to propogate further.
+        With the message log enabled, a background task syncs it periodically,
+        and it is closed when the server stops. With snapshots, they are
+        written periodically and once the server stops.
 
         :param self: The reference to class instance. This will be used to call
                      the instance methods and to access the instance variables.
@@ -190,5 +1203,30 @@ class GreenAppleServer:
         :return: None
         """
         print(f"(Starting server on '{self.host}:{self.port}')")
+        if self.message_log is not None:
+            self.sio_server.start_background_task(self.sync_message_log)
+        if self.snapshots is not None:
+            self.sio_server.start_background_task(
+                self.write_snapshots_periodically
+            )
         self.sio_server.run(self.app, host=self.host, port=self.port)
+        if self.snapshots is not None:
+            self.write_snapshot()
+        if self.message_log is not None:
+            self.message_log.close()
         print("Server closed.")
+
+    def sync_message_log(self):
+        """Syncs the message log and applies its retention periodically.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        last_retention = time.monotonic()
+        while True:
+            self.sio_server.sleep(self.message_log.fsync_interval)
+            self.message_log.sync()
+            if time.monotonic() - last_retention >= 60:
+                self.message_log.enforce_retention()
+                last_retention = time.monotonic()
@@ -14,3 +14,134 @@ class GreenServerConstants:
     grn_client_nmsp = "/green"      # Namespace for connecting to green server
     grn_server_port = "7000"        # Port for connecting to green server
     grn_server_host = "0.0.0.0"     # Host for connecting to green server
+
+    push_enabled = True             # Push new data to subscribed red server
+    push_ack_timeout = 5.0          # Seconds before unacked pushes are resent
+    roster_history = 1000           # Roster changes kept for delta updates
+
+    buffer_room_capacity = 1000     # Pending messages kept per green id
+    buffer_total_capacity = 100000  # Pending messages kept for all green ids
+    buffer_policy = "drop_oldest"   # Either "drop_oldest" or "drop_newest"
+    buffer_ttl = 300.0              # Seconds to keep data without red server
+
+    push_batch_size = 100           # Messages which flush a push right away
+    push_batch_delay = 0.005        # Seconds after which a push is flushed
+
+    compression_threshold = 4096    # Bytes from which payloads are zipped
+
+    dedup_window = 10000            # Sequence numbers remembered per green id
+    ack_batch_size = 100            # Messages which flush acks right away
+    ack_batch_delay = 0.01          # Seconds after which acks are flushed
+
+    join_rate = 500.0               # Joins admitted per second, None disables
+    join_burst = 1000               # Joins admitted at once
+    publish_rate = None             # Data per second per green id, or None
+    publish_burst = 1000            # Data admitted at once per green id
+
+    log_dir = "green_log"           # Directory of message log, None disables
+    log_segment_bytes = 64 << 20    # Size of a message log segment
+    log_retention_bytes = 1 << 30   # Total size of message log segments kept
+    log_retention_seconds = 604800  # Age of message log segments kept
+    log_fsync_batch = 1000          # Messages logged before syncing to disk
+    log_fsync_interval = 0.05       # Seconds between syncs of the message log
+    replay_batch_size = 1000        # Logged messages sent per resume call
+
+    workers = 1                     # Processes accepting green clients
+    grn_worker_nmsp = "/worker"     # Namespace for connecting the workers
+    worker_batch_size = 100         # Events which are forwarded right away
+    worker_batch_delay = 0.005      # Seconds after which events are forwarded
+
+    metrics_enabled = True          # Serve counters and timings on /metrics
+    tracing = True                  # Stamp sampled messages, see /traces
+    trace_ring_size = 1000          # Traced messages kept for /traces
+    admin_token = None              # Token of the /admin routes, or None
+
+    snapshot_path = None            # File of the state snapshots, or None
+    snapshot_interval = 5.0         # Seconds between state snapshots
+    snapshot_max_age = 300.0        # Older snapshots aren't restored
+
+    use_asyncio = False             # Run on asyncio instead of eventlet
+
+
+def server_kwargs(options=None):
+    """Builds the keyword arguments of the green apple server.
+
+    :param options: The dict of keyword arguments overriding the settings.
+                    Defaults to None, which uses the settings alone.
+
+    :return: The dict of keyword arguments for `GreenAppleServer`.
+    """
+    consts = GreenServerConstants
+    kwargs = {
+        "host": consts.grn_server_host,
+        "port": consts.grn_server_port,
+        "producer_namespace": consts.grn_client_nmsp,
+        "consumer_namespace": consts.red_server_nmsp,
+        "worker_namespace": consts.grn_worker_nmsp,
+        "workers": consts.workers,
+        "push_enabled": consts.push_enabled,
+        "push_ack_timeout": consts.push_ack_timeout,
+        "roster_history": consts.roster_history,
+        "push_batch_size": consts.push_batch_size,
+        "push_batch_delay": consts.push_batch_delay,
+        "compression_threshold": consts.compression_threshold,
+        "dedup_window": consts.dedup_window,
+        "ack_batch_size": consts.ack_batch_size,
+        "ack_batch_delay": consts.ack_batch_delay,
+        "join_rate": consts.join_rate,
+        "join_burst": consts.join_burst,
+        "publish_rate": consts.publish_rate,
+        "publish_burst": consts.publish_burst,
+        "log_dir": consts.log_dir,
+        "log_segment_bytes": consts.log_segment_bytes,
+        "log_retention_bytes": consts.log_retention_bytes,
+        "log_retention_seconds": consts.log_retention_seconds,
+        "log_fsync_batch": consts.log_fsync_batch,
+        "log_fsync_interval": consts.log_fsync_interval,
+        "replay_batch_size": consts.replay_batch_size,
+        "buffer_room_capacity": consts.buffer_room_capacity,
+        "buffer_total_capacity": consts.buffer_total_capacity,
+        "buffer_policy": consts.buffer_policy,
+        "buffer_ttl": consts.buffer_ttl,
+        "metrics_enabled": consts.metrics_enabled,
+        "tracing": consts.tracing,
+        "trace_ring_size": consts.trace_ring_size,
+        "admin_token": consts.admin_token,
+        "snapshot_path": consts.snapshot_path,
+        "snapshot_interval": consts.snapshot_interval,
+        "snapshot_max_age": consts.snapshot_max_age,
+    }
+    kwargs.update(options or {})
+    return kwargs
+
+
+def worker_kwargs(options=None):
+    """Builds the keyword arguments of a worker of the green apple server.
+
+    :param options: The dict of keyword arguments overriding the settings,
+                    with the `worker_index` of the worker. The worker connects
+                    to the green apple server on the local host and `port`.
+
+    :return: The dict of keyword arguments for `GreenWorker`.
+    """
+    consts = GreenServerConstants
+    kwargs = {
+        "host": consts.grn_server_host,
+        "port": consts.grn_server_port,
+        "workers": consts.workers,
+        "producer_namespace": consts.grn_client_nmsp,
+        "worker_namespace": consts.grn_worker_nmsp,
+        "worker_batch_size": consts.worker_batch_size,
+        "worker_batch_delay": consts.worker_batch_delay,
+        "buffer_total_capacity": consts.buffer_total_capacity,
+        "dedup_window": consts.dedup_window,
+        "ack_batch_size": consts.ack_batch_size,
+        "ack_batch_delay": consts.ack_batch_delay,
+        "join_rate": consts.join_rate,
+        "join_burst": consts.join_burst,
+        "publish_rate": consts.publish_rate,
+        "publish_burst": consts.publish_burst,
+    }
+    kwargs.update(options or {})
+    kwargs["primary_url"] = f"http://127.0.0.1:{kwargs['port']}"
+    return kwargs
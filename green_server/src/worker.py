@@ -0,0 +1,340 @@
+#!/bin/env python
+"""This file has the worker processes of a multi-core green apple server.
+
+With several workers, every worker process accepts green clients on its own
+port, the port of the green apple server plus the index of the worker. Every
+green id is owned by exactly one worker, see `worker_for`, and a green client
+joining another worker is told the port of the owner instead. Worker 0 is the
+green apple server itself, which also serves the red apple server.
+
+The other workers check duplicate ids of their own green clients and forward
+the joins, leaves and published data to the green apple server in batches of
+events, in the order they were received. Data numbered by green clients is
+deduplicated and acknowledged, and joins and data are admitted, by the worker
+as the green apple server does.
+For example:
+
+    {"events": [["join", "123"], ["data", "123", "data1"], ["leave", "123"]]}
+
+As the data of a green id always goes through the same worker, the green apple
+server merges the streams of all workers in one feed ordered per room.
+"""
+
+import zlib
+from collections import deque
+
+from flask import Flask, request
+from flask_socketio import SocketIO, emit
+from socketio import Client
+from socketio import exceptions as sio_exceptions
+
+from admission import RateLimiter, TokenBucket
+from batching import MicroBatcher
+from presence import PresenceIndex
+from sequences import ProducerSequences
+
+
+def worker_for(green_id, workers):
+    """Returns the index of the worker owning a green id.
+
+    :param green_id: The three digit id of the green client.
+    :param workers: The number of workers.
+
+    :return: Integer index of the worker, between `0` and `workers - 1`.
+    """
+    return zlib.crc32(green_id.encode("utf-8")) % workers
+
+
+def redirect_for(green_id, workers, worker_index, port):
+    """Returns where a green client has to join, if not on this worker.
+
+    :param green_id: The three digit id of the green client.
+    :param workers: The number of workers.
+    :param worker_index: The index of the worker the client joined.
+    :param port: The port of the worker the client joined.
+
+    :return: A dict with the ``port`` of the owning worker, or `None` if the
+             client joined its owner. For example:
+                {"worker": 2, "port": "7002"}
+    """
+    owner = worker_for(green_id, workers)
+    if owner == worker_index:
+        return None
+    return {"worker": owner, "port": str(int(port) - worker_index + owner)}
+
+
+class GreenWorker:
+    """Class for a worker accepting the green clients of its own green ids.
+
+    :param self: The reference to class instance.
+    :param host: The host for running the worker. Defaults to `0.0.0.0`.
+    :param port: The port of the green apple server, which the worker adds its
+                 index to. Defaults to `5000`.
+    :param kwargs: The keyworded arguments. The keywords `worker_index` and
+                   `workers` are the index of this worker and the number of
+                   workers, `primary_url` is the URL of the green apple
+                   server. The keywords `producer_namespace` and
+                   `worker_namespace` are the namespaces of the green
+                   clients and of the green apple server, and
+                   `worker_batch_size` and `worker_batch_delay` set when
+                   events are forwarded, see `MicroBatcher`. At most
+                   `buffer_total_capacity` events are kept while the green
+                   apple server is unreachable. The keywords `dedup_window`,
+                   `ack_batch_size`, `ack_batch_delay` and those prefixed
+                   with `join_` and `publish_` are used as by the green
+                   apple server, per worker.
+    """
+
+    def __init__(self, host=None, port=None, *args, **kwargs):
+        self.worker_index = kwargs.pop("worker_index")
+        self.workers = kwargs.pop("workers")
+        self.host = host or "0.0.0.0"
+        self.port = str(int(port or "5000") + self.worker_index)
+        self.primary_url = kwargs.pop("primary_url")
+        self.producer_namespace = kwargs.pop("producer_namespace", "/")
+        self.worker_namespace = kwargs.pop("worker_namespace", "/worker")
+
+        self.presence = PresenceIndex()
+        self.active_green_ids = set()
+        self.sequences = ProducerSequences(kwargs.pop("dedup_window", 10000))
+        self.join_bucket = None
+        join_rate = kwargs.pop("join_rate", None)
+        join_burst = kwargs.pop("join_burst", 100)
+        if join_rate:
+            self.join_bucket = TokenBucket(join_rate, join_burst)
+        self.publish_limiter = None
+        publish_rate = kwargs.pop("publish_rate", None)
+        publish_burst = kwargs.pop("publish_burst", 1000)
+        if publish_rate:
+            self.publish_limiter = RateLimiter(publish_rate, publish_burst)
+        self.unsent_events = deque(
+            maxlen=kwargs.pop("buffer_total_capacity", 100000)
+        )
+
+        self.app = Flask(__name__)
+        self.sio_server = SocketIO(self.app)
+        self.primary_client = Client(reconnection=True)
+        self.batcher = MicroBatcher(
+            self.send_events,
+            self.sio_server.start_background_task,
+            self.sio_server.sleep,
+            max_size=kwargs.pop("worker_batch_size", 100),
+            max_delay=kwargs.pop("worker_batch_delay", 0.005)
+        )
+        self.ack_batcher = MicroBatcher(
+            self.send_publish_acks,
+            self.sio_server.start_background_task,
+            self.sio_server.sleep,
+            max_size=kwargs.pop("ack_batch_size", 100),
+            max_delay=kwargs.pop("ack_batch_delay", 0.01)
+        )
+        super(GreenWorker, self).__init__(*args, **kwargs)
+
+        namespace = self.producer_namespace
+        self.sio_server.on_event(
+            "disconnect", self.on_disconnect_green_client, namespace=namespace
+        )
+        self.sio_server.on_event(
+            "incoming_data", self.on_incoming_client_data, namespace=namespace
+        )
+        self.sio_server.on_event(
+            "incoming_batch",
+            self.on_incoming_client_batch,
+            namespace=namespace
+        )
+        self.sio_server.on_event(
+            "join", self.on_join_green_client, namespace=namespace
+        )
+        self.primary_client.on(
+            "connect", self.on_connect_primary, namespace=self.worker_namespace
+        )
+
+    def on_join_green_client(self, data):
+        """Registers a new green client owned by this worker.
+
+        Clients of green ids owned by another worker are told its port, and
+        duplicate ids and joins exceeding the `join_rate` are rejected as by
+        the green apple server.
+
+        :param self: The reference to class instance. This will be used to call
+                     the instance methods and to access the instance variables.
+        :param data: The dict data which holds the three digit ``id`` of the
+                     new client, and its ``epoch`` and first unacknowledged
+                     ``seq`` if it numbers its data. For example:
+                        {"id": "123"}
+
+        :return: The dict with the ``port`` of the owning worker, or the
+                 seconds after which to join again, or `None`.
+        """
+        if self.join_bucket is not None:
+            retry_after = self.join_bucket.take()
+            if retry_after:
+                return {"retry_after": retry_after}
+        redirect = redirect_for(
+            data["id"], self.workers, self.worker_index, self.port
+        )
+        if redirect is not None:
+            return redirect
+        if data["id"] in self.active_green_ids:
+            emit("duplicate_connection", namespace=self.producer_namespace)
+            return None
+        self.presence.add(request.sid, data["id"])
+        if "seq" in data:
+            self.sequences.start(data["id"], data.get("epoch"), data["seq"])
+        self.active_green_ids.add(data["id"])
+        self.batcher.add(("join", data["id"]))
+        return None
+
+    def on_disconnect_green_client(self):
+        """Removes a disconnected green client.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        room_id = self.presence.remove(request.sid)
+        if room_id is None:
+            return
+        self.active_green_ids.discard(room_id)
+        if self.publish_limiter is not None:
+            self.publish_limiter.forget(room_id)
+        self.batcher.add(("leave", room_id))
+
+    def on_incoming_client_data(self, data):
+        """Forwards data published by a green client of this worker.
+
+        :param self: The reference to class instance.
+        :param data: The dict which holds the three digit ``id`` of the sender
+                     client, the published data and its optional sequence
+                     number. For example:
+                        {"id": "123", "data": "some_data", "seq": 41}
+
+        :return: None
+        """
+        if self.publish_limiter is not None:
+            admitted, retry_after = self.publish_limiter.admit(data["id"])
+            if not admitted:
+                if "seq" in data:
+                    self.sequences.hold(data["id"])
+                if retry_after is not None:
+                    emit(
+                        "retry_after",
+                        {
+                            "seconds": retry_after,
+                            "rate": self.publish_limiter.rate
+                        },
+                        namespace=self.producer_namespace
+                    )
+                return
+        if "seq" in data:
+            accepted = self.sequences.accept(data["id"], data["seq"])
+            self.ack_batcher.add((request.sid, data["id"]))
+            if not accepted:
+                return
+        self.batcher.add(("data", data["id"], data["data"]))
+
+    def on_incoming_client_batch(self, data):
+        """Forwards a batch of data published by a green client.
+
+        :param self: The reference to class instance.
+        :param data: The dict which holds the three digit ``id`` of the sender
+                     client, the list of published data and the optional
+                     sequence number of its first data.
+
+        :return: None
+        """
+        seq = data.get("seq")
+        for offset, new_data in enumerate(data["data"]):
+            item = {"id": data["id"], "data": new_data}
+            if seq is not None:
+                item["seq"] = seq + offset
+            self.on_incoming_client_data(item)
+
+    def send_publish_acks(self, batch):
+        """Acknowledges the data received since the last acks, per session.
+
+        :param self: The reference to class instance.
+        :param batch: The list of tuples of session id and green id.
+
+        :return: None
+        """
+        for sid, green_id in dict.fromkeys(batch):
+            self.sio_server.emit(
+                "publish_ack",
+                {"seq": self.sequences.acked(green_id)},
+                room=sid,
+                namespace=self.producer_namespace
+            )
+
+    def send_events(self, events):
+        """Forwards a batch of events to the green apple server.
+
+        Events are kept while the green apple server is unreachable, and sent
+        once the worker reconnects.
+
+        :param self: The reference to class instance.
+        :param events: The list of event tuples.
+
+        :return: None
+        """
+        if not self.primary_client.connected:
+            self.unsent_events.extend(events)
+            return
+        self.primary_client.emit(
+            "worker_events",
+            {"events": events},
+            namespace=self.worker_namespace
+        )
+
+    def on_connect_primary(self):
+        """Announces the green clients of this worker after (re)connecting.
+
+        The green apple server forgets the green ids of a worker when it
+        disconnects, so all of them join again, followed by the data which
+        couldn't be sent meanwhile.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        print("< Connected to Green Apple Server >")
+        events = [("join", green_id) for green_id in self.active_green_ids]
+        events.extend(
+            event for event in self.unsent_events if event[0] == "data"
+        )
+        self.unsent_events.clear()
+        self.primary_client.emit(
+            "worker_events",
+            {"events": events},
+            namespace=self.worker_namespace
+        )
+
+    def connect_to_primary(self):
+        """Connects to the green apple server, retrying till it is running.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        while True:
+            try:
+                self.primary_client.connect(
+                    self.primary_url, namespaces=[self.worker_namespace]
+                )
+                return
+            except sio_exceptions.ConnectionError:
+                self.sio_server.sleep(1)
+
+    def run(self):
+        """Runs the worker and connects it to the green apple server.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        print(f"(Starting worker {self.worker_index} on "
+              f"'{self.host}:{self.port}')")
+        self.sio_server.start_background_task(self.connect_to_primary)
+        self.sio_server.run(self.app, host=self.host, port=self.port)
+        self.primary_client.disconnect()
+        print("Worker closed.")
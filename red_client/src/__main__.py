@@ -4,12 +4,27 @@
 Author: sagarbhat94@gmail.com (Sagar Bhat)
 """
 
-from listener import RedClient
+import os
+import sys
+
+# The modules shared by the components are kept in the `shared` directory
+sys.path.append(os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "shared"
+)))
+
 from settings import RedClientConstants as consts
 
+if consts.use_asyncio:
+    from async_listener import AsyncRedClient as RedClient
+else:
+    from listener import RedClient
+
 RedClient(
     host=consts.red_server_host,
     port=consts.red_server_port,
     client_namespace=consts.red_client_nmsp,
-    server_namespace=consts.red_server_nmsp
+    server_namespace=consts.red_server_nmsp,
+    compression=consts.compression,
+    reconnection=consts.reconnection,
+    trace_ring_size=consts.trace_ring_size
 ).run()
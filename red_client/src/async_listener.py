@@ -0,0 +1,72 @@
+#!/bin/env python
+"""This file has the asyncio variant of the red client.
+
+It runs the event handlers of `RedClient` on `socketio.AsyncClient`, see
+`aio.py`.
+"""
+
+import asyncio
+
+from aio import AsyncClientTransport, run_until_done
+from listener import RedClient
+
+
+class AsyncRedClient(RedClient):
+    """Class for listening to data published by red apple server on asyncio.
+
+    It takes the same arguments as `RedClient`.
+    """
+
+    def __init__(self, host=None, port=None, *args, **kwargs):
+        super(AsyncRedClient, self).__init__(host, port, *args, **kwargs)
+        self.sio_client = AsyncClientTransport(
+            reconnection=self.sio_client.reconnection
+        )
+
+    def connect_to_server(self):
+        """Starts a task connecting to the red apple server.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.sio_client.start_background_task(
+            self.sio_client.connect_and_wait,
+            self.connect_url,
+            [self.server_namespace],
+            "red server"
+        )
+
+    async def reconnect_to_server(self):
+        """Disconnects and connects again to the current `connect_url`.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        await self.sio_client.client.disconnect()
+        await self.sio_client.connect_and_wait(
+            self.connect_url, [self.server_namespace], "red server"
+        )
+
+    async def join_later(self, seconds):
+        """Joins the red apple server again after a delay.
+
+        :param self: The reference to class instance.
+        :param seconds: The number of seconds to wait for.
+
+        :return: None
+        """
+        await asyncio.sleep(seconds)
+        if self.sio_client.connected:
+            self.join()
+
+    def run(self):
+        """Runs the client till it is disconnected from red apple server.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        super(AsyncRedClient, self).run()
+        run_until_done()
@@ -7,13 +7,22 @@ of instance methods to listen to data published by the red apple server.
 Author: sagarbhat94@gmail.com (Sagar Bhat)
 """
 
+import json
 import sys
 
 from socketio import Client, ClientNamespace
 from socketio import exceptions as sio_exceptions
 
+from compression import ZLIB, decompress
+from tracing import RED_CLIENT, TraceRing, is_traced, stamp
+
 class RedClient(ClientNamespace):
     """Class for listening to data publised by green apple server.
+
+    The client asks for its three digit id on the console and prints the data
+    it receives, unless it is given the keywords `num_id` and `data_handler`,
+    a callable taking every received data, as done by the load test in
+    `benchmarks`.
     """
 
     def __init__(self, host=None, port=None, *args, **kwargs):
@@ -22,10 +31,17 @@ class RedClient(ClientNamespace):
         self.connect_url = f"http://{self.host}:{self.port}"
         self.client_namespace = kwargs.pop("client_namespace", "/")
         self.server_namespace = kwargs.pop("server_namespace", "/")
+        self.compression = ZLIB if kwargs.pop("compression", False) else None
+        reconnection = kwargs.pop("reconnection", False)
+        self.epoch = None               # Epoch of the last received data
+        self.last_seq = None            # Sequence number of the last data
+        self.traces = TraceRing(kwargs.pop("trace_ring_size", 1000))
+        num_id = kwargs.pop("num_id", None)
+        self.data_handler = kwargs.pop("data_handler", None) or self.print_data
         self.color = "RED"
-        self.numID = input("Hello RED, enter three digit ID: ")
+        self.numID = num_id or input("Hello RED, enter three digit ID: ")
         self.colID = self.color + self.numID
-        self.sio_client = Client(reconnection=False)
+        self.sio_client = Client(reconnection=reconnection)
         super(RedClient, self).__init__(namespace=self.client_namespace)
 
     def connect_to_server(self):
@@ -64,25 +80,68 @@ class RedClient(ClientNamespace):
         """
         self.sio_client.disconnect()
 
-    def pull_data(self):
+    def pull_data(self, redirect=None):
         """Pulls new data ready to be published by red apple server.
 
         This method gets invoked as a callback right after establishing new
         connection with apple server. It makes call to server methods so as
-        to retrieve published data.
+        to retrieve published data. If the room of the client is owned by
+        another red apple server, the client connects to that one instead. A
+        server admitting no more joins for now tells when to join again.
 
         :param self: The reference to class instance.
+        :param redirect: The optional dict with the ``node`` address of the
+                         red apple server owning the room, or the seconds
+                         after which to join again. For example:
+                            {"node": "10.0.0.2:6000"}
+                            {"retry_after": 0.25}
 
         :return: None
         """
-        self.sio_client.emit("new_data", namespace=self.server_namespace)
+        if redirect is not None and "retry_after" in redirect:
+            print(f"< Joining again in {redirect['retry_after']:.2f}s >")
+            self.sio_client.start_background_task(
+                self.join_later, redirect["retry_after"]
+            )
+            return
+        if redirect is None:
+            self.sio_client.emit("new_data", namespace=self.server_namespace)
+            return
+        print(f"< Moving to Red Apple Server '{redirect['node']}' >")
+        self.host, self.port = redirect["node"].rsplit(":", 1)
+        self.connect_url = f"http://{self.host}:{self.port}"
+        self.sio_client.start_background_task(self.reconnect_to_server)
+
+    def join_later(self, seconds):
+        """Joins the red apple server again after a delay.
+
+        :param self: The reference to class instance.
+        :param seconds: The number of seconds to wait for.
+
+        :return: None
+        """
+        self.sio_client.sleep(seconds)
+        if self.sio_client.connected:
+            self.join()
+
+    def reconnect_to_server(self):
+        """Disconnects and connects again to the current `connect_url`.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.disconnect_from_server()
+        self.connect_to_server()
 
     def on_connect(self):
         """Prints connection acknowledgement and starts listening for new data.
 
         This method gets invoked right before establishing a connection with
         the red apple server. It prints acknowledment and starts listening
-        for any new published data till server or client disconnects.
+        for any new published data till server or client disconnects. After a
+        reconnect, it joins with the last received sequence number so that the
+        server first sends the data it missed, see `join`.
 
         :param self: The reference to class instance. This will be used to call
                      the instance methods and to access the instance variables.
@@ -90,8 +149,20 @@ class RedClient(ClientNamespace):
         :return: None
         """
         print("<Connected to Red Apple Server >")
+        self.join()
+
+    def join(self):
+        """Joins the room of the client, calling `pull_data` as callback.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
         join_data = {
-            "id": self.numID
+            "id": self.numID,
+            "compression": self.compression,
+            "epoch": self.epoch,
+            "last_seq": self.last_seq
         }
         self.sio_client.emit(
             "join",
@@ -101,13 +172,15 @@ class RedClient(ClientNamespace):
         )
 
     def on_disconnect(self):
-        """Prints disconnect acknowledgement.
+        """Prints disconnect acknowledgement and the latencies of traces.
 
         :param self: The reference to class instance.
 
         :return: None
         """
         print("< Disconnected from Red Apple Server >")
+        if self.traces:
+            print("Traced latencies:", json.dumps(self.traces.dump()))
 
     def on_abort_connection(self, error):
         """Aborts connection and disconnects client from server.
@@ -134,13 +207,42 @@ class RedClient(ClientNamespace):
 
         :param self: The reference to class instance. This will be used to call
                      the instance methods and to access the instance variables.
-        :param data: The list of string messages from green clients which have
-                     been forwarded by red apple server.
+        :param data: The dict with the list of string messages from green
+                     clients which have been forwarded by red apple server,
+                     the epoch and sequence number of the first message, and
+                     a ``gap`` flag if some messages couldn't be resent after
+                     a reconnect. It is possibly compressed, and sampled
+                     messages are wrapped in trace envelopes, see
+                     `tracing.py`. For example:
+                        {"epoch": "9f1c...", "seq": 41, "data": ["data1"]}
+
+        :return: None
+        """
+        data = decompress(data)
+        if data.get("gap") or data["epoch"] != self.epoch:
+            if self.epoch is not None:
+                print("WARNING: Some messages were missed, reload needed.")
+            self.epoch = data["epoch"]
+            self.last_seq = data["seq"] - 1
+        for seq, _data in enumerate(data["data"], data["seq"]):
+            # Messages resent after a reconnect may already have arrived
+            if seq <= self.last_seq:
+                continue
+            if is_traced(_data):
+                self.traces.record(stamp(_data, RED_CLIENT))
+                _data = _data["data"]
+            self.data_handler(_data)
+            self.last_seq = seq
+
+    def print_data(self, data):
+        """Prints a received data, the default `data_handler`.
+
+        :param self: The reference to class instance.
+        :param data: The data published by the green client.
 
         :return: None
         """
-        for _data in data:
-            print("Received: ", _data)
+        print("Received: ", data)
 
     def run(self):
         """Runs instance of SocketIO client to connect to red apple server.
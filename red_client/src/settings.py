@@ -14,3 +14,9 @@ class RedClientConstants:
     red_server_nmsp = "/red"        # Namespace for connecting to red server
     red_server_port = "6000"        # Port for running red server
     red_server_host = "0.0.0.0"     # Host for running red server
+
+    compression = True              # Accept zipped broadcasts from red server
+    reconnection = True             # Reconnect and resume after network blips
+    trace_ring_size = 1000          # Traced messages kept for latencies
+
+    use_asyncio = False             # Run on asyncio instead of eventlet
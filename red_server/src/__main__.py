@@ -3,26 +3,94 @@
 
 This file additionally has the code for invoking a SocketIO client to listen to
 the data published by the Green-Apple server. The socket client and the running
-Red-Apple server exchange data using shared class variables.
+Red-Apple server exchange data using shared class variables and a message bus.
+With a `redis` bus, several red apple servers can run side by side, of which
+only one listens to the Green-Apple server (see `listen_to_green`). With
+`use_asyncio`, both run in one asyncio event loop instead of on eventlet. With
+the `shm` bus, the SocketIO client runs in a process of its own, started by
+running this file with the `--listener` option and stopped with the server.
+It is given the offset of the message log restored from a snapshot, and it
+sends its offset back over the bus, for the snapshots of the server.
 
 Author: sagarbhat94@gmail.com (Sagar Bhat)
 """
 
-from listener import Listener
-from server import RedAppleServer
+import os
+import signal
+import subprocess
+import sys
+
+# The modules shared by the components are kept in the `shared` directory
+sys.path.append(os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "shared"
+)))
+
 from settings import RedServerConstants as consts
+from settings import buffer_kwargs, bus_kwargs, listener_kwargs, server_kwargs
+
+if not consts.use_asyncio:
+    import eventlet
+    eventlet.monkey_patch()
+
+from bus import get_bus
+from datasource import SharedResource
+from shm import SHARED_MEMORY
+
+if consts.use_asyncio:
+    from async_listener import AsyncListener as Listener
+    from async_server import AsyncRedAppleServer as RedAppleServer
+else:
+    from listener import Listener
+    from server import RedAppleServer
+
+
+SharedResource.configure_buffers(**buffer_kwargs())
+listener_process = sys.argv[1:2] == ["--listener"]
+bus, bus_options = bus_kwargs()
+if bus == SHARED_MEMORY:
+    # The server creates the shared memory, which the listener attaches to
+    bus_options["owner"] = not listener_process
+SharedResource.configure_bus(get_bus(bus, **bus_options))
+SharedResource.configure_ring(consts.ring_nodes, consts.ring_vnodes)
+SharedResource.configure_metrics(consts.metrics_enabled)
+
+
+def run_listener():
+    """Runs the listener of the green apple server in the background.
+
+    :return: None
+    """
+    Listener(**listener_kwargs()).run()
+
+
+if listener_process:
+    if sys.argv[2:3]:
+        SharedResource.log_offset = int(sys.argv[2])
+    run_listener()
+    Listener.sio_client.wait()
+    sys.exit(0)
 
+# The server subscribes to the bus before the listener publishes any data
+server = RedAppleServer(**server_kwargs())
 
-Listener(
-    host=consts.grn_server_host,
-    port=consts.grn_server_port,
-    client_namespace=consts.grn_client_nmsp,
-    server_namespace=consts.grn_client_nmsp
-).run()
+listener = None
+if consts.listen_to_green and consts.bus == SHARED_MEMORY:
+    listener_args = ["--listener"]
+    if SharedResource.log_offset is not None:
+        listener_args.append(str(SharedResource.log_offset))
+    listener = subprocess.Popen([
+        sys.executable,
+        os.path.dirname(os.path.abspath(__file__)),
+        *listener_args
+    ])
+elif consts.listen_to_green:
+    run_listener()
 
-RedAppleServer(
-    host=consts.red_server_host,
-    port=consts.red_server_port,
-    client_namespace=consts.red_client_nmsp,
-    server_namespace=consts.red_client_nmsp
-).run()
+# Stop like on Ctrl-C, so that the last snapshot is written
+signal.signal(signal.SIGTERM, signal.default_int_handler)
+try:
+    server.run()
+finally:
+    if listener is not None:
+        listener.terminate()
+    SharedResource.bus.close()
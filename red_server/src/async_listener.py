@@ -0,0 +1,65 @@
+#!/bin/env python
+"""This file has the asyncio variant of the listener of the red apple server.
+
+It runs the event handlers of `Listener` on `socketio.AsyncClient`, see
+`aio.py`, in the event loop of the `AsyncRedAppleServer`. Polls are sent by a
+task awaiting the listen interval.
+"""
+
+import asyncio
+
+from aio import AsyncClientTransport
+from listener import Listener
+
+
+class AsyncListener(Listener):
+    """Class for listening to data published by green apple server on asyncio.
+
+    It takes the same arguments as `Listener`, and it is run before the
+    `AsyncRedAppleServer`, which starts the event loop.
+    """
+
+    def __init__(self, host=None, port=None, *args, **kwargs):
+        super(AsyncListener, self).__init__(host, port, *args, **kwargs)
+        self.sio_client = AsyncClientTransport(reconnection=True)
+
+    def connect_to_server(self):
+        """Starts a task connecting to the green apple server.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.sio_client.start_background_task(
+            self.sio_client.connect_and_wait,
+            self.connect_url,
+            [self.server_namespace],
+            "green server"
+        )
+
+    def on_listening(self):
+        """Starts a task listening for new published data.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.sio_client.start_background_task(self.listen_periodically)
+
+    async def listen_periodically(self):
+        """Requests new data in a loop till the connection is closed.
+
+        In push mode it only polls at the slower fallback interval. It stops
+        once the client reconnected, which starts another task.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        connection = self.connections
+        while self.sio_client.connected and connection == self.connections:
+            self.listen()
+            if self.push_active:
+                await asyncio.sleep(self.fallback_interval)
+            else:
+                await asyncio.sleep(self.listen_interval)
@@ -0,0 +1,187 @@
+#!/bin/env python
+"""This file has the asyncio variant of the red apple server.
+
+It runs the event handlers of `RedAppleServer` on `socketio.AsyncServer`, see
+`aio.py`. The dispatcher awaits an event set whenever new data is stored or a
+red client asks for the data of its room, instead of blocking on the condition
+of the shared resources. Only the in-memory bus is supported, so the server
+runs in the process of its `AsyncListener`.
+"""
+
+import asyncio
+import time
+
+from aiohttp import web
+
+from aio import AsyncServerTransport
+from bus import MEMORY
+from datasource import SharedResource as shared_db
+from metrics import CONTENT_TYPE
+from server import RedAppleServer
+
+
+class AsyncRedAppleServer(RedAppleServer):
+    """Class for the red apple server running on asyncio.
+
+    It takes the same arguments as `RedAppleServer`.
+    """
+
+    def __init__(self, host=None, port=None, *args, **kwargs):
+        if shared_db.bus.name != MEMORY:
+            raise ValueError(
+                f"The asyncio red server can't use the '{shared_db.bus.name}'"
+                " bus"
+            )
+        if kwargs.get("admin_token"):
+            raise ValueError("The admin routes need the eventlet red server")
+        self.new_data = None            # Set once data is pending
+        super(AsyncRedAppleServer, self).__init__(
+            host, port, *args, **kwargs
+        )
+
+    def create_app(self):
+        """Creates the `aiohttp` app and its Socket.IO server.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.sio_server = AsyncServerTransport()
+        self.app = self.sio_server.app
+
+    def add_route(self, path, view):
+        """Serves the response of a view on an HTTP route of the app.
+
+        :param self: The reference to class instance.
+        :param path: The path of the route, such as `/metrics`.
+        :param view: The callable returning the response.
+
+        :return: None
+        """
+        async def handler(request):
+            return view()
+
+        self.app.router.add_get(path, handler)
+
+    def session_id(self):
+        """Returns the session id of the client whose event is handled.
+
+        :param self: The reference to class instance.
+
+        :return: The session id.
+        """
+        return self.sio_server.sid
+
+    def on_metrics(self):
+        """Serves the shared metrics in the Prometheus text format.
+
+        :param self: The reference to class instance.
+
+        :return: The `aiohttp` response.
+        """
+        return web.Response(
+            body=shared_db.metrics.render().encode(),
+            headers={"Content-Type": CONTENT_TYPE}
+        )
+
+    def on_traces(self):
+        """Serves the latencies of the last traced messages as JSON.
+
+        :param self: The reference to class instance.
+
+        :return: The `aiohttp` response, see `TraceRing.dump`.
+        """
+        return web.json_response(self.traces.dump())
+
+    def wake_dispatcher(self):
+        """Wakes up the dispatcher to broadcast the pending rooms.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        if self.new_data is not None:
+            self.new_data.set()
+
+    def on_new_data(self):
+        """Requests delivery of the data stored for the room of the client.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        super(AsyncRedAppleServer, self).on_new_data()
+        self.wake_dispatcher()
+
+    def on_bus_message(self, message):
+        """Handles a message published on the bus, see `RedAppleServer`.
+
+        :param self: The reference to class instance.
+        :param message: The dict with the ``kind`` of message.
+
+        :return: None
+        """
+        super(AsyncRedAppleServer, self).on_bus_message(message)
+        if message["kind"] == "data":
+            self.wake_dispatcher()
+
+    async def dispatch_new_data(self):
+        """Broadcasts new data to the rooms whenever the dispatcher is woken.
+
+        The dispatcher wakes up once per second if unwatched data has to
+        expire, and collects more data for a `broadcast_batch_delay`, like
+        the one of `RedAppleServer`.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.new_data = asyncio.Event()
+        while True:
+            timeout = 1.0 if shared_db.new_published_data.ttl else None
+            try:
+                await asyncio.wait_for(self.new_data.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.new_data.clear()
+            pending_rooms = shared_db.wait_for_pending_rooms(timeout=0)
+            shared_db.expire_unsubscribed(self.presence.count)
+            if (pending_rooms and self.broadcast_batch_delay > 0
+                    and len(shared_db.new_published_data)
+                    < self.broadcast_batch_size):
+                await asyncio.sleep(self.broadcast_batch_delay)
+                pending_rooms = list(dict.fromkeys(
+                    pending_rooms + shared_db.wait_for_pending_rooms(timeout=0)
+                ))
+            self.broadcast_rooms(pending_rooms)
+
+    async def write_snapshots_periodically(self):
+        """Writes a snapshot every `snapshot_interval` seconds in a loop.
+
+        The state is copied in the event loop, and written in a thread of its
+        default executor, so that broadcasts go on meanwhile.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.snapshots.interval)
+            start = time.perf_counter()
+            await loop.run_in_executor(
+                None, self.snapshots.write, self.snapshot_state()
+            )
+            self.snapshot_seconds.observe(time.perf_counter() - start)
+
+    async def announce_presence_periodically(self):
+        """Announces the watched rooms and forgets silent nodes in a loop.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.presence_interval)
+            self.announce_presence()
+            self.update_remote_rooms()
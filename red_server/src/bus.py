@@ -0,0 +1,218 @@
+#!/bin/env python
+"""This file has the message buses connecting red apple server processes.
+
+The `Listener` publishes the data received from the green apple server and the
+active green ids on a bus, and every red apple server subscribed to the bus
+stores them for its own red clients. Red apple servers also announce on the bus
+which rooms have red clients, see `RedAppleServer.on_bus_message`. Messages are
+JSON serializable dicts with a ``kind``. For example:
+
+    {"kind": "data", "data": [("123", "data1"), ("456", "data2")]}
+
+The `memory` bus delivers messages within one process, where the listener and
+the server share the bus. The `redis` bus delivers them through the publish and
+subscribe channels of a Redis compatible broker, so that several red apple
+server processes share the red clients, with only one of them listening to the
+green apple server. It needs the `redis` package. The `shm` bus connects a
+listener and a red apple server running in two processes on one host through
+shared memory, see `shm.py`.
+
+A message published with a ``retain`` key replaces the earlier message with the
+same key, and is delivered first to every new subscriber. For example the
+roster is retained, so that a red apple server started later knows the active
+ids.
+
+A message published with a ``topic`` is only delivered to the subscribers of
+that topic, while every subscriber receives the messages without topic. For
+example the data of a room is only published for the node owning the room,
+see `ring.py`.
+"""
+
+import json
+
+from shm import SharedMemoryBus
+
+MEMORY, REDIS = "memory", "redis"
+
+
+class MemoryBus:
+    """Class for the bus within one process, calling subscribers directly.
+    """
+    name = MEMORY
+
+    def __init__(self):
+        self.subscribers = []
+        self.retained = {}
+
+    def publish(self, message, retain=None, topic=None):
+        """Delivers a message to every subscriber.
+
+        :param self: The reference to class instance.
+        :param message: The dict to be delivered.
+        :param retain: The optional key under which the message is retained.
+        :param topic: The optional topic of the message.
+
+        :return: None
+        """
+        if retain is not None:
+            self.retained[retain] = message
+        for (callback, topics) in self.subscribers:
+            if topic is None or topic in topics:
+                callback(message)
+
+    def subscribe(self, callback, start_task=None, topics=()):
+        """Delivers the retained messages and then every published message.
+
+        :param self: The reference to class instance.
+        :param callback: The callable receiving every message.
+        :param start_task: Unused, as messages are delivered by `publish`.
+        :param topics: The topics of the messages delivered besides the
+                       messages without topic.
+
+        :return: None
+        """
+        for message in list(self.retained.values()):
+            callback(message)
+        self.subscribers.append((callback, frozenset(topics)))
+
+    def close(self):
+        """Removes all subscribers.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.subscribers.clear()
+
+
+class RedisBus:
+    """Class for the bus through a channel of a Redis compatible broker.
+
+    :param self: The reference to class instance.
+    :param url: The URL of the broker, such as `redis://127.0.0.1:6379/0`.
+    :param channel: The name of the channel. Retained messages are kept in a
+                    hash named after the channel with a `:retained` suffix,
+                    and messages of a topic are published on the channel
+                    named after the channel with the topic as suffix.
+    """
+    name = REDIS
+
+    def __init__(self, url="redis://127.0.0.1:6379/0", channel="red_apple"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                "The 'redis' bus needs the optional 'redis' package, see "
+                "requirements.txt"
+            ) from None
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+        self.retained_key = f"{channel}:retained"
+        self.pubsubs = []               # One connection per subscriber
+
+    def channel_of(self, topic):
+        """Returns the name of the channel of a topic.
+
+        :param self: The reference to class instance.
+        :param topic: The topic, or `None` for messages without topic.
+
+        :return: The name of the channel.
+        """
+        if topic is None:
+            return self.channel
+        return f"{self.channel}:{topic}"
+
+    def publish(self, message, retain=None, topic=None):
+        """Publishes a message on the channel of its topic.
+
+        :param self: The reference to class instance.
+        :param message: The JSON serializable dict to be delivered.
+        :param retain: The optional key under which the message is retained.
+        :param topic: The optional topic of the message.
+
+        :return: None
+        """
+        raw = json.dumps(message)
+        if retain is None:
+            self.client.publish(self.channel_of(topic), raw)
+            return
+        with self.client.pipeline() as pipe:
+            pipe.hset(self.retained_key, retain, raw)
+            pipe.publish(self.channel_of(topic), raw)
+            pipe.execute()
+
+    def subscribe(self, callback, start_task, topics=()):
+        """Delivers the retained messages and then every published message.
+
+        The channel is subscribed before the retained messages are read, so
+        that no message published meanwhile is lost. A retained message may
+        thus be delivered twice.
+
+        :param self: The reference to class instance.
+        :param callback: The callable receiving every message.
+        :param start_task: The callable starting the background task which
+                           receives messages, such as the
+                           `start_background_task` method of SocketIO objects.
+        :param topics: The topics of the messages delivered besides the
+                       messages without topic.
+
+        :return: None
+        """
+        channels = [self.channel] + [self.channel_of(t) for t in topics]
+        pubsub = self.client.pubsub()
+        pubsub.subscribe(*channels)
+        confirmed = 0
+        for item in pubsub.listen():
+            if item["type"] == "subscribe":
+                confirmed += 1
+            if confirmed == len(channels):
+                break
+        self.pubsubs.append(pubsub)
+        for raw in self.client.hvals(self.retained_key):
+            callback(json.loads(raw))
+        start_task(self.receive, pubsub, callback)
+
+    @staticmethod
+    def receive(pubsub, callback):
+        """Delivers the messages of the channels till the bus is closed.
+
+        :param pubsub: The subscribed `PubSub` connection.
+        :param callback: The callable receiving every message.
+
+        :return: None
+        """
+        for item in pubsub.listen():
+            if item["type"] == "message":
+                callback(json.loads(item["data"]))
+
+    def close(self):
+        """Unsubscribes every subscriber from the channels.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        for pubsub in self.pubsubs:
+            pubsub.close()
+        self.pubsubs.clear()
+
+
+BUSES = {
+    bus.name: bus for bus in (MemoryBus, RedisBus, SharedMemoryBus)
+}
+
+
+def get_bus(name, **kwargs):
+    """Creates a bus by its name.
+
+    :param name: The name of the bus, either `memory`, `redis` or `shm`.
+    :param kwargs: The keyword arguments of the bus class, such as the `url`
+                   of the `redis` bus or the `owner` of the `shm` bus.
+
+    :return: The bus instance.
+    """
+    try:
+        bus_class = BUSES[name]
+    except KeyError:
+        raise ValueError(f"Unknown bus '{name}'") from None
+    return bus_class(**kwargs)
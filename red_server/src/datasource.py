@@ -7,7 +7,13 @@ exchanged between various red apple server components.
 Author: sagarbhat94@gmail.com (Sagar Bhat)
 """
 
-from collections import defaultdict
+import uuid
+from threading import Condition
+
+from buffers import RoomBuffers
+from bus import MemoryBus
+from metrics import MetricsRegistry
+from ring import HashRing
 
 
 class SharedResource:
@@ -18,8 +24,189 @@ class SharedResource:
     has variables updated and accessed during the `RedClient-RedAppleServer`
     connection and also during `RedAppleServer-GreenAppleServer` connection.
 
+    The `listener` stores new data through `publish`, which marks the rooms as
+    pending and wakes up the dispatcher of the `server` waiting in the method
+    `wait_for_pending_rooms`. The data of every room is held in a bounded
+    buffer, see `configure_buffers`.
+
+    The `listener` hands new data and the active green ids to the `server`
+    through the message `bus`, see `configure_bus`. With the default in-memory
+    bus, both run in the same process. Every process has its own `node_id`.
+    With a `ring` of red apple servers, the data of every room is only
+    published for the red apple server owning the room, see `configure_ring`.
+    Both components record their counters and timings in the `metrics`, see
+    `configure_metrics`. The active green ids, the offset of the message log
+    and the pending data are kept across restarts by `dump` and `restore`.
+
     Note: This should later be replaced by a database or similar.
     """
-    active_green_ids = []
+    active_green_ids = set()
+    roster_version = None           # Version of the active ids, if known
+    log_offset = None               # Offset in message log of green server
     green_server_connected = False
-    new_published_data = defaultdict(list)
+    new_published_data = RoomBuffers()
+    pending_rooms = {}              # Rooms with new data, in order of arrival
+    new_data_condition = Condition()
+    bus = MemoryBus()
+    node_id = uuid.uuid4().hex      # Tells apart the red server processes
+    ring = None                     # Owners of the rooms, if partitioned
+    metrics = MetricsRegistry("red_apple")
+
+    @classmethod
+    def configure_metrics(cls, enabled=True):
+        """Replaces the metrics registry by an empty one.
+
+        This has to be called before the `server` and `listener` are created,
+        as they create their metrics on instantiation.
+
+        :param cls: The reference to the class.
+        :param enabled: Boolean, whether metrics are recorded and served.
+
+        :return: None
+        """
+        cls.metrics = MetricsRegistry("red_apple", enabled=enabled)
+
+    @classmethod
+    def configure_bus(cls, bus):
+        """Replaces the message bus between the `listener` and the `server`.
+
+        :param cls: The reference to the class.
+        :param bus: The bus instance, see `bus.get_bus`.
+
+        :return: None
+        """
+        cls.bus = bus
+
+    @classmethod
+    def configure_ring(cls, nodes, vnodes=100):
+        """Partitions the rooms over red apple servers by consistent hashing.
+
+        :param cls: The reference to the class.
+        :param nodes: The list of addresses of the red apple servers, such as
+                      `"10.0.0.2:6000"`. An empty list disables partitioning.
+        :param vnodes: The number of virtual nodes of every server.
+
+        :return: None
+        """
+        cls.ring = HashRing(nodes, vnodes) if nodes else None
+
+    @classmethod
+    def configure_buffers(cls, **kwargs):
+        """Replaces the buffers of new data by empty buffers with new limits.
+
+        :param cls: The reference to the class.
+        :param kwargs: The keyword arguments of `RoomBuffers`, such as the
+                       `room_capacity`, `total_capacity`, `policy` and `ttl`.
+
+        :return: None
+        """
+        with cls.new_data_condition:
+            cls.new_published_data = RoomBuffers(**kwargs)
+
+    @classmethod
+    def publish(cls, new_data):
+        """Stores new data of rooms and notifies the waiting dispatcher.
+
+        :param cls: The reference to the class.
+        :param new_data: The list of tuples of room id and data. For example:
+                            [("123", "data1"), ("456", "data2")]
+
+        :return: None
+        """
+        with cls.new_data_condition:
+            for (room_id, data) in new_data:
+                cls.new_published_data.append(room_id, data)
+                cls.pending_rooms[room_id] = None
+            cls.new_data_condition.notify_all()
+
+    @classmethod
+    def notify_room(cls, room_id):
+        """Marks a room as pending so that its stored data gets dispatched.
+
+        :param cls: The reference to the class.
+        :param room_id: The three digit id of the room.
+
+        :return: None
+        """
+        with cls.new_data_condition:
+            cls.pending_rooms[room_id] = None
+            cls.new_data_condition.notify_all()
+
+    @classmethod
+    def wait_for_pending_rooms(cls, timeout=None):
+        """Blocks till at least one room has new data and returns the rooms.
+
+        :param cls: The reference to the class.
+        :param timeout: The optional number of seconds to wait for.
+
+        :return: The list of pending room ids in order of arrival. It is empty
+                 if the timeout expired.
+        """
+        with cls.new_data_condition:
+            if not cls.pending_rooms:
+                cls.new_data_condition.wait(timeout)
+            rooms = list(cls.pending_rooms)
+            cls.pending_rooms.clear()
+        return rooms
+
+    @classmethod
+    def take_room_data(cls, room_id):
+        """Removes and returns all the stored data of a room.
+
+        :param cls: The reference to the class.
+        :param room_id: The three digit id of the room.
+
+        :return: The list of data in order of arrival.
+        """
+        with cls.new_data_condition:
+            return cls.new_published_data.take(room_id)
+
+    @classmethod
+    def expire_unsubscribed(cls, is_subscribed):
+        """Expires old data of rooms without subscribers, see `RoomBuffers`.
+
+        :param cls: The reference to the class.
+        :param is_subscribed: The callable returning whether a room id has
+                              subscribers.
+
+        :return: Integer count of expired items.
+        """
+        with cls.new_data_condition:
+            return cls.new_published_data.expire(is_subscribed)
+
+    @classmethod
+    def dump(cls):
+        """Returns the shared state to be kept across restarts.
+
+        :param cls: The reference to the class.
+
+        :return: A dict of JSON values. For example:
+                    {
+                        "active_green_ids": ["123", "456"],
+                        "log_offset": 1024,
+                        "pending_data": [("123", "data1")]
+                    }
+        """
+        with cls.new_data_condition:
+            return {
+                "active_green_ids": sorted(cls.active_green_ids),
+                "log_offset": cls.log_offset,
+                "pending_data": cls.new_published_data.peek_all()
+            }
+
+    @classmethod
+    def restore(cls, state):
+        """Restores the shared state dumped before a restart.
+
+        The roster version stays unknown, so that the listener still asks the
+        green apple server for the active green ids once it connects.
+
+        :param cls: The reference to the class.
+        :param state: The dict returned by `dump`.
+
+        :return: None
+        """
+        with cls.new_data_condition:
+            cls.active_green_ids = set(state["active_green_ids"])
+            cls.log_offset = state["log_offset"]
+            cls.new_published_data.extend(state["pending_data"])
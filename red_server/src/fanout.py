@@ -0,0 +1,174 @@
+#!/bin/env python
+"""This file has the outbound queues of the broadcasts sent to every session.
+
+Every session has a queue of broadcasts waiting to be sent and a window of
+broadcasts sent but not acknowledged yet. A session which doesn't acknowledge
+its broadcasts fast enough only fills its own queue, so one slow red client
+can't hold back the other red clients of its room. When a queue reaches its
+high-water mark, the slow-consumer policy either drops the oldest queued
+broadcast, conflates the queued broadcasts into the newest one, or has the
+session disconnected. Dropped broadcasts are counted per session.
+"""
+
+from collections import Counter, deque
+
+DROP_OLDEST = "drop_oldest"
+CONFLATE = "conflate"
+DISCONNECT = "disconnect"
+
+
+class OutboundQueues:
+    """Class for the outbound queues of the connected sessions.
+
+    :param self: The reference to class instance.
+    :param send: The callable sending a broadcast to a session. It is called
+                 with the session id, the queued broadcast, a Boolean telling
+                 whether broadcasts were dropped before this one, and the
+                 callable to be called once the session acknowledged it.
+    :param high_water: The maximum number of queued broadcasts per session.
+    :param policy: Either `drop_oldest`, `conflate` or `disconnect`, to decide
+                   what happens to a session whose queue is full. Defaults to
+                   `drop_oldest`.
+    :param window: The maximum number of unacknowledged broadcasts per session.
+    """
+
+    def __init__(self, send, high_water=1000, policy=DROP_OLDEST, window=10):
+        if policy not in (DROP_OLDEST, CONFLATE, DISCONNECT):
+            raise ValueError(f"Unknown slow consumer policy '{policy}'")
+        self.send = send
+        self.high_water = high_water
+        self.policy = policy
+        self.window = window
+        self.queues = {}                # Session id -> deque of broadcasts
+        self.in_flight = {}             # Session id -> unacknowledged count
+        self.gaps = set()               # Sessions which missed broadcasts
+        self.dropped = Counter()        # Session id -> dropped broadcasts
+        self.dropped_total = Counter()  # Policy -> dropped broadcasts
+        self.disconnected = 0
+
+    def __len__(self):
+        return len(self.queues)
+
+    def open(self, sid):
+        """Creates the empty queue of a session.
+
+        :param self: The reference to class instance.
+        :param sid: The session id.
+
+        :return: None
+        """
+        self.queues.setdefault(sid, deque())
+        self.in_flight.setdefault(sid, 0)
+
+    def close(self, sid):
+        """Removes the queue of a session with the broadcasts in it.
+
+        :param self: The reference to class instance.
+        :param sid: The session id.
+
+        :return: None
+        """
+        self.queues.pop(sid, None)
+        self.in_flight.pop(sid, None)
+        self.gaps.discard(sid)
+        self.dropped.pop(sid, None)
+
+    def depth(self, sid):
+        """Returns the number of queued and unacknowledged broadcasts.
+
+        :param self: The reference to class instance.
+        :param sid: The session id.
+
+        :return: Integer count of broadcasts.
+        """
+        return len(self.queues.get(sid, ())) + self.in_flight.get(sid, 0)
+
+    def _drop(self, sid, count):
+        self.dropped[sid] += count
+        self.dropped_total[self.policy] += count
+        self.gaps.add(sid)
+
+    def push(self, sid, broadcast):
+        """Queues a broadcast for a session and sends what the window allows.
+
+        :param self: The reference to class instance.
+        :param sid: The session id.
+        :param broadcast: The broadcast to be sent. It is shared by all the
+                          sessions of a room and must not be modified.
+
+        :return: Boolean, `False` if the session has to be disconnected by the
+                 `disconnect` policy. Its queue is closed then.
+        """
+        queue = self.queues.get(sid)
+        if queue is None:
+            return True
+        if len(queue) >= self.high_water:
+            if self.policy == DISCONNECT:
+                self.dropped_total[DISCONNECT] += len(queue) + 1
+                self.disconnected += 1
+                self.close(sid)
+                return False
+            if self.policy == DROP_OLDEST:
+                queue.popleft()
+                self._drop(sid, 1)
+            else:
+                # The newest broadcast replaces all the queued ones
+                self._drop(sid, len(queue))
+                queue.clear()
+        queue.append(broadcast)
+        self.pump(sid)
+        return True
+
+    def pump(self, sid):
+        """Sends queued broadcasts of a session till its window is full.
+
+        :param self: The reference to class instance.
+        :param sid: The session id.
+
+        :return: None
+        """
+        queue = self.queues.get(sid)
+        while queue and self.in_flight[sid] < self.window:
+            broadcast = queue.popleft()
+            gap = sid in self.gaps
+            self.gaps.discard(sid)
+            self.in_flight[sid] += 1
+            self.send(sid, broadcast, gap, lambda *_, sid=sid: self.ack(sid))
+
+    def ack(self, sid):
+        """Takes an acknowledged broadcast out of the window of a session.
+
+        :param self: The reference to class instance.
+        :param sid: The session id.
+
+        :return: None
+        """
+        if not self.in_flight.get(sid):
+            return
+        self.in_flight[sid] -= 1
+        self.pump(sid)
+
+    def stats(self):
+        """Returns the queue depth and dropped broadcasts of every session.
+
+        :param self: The reference to class instance.
+
+        :return: A dict of counters. For example:
+                    {
+                        "sessions": 2,
+                        "max_depth": 7,
+                        "depth": {"a1b2...": 7, "c3d4...": 0},
+                        "dropped": {"drop_oldest": 3},
+                        "dropped_per_session": {"a1b2...": 3},
+                        "disconnected": 0
+                    }
+        """
+        depth = {sid: self.depth(sid) for sid in self.queues}
+        return {
+            "sessions": len(self.queues),
+            "max_depth": max(depth.values(), default=0),
+            "depth": depth,
+            "dropped": dict(self.dropped_total),
+            "dropped_per_session": dict(self.dropped),
+            "disconnected": self.disconnected,
+        }
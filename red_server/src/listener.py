@@ -7,19 +7,29 @@ of instance methods to listen to data published by the green apple server.
 Author: sagarbhat94@gmail.com (Sagar Bhat)
 """
 
+import os
 import sys
+import time
 
 from socketio import Client, ClientNamespace
 from socketio import exceptions as sio_exceptions
 
+from codec import decode_payload
+from compression import ZLIB, decompress
 from datasource import SharedResource as shared_db
+from shm import SHARED_MEMORY
+from tracing import RED_LISTENER, is_traced, stamp
 
 
 class Listener(ClientNamespace):
     """Class for listening to data publised by green apple server.
+
+    The client reconnects after the connection drops, such as when the green
+    apple server restarts, with a growing delay between attempts, and resumes
+    from the last received offset of the message log every time.
     """
 
-    sio_client = Client(reconnection=False)
+    sio_client = Client(reconnection=True)
 
     def __init__(self, host=None, port=None, *args, **kwargs):
         self.host = host or "0.0.0.0"
@@ -27,7 +37,98 @@ class Listener(ClientNamespace):
         self.connect_url = f"http://{self.host}:{self.port}"
         self.client_namespace = kwargs.pop("client_namespace", "/")
         self.server_namespace = kwargs.pop("server_namespace", "/")
+        self.push_enabled = kwargs.pop("push_enabled", False)
+        self.listen_interval = kwargs.pop("listen_interval", 0.5)
+        self.fallback_interval = kwargs.pop("fallback_interval", 5.0)
+        self.codec = kwargs.pop("codec", "json")
+        self.compression = ZLIB if kwargs.pop("compression", False) else None
+        self.interest_filtering = kwargs.pop("interest_filtering", False)
+        self.presence_interval = kwargs.pop("presence_interval", 5.0)
+        self.tracing = kwargs.pop("tracing", False)
+        self.offset_path = kwargs.pop("offset_path", None)
+        self.offset_sync_interval = kwargs.pop("offset_sync_interval", 1.0)
+        self.offset_synced_at = 0.0
+        self.connections = 0            # Number of connects, including again
+        self.node_rooms = {}            # Node id -> (expiry, watched rooms)
+        self.interest = set()           # Rooms watched on any red server
+        self.push_active = False
+        self.data_received = shared_db.metrics.counter(
+            "data_received_total", "Data received from the green server."
+        ).labels()
+        self.round_trip = shared_db.metrics.histogram(
+            "green_round_trip_seconds",
+            "Time from a request to the green server till its response.",
+            ("event",)
+        )
         super(Listener, self).__init__(namespace=self.client_namespace)
+        self.load_offset()
+
+    def load_offset(self):
+        """Resumes from the offset of the message log saved in `offset_path`.
+
+        The offset saved by an earlier run is only used if it is later than
+        the offset already known, such as one restored from a snapshot.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        if self.offset_path is None:
+            return
+        try:
+            with open(self.offset_path) as offset_file:
+                offset = int(offset_file.read())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as ex:
+            print(f"WARNING: Offset file '{self.offset_path}' unusable ({ex})")
+            return
+        shared_db.log_offset = max(offset, shared_db.log_offset or 0)
+
+    def update_offset(self, offset, replayed=False):
+        """Records the offset of the message log up to which data arrived.
+
+        The offset is saved in `offset_path` and published on the bus at most
+        once per `offset_sync_interval`, so that a restarted red apple server
+        resumes close to where it stopped, possibly receiving some data twice.
+        Published, it reaches the snapshots of a red apple server running in
+        another process, such as with the `shm` bus.
+
+        :param self: The reference to class instance.
+        :param offset: The offset received from the green apple server.
+        :param replayed: Boolean, `True` for the offset of a replayed page,
+                         which replaces the known offset even if it is
+                         earlier, as the message log may have been replaced.
+
+        :return: None
+        """
+        if not replayed:
+            offset = max(offset, shared_db.log_offset or 0)
+        shared_db.log_offset = offset
+        now = time.monotonic()
+        if now - self.offset_synced_at >= self.offset_sync_interval:
+            self.offset_synced_at = now
+            self.save_offset()
+            shared_db.bus.publish({
+                "kind": "offset", "node": shared_db.node_id, "offset": offset
+            })
+
+    def save_offset(self):
+        """Writes the known offset of the message log to `offset_path`.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        if self.offset_path is None or shared_db.log_offset is None:
+            return
+        temporary = f"{self.offset_path}.tmp"
+        try:
+            with open(temporary, "w") as offset_file:
+                offset_file.write(str(shared_db.log_offset))
+            os.replace(temporary, self.offset_path)
+        except OSError as ex:
+            print(f"WARNING: Offset '{self.offset_path}' not saved ({ex})")
 
     def connect_to_server(self):
         """Creates a connection with the green apple server.
@@ -43,7 +144,7 @@ class Listener(ClientNamespace):
         :return: None
         """
         try:
-            Listener.sio_client.connect(
+            self.sio_client.connect(
                 self.connect_url, namespaces=[self.server_namespace]
             )
         except sio_exceptions.BadNamespaceError as ex:
@@ -53,6 +154,23 @@ class Listener(ClientNamespace):
             print(f"ERROR: {ex} (green server unreachable or not running)")
             sys.exit(1)
 
+    def timed_callback(self, event, callback):
+        """Returns a callback which records the round trip of a request.
+
+        :param self: The reference to class instance.
+        :param event: The name of the request event.
+        :param callback: The callback handling the response.
+
+        :return: The callback to be passed to `emit`.
+        """
+        sent_at = time.perf_counter()
+
+        def on_response(*args):
+            self.round_trip.observe(time.perf_counter() - sent_at, event)
+            return callback(*args)
+
+        return on_response
+
     def disconnect_from_server(self):
         """Closes client connection to the green apple server.
 
@@ -64,14 +182,18 @@ class Listener(ClientNamespace):
         :return: None
         """
         print("< Disconnecting >")
-        Listener.sio_client.disconnect()
+        self.sio_client.disconnect()
 
     def on_connect(self):
         """Prints connection acknowledgement and starts listening for new data.
 
         This method gets invoked right before establishing a connection with
-        the green apple server. It prints acknowledment and starts listening
-        for any new published data till server or client disconnects.
+        the green apple server. It prints acknowledment, requests a snapshot of
+        the active green clients, tells the rooms watched by red clients if
+        interest filtering is enabled, resumes from the last received offset of
+        the message log if it is known, subscribes for pushed data if push mode
+        is enabled and starts listening for any new published data till server
+        or client disconnects. It runs again on every reconnect.
 
         :param self: The reference to class instance. This will be used to call
                      the instance methods and to access the instance variables.
@@ -80,6 +202,23 @@ class Listener(ClientNamespace):
         """
         print("< Connected to Green Apple Server >")
         shared_db.green_server_connected = True
+        self.connections += 1
+        self.request_roster_snapshot()
+        if self.interest_filtering:
+            self.sio_client.emit(
+                "interest",
+                {"rooms": sorted(self.interest)},
+                namespace=self.server_namespace
+            )
+        if shared_db.log_offset is not None:
+            self.resume_from_offset(shared_db.log_offset)
+        if self.push_enabled:
+            self.sio_client.emit(
+                "subscribe",
+                {"codec": self.codec, "compression": self.compression},
+                callback=self.timed_callback("subscribe", self.set_push_mode),
+                namespace=self.server_namespace
+            )
         self.on_listening()
 
     def on_disconnect(self):
@@ -87,69 +226,301 @@ class Listener(ClientNamespace):
 
         This method gets invoked right before disconnecting a client from the
         server. It updates the boolean flag of shared data resource to notify
-        that it cannot listen to the server anymore due to closed connection.
+        that it cannot listen to the server anymore due to closed connection,
+        till the client reconnects.
 
         :param self: The reference to class instance.
 
         :return: None
         """
         shared_db.green_server_connected = False
+        shared_db.roster_version = None
+        self.save_offset()
+        self.push_active = False
         print("< Disconnected from Green Apple Server >")
 
+    def set_push_mode(self, accepted):
+        """Switches to push mode if the green apple server accepted it.
+
+        This method gets invoked as a callback of the `subscribe` request. Once
+        push mode is active, polling is only kept as a slow fallback.
+
+        :param self: The reference to class instance.
+        :param accepted: Boolean, whether the subscription was accepted.
+
+        :return: None
+        """
+        self.push_active = bool(accepted)
+
+    def on_push_data(self, data):
+        """Receives data pushed by green apple server and acknowledges it.
+
+        :param self: The reference to class instance.
+        :param data: The dict of roster changes and new published data, in
+                     the same format as for `parse_new_data`.
+
+        :return: Boolean `True` as acknowledgement to green apple server.
+        """
+        self.parse_new_data(data)
+        return True
+
     def parse_new_data(self, data):
         """Updates the shared data resource with the published data.
 
         This method gets invoked as a callback right after detecting new data
         published by green apple server. It updates  the shared data resource
-        with the green client id and its corresponding data.
+        with the green client id and its corresponding data, which wakes up the
+        red apple servers owning the rooms through the bus, applies the roster
+        changes and keeps the offset of the message log to resume from after a
+        reconnect. Sampled messages are stamped with their arrival time when
+        tracing.
 
         :param self: The reference to class instance.
-        :param data: The dict of all active green client ids and new published
-                     data as a list of tuple. For example:
+        :param data: The dict of roster changes and new published data as a
+                     list of tuple, or the same dict packed by the binary
+                     codec, and possibly compressed. For example:
                         {
                             "data": [("123", "data1"), ("456", "data2")],
-                            "active": ["123", "456", "789"]
+                            "roster": {"version": 7, "changes": []}
                         }
 
         :return: None
         """
-        shared_db.active_green_ids = data["active"]
+        data = decode_payload(decompress(data))
+        self.apply_roster(data.get("roster"))
+        if data.get("offset") is not None and "done" not in data:
+            self.update_offset(data["offset"])
         if not data["data"]:
             return
-        for (room_id, new_data) in data["data"]:
-            shared_db.new_published_data[room_id].append(new_data)
+        self.data_received.inc(amount=len(data["data"]))
+        if self.tracing:
+            for (_, item) in data["data"]:
+                if is_traced(item):
+                    stamp(item, RED_LISTENER)
+        if shared_db.ring is None:
+            shared_db.bus.publish({"kind": "data", "data": data["data"]})
+            return
+        # Every red apple server only receives the data of its own rooms
+        node_data = {}
+        for item in data["data"]:
+            node = shared_db.ring.node_for(item[0])
+            node_data.setdefault(node, []).append(item)
+        for node, new_data in node_data.items():
+            shared_db.bus.publish(
+                {"kind": "data", "data": new_data}, topic=node
+            )
+
+    def resume_from_offset(self, offset):
+        """Requests the replay of the messages logged since an offset.
+
+        :param self: The reference to class instance.
+        :param offset: The offset of the message log to resume from.
+
+        :return: None
+        """
+        print(f"< Resuming from offset {offset} >")
+        self.sio_client.emit(
+            "resume",
+            {
+                "offset": offset,
+                "codec": self.codec,
+                "compression": self.compression
+            },
+            callback=self.timed_callback("resume", self.parse_replayed_data),
+            namespace=self.server_namespace
+        )
+
+    def parse_replayed_data(self, data):
+        """Stores a page of replayed messages and requests the next one.
+
+        :param self: The reference to class instance.
+        :param data: The replayed payload, in the same format as for
+                     `parse_new_data`, with the flag ``done`` set on the last
+                     page.
+
+        :return: None
+        """
+        data = decode_payload(decompress(data))
+        self.parse_new_data(data)
+        if data["offset"] is not None:
+            self.update_offset(data["offset"], replayed=True)
+        if not data["done"]:
+            self.resume_from_offset(data["offset"])
+
+    def apply_roster(self, roster):
+        """Updates the active green client ids from a roster update.
+
+        A roster update is either a full snapshot of the active ids or a list
+        of join and leave changes, each tagged with its roster version. If the
+        changes don't continue from the version known to the listener, some
+        update went missing, and a new snapshot is requested. The updated ids
+        are published on the bus for the red apple servers.
+
+        :param self: The reference to class instance.
+        :param roster: The dict of roster version and either the ``active`` ids
+                       or the ``changes``. For example:
+                        {"version": 7, "active": ["123", "456"]}
+                        {"version": 7, "changes": [(7, "join", "456")]}
+
+        :return: None
+        """
+        if not roster:
+            return
+        known_version = shared_db.roster_version
+        if "active" in roster:
+            shared_db.active_green_ids = set(roster["active"])
+            shared_db.roster_version = roster["version"]
+        elif known_version is not None:
+            self.apply_roster_changes(roster)
+        if shared_db.roster_version != known_version:
+            shared_db.bus.publish(
+                {
+                    "kind": "roster",
+                    "node": shared_db.node_id,
+                    "active": sorted(shared_db.active_green_ids)
+                },
+                retain="roster"
+            )
+
+    def apply_roster_changes(self, roster):
+        """Applies join and leave changes following the known roster version.
+
+        :param self: The reference to class instance.
+        :param roster: The dict of roster version and ``changes``.
+
+        :return: None
+        """
+        for (version, change, green_id) in roster["changes"]:
+            if version <= shared_db.roster_version:
+                continue
+            if version != shared_db.roster_version + 1:
+                self.request_roster_snapshot()
+                return
+            if change == "join":
+                shared_db.active_green_ids.add(green_id)
+            else:
+                shared_db.active_green_ids.discard(green_id)
+            shared_db.roster_version = version
+        if roster["version"] > shared_db.roster_version:
+            self.request_roster_snapshot()
+
+    def on_bus_message(self, message):
+        """Keeps track of the rooms watched by the red apple servers.
+
+        :param self: The reference to class instance.
+        :param message: The dict published on the bus. Only presence messages
+                        of the red apple servers are used, see
+                        `RedAppleServer.on_bus_message`.
+
+        :return: None
+        """
+        if message["kind"] != "presence":
+            return
+        self.node_rooms[message["node"]] = (
+            time.monotonic() + 3 * self.presence_interval,
+            frozenset(message["rooms"])
+        )
+        self.update_interest()
+
+    def update_interest(self):
+        """Tells the green apple server the changes of the watched rooms.
+
+        Red apple servers which didn't announce their rooms for three presence
+        intervals are forgotten. Without interest filtering, the watched rooms
+        are only kept.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        now = time.monotonic()
+        for node_id, (expires_at, _) in list(self.node_rooms.items()):
+            if expires_at < now:
+                del self.node_rooms[node_id]
+        interest = set().union(
+            *(rooms for (_, rooms) in self.node_rooms.values())
+        )
+        added, removed = interest - self.interest, self.interest - interest
+        self.interest = interest
+        if not self.interest_filtering:
+            return
+        if (added or removed) and self.sio_client.connected:
+            self.sio_client.emit(
+                "interest",
+                {"add": sorted(added), "remove": sorted(removed)},
+                namespace=self.server_namespace
+            )
+
+    def request_roster_snapshot(self):
+        """Requests a full snapshot of the active green clients.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.sio_client.emit(
+            "roster",
+            callback=self.timed_callback("roster", self.apply_roster),
+            namespace=self.server_namespace
+        )
+
+    def listen(self):
+        """Requests the data published since the last request.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.sio_client.emit(
+            "listen",
+            {
+                "roster_version": shared_db.roster_version,
+                "codec": self.codec,
+                "compression": self.compression
+            },
+            callback=self.timed_callback("listen", self.parse_new_data),
+            namespace=self.server_namespace
+        )
 
     def on_listening(self):
         """Listens for any new published data forwarded by green apple server.
 
         This method gets invoked right after connecting with the green apple
         server and listens for published data continuously till connection is
-        alive.
+        alive. In push mode it only polls at the slower fallback interval. It
+        stops once the client reconnected, which listens again by itself.
 
         :param self: The reference to class instance. This will be used to call
                      the instance methods and to access the instance variables.
 
         :return: None
         """
-        while Listener.sio_client.connected:
-            Listener.sio_client.emit(
-                "listen",
-                callback=self.parse_new_data,
-                namespace=self.server_namespace
-            )
-            Listener.sio_client.sleep(0.5)
+        connection = self.connections
+        while self.sio_client.connected and connection == self.connections:
+            self.listen()
+            if self.push_active:
+                self.sio_client.sleep(self.fallback_interval)
+            else:
+                self.sio_client.sleep(self.listen_interval)
 
     def run(self):
         """Runs instance of SocketIO client to connect to green apple server.
 
         This method registers the instance variable  `client_namespace` as the
         official namespace of thr class object and then establishes connection
-        with the green apple server.
+        with the green apple server. With interest filtering, it subscribes to
+        the bus for the rooms watched by the red apple servers first. With the
+        `shm` bus, it subscribes in any case, so that the presence messages of
+        the red apple server don't fill up the ring to the listener.
 
         :param self: The reference to class instance. This will be used to call
                      the instance methods and to access the instance variables.
 
         :return: None
         """
-        Listener.sio_client.register_namespace(self)
+        self.sio_client.register_namespace(self)
+        if self.interest_filtering or shared_db.bus.name == SHARED_MEMORY:
+            shared_db.bus.subscribe(
+                self.on_bus_message, self.sio_client.start_background_task
+            )
         self.connect_to_server()
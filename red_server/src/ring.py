@@ -0,0 +1,95 @@
+#!/bin/env python
+"""This file has the consistent-hash ring assigning rooms to red apple servers.
+
+Every red apple server, or node, is placed on the ring at many points, its
+virtual nodes, and a room is owned by the node of the first point following
+the hash of the room id. Adding or removing one of N nodes only moves the rooms
+next to its points, i.e. about 1/N of the rooms, and the virtual nodes spread
+the rooms evenly.
+"""
+
+import hashlib
+from bisect import bisect, insort
+
+
+def ring_hash(key):
+    """Returns the position of a key on the ring.
+
+    :param key: The string to be hashed.
+
+    :return: Integer position between `0` and `2 ** 64 - 1`.
+    """
+    digest = hashlib.md5(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+class HashRing:
+    """Class for the consistent-hash ring of the red apple servers.
+
+    :param self: The reference to class instance.
+    :param nodes: The iterable of node names, such as `"10.0.0.2:6000"`.
+    :param vnodes: The number of virtual nodes of every node.
+    """
+
+    def __init__(self, nodes=(), vnodes=100):
+        self.vnodes = vnodes
+        self.nodes = set()
+        self.points = []                # Sorted positions of virtual nodes
+        self.owners = {}                # Position -> node name
+        self.room_owners = {}           # Cache of room id -> node name
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add(self, node):
+        """Places a node on the ring.
+
+        :param self: The reference to class instance.
+        :param node: The name of the node.
+
+        :return: None
+        """
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        self.room_owners.clear()
+        for index in range(self.vnodes):
+            point = ring_hash(f"{node}#{index}")
+            if point not in self.owners:
+                insort(self.points, point)
+                self.owners[point] = node
+
+    def remove(self, node):
+        """Removes a node from the ring.
+
+        :param self: The reference to class instance.
+        :param node: The name of the node.
+
+        :return: None
+        """
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        self.room_owners.clear()
+        self.points = [
+            point for point in self.points if self.owners[point] != node
+        ]
+        self.owners = {point: self.owners[point] for point in self.points}
+
+    def node_for(self, room_id):
+        """Returns the node owning a room.
+
+        :param self: The reference to class instance.
+        :param room_id: The three digit id of the room.
+
+        :return: The name of the node, or `None` if the ring is empty.
+        """
+        if room_id in self.room_owners:
+            return self.room_owners[room_id]
+        if not self.points:
+            return None
+        index = bisect(self.points, ring_hash(room_id)) % len(self.points)
+        self.room_owners[room_id] = self.owners[self.points[index]]
+        return self.room_owners[room_id]
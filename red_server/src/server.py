@@ -7,38 +7,342 @@ from shared resources to propogate any supplied information to the clients.
 Author: sagarbhat94@gmail.com (Sagar Bhat)
 """
 
-from flask import Flask, request
-from flask_socketio import SocketIO, emit, join_room, leave_room
+import hmac
+import time
+import uuid
+from collections import deque
+from itertools import islice
 
+from flask import Flask, Response, jsonify, request
+from flask_socketio import SocketIO
+
+from admission import TokenBucket
+from batching import BatchSizeHistogram
+from compression import ZLIB, Compressor
 from datasource import SharedResource as shared_db
+from fanout import DROP_OLDEST, OutboundQueues
+from metrics import CONTENT_TYPE
+from presence import PresenceIndex
+from profiling import count_greenlets, profile
+from snapshot import Snapshots
+from tracing import RED_SERVER, TraceRing, is_traced, stamp
 
 
 class RedAppleServer:
     """Class, attributes and methods for the Red Apple Server.
+
+    Several red apple servers can share the red clients when they subscribe
+    to a shared bus, see `bus.py`. Every server broadcasts the data of the
+    rooms to its own red clients, so each red client receives it once. With a
+    ring of red apple servers, every server only receives the data of the
+    rooms it owns, and red clients of other rooms are told their owner by the
+    `node_address` of the owner.
+
+    With an `outbound_high_water`, broadcasts are sent to every red client
+    through its own outbound queue, see `fanout.py`, instead of to the whole
+    room at once, so that a slow red client only delays itself.
+
+    The events of the server are counted and timed in the shared metrics, see
+    `SharedResource.configure_metrics`, which are served on `/metrics`.
+    With `tracing`, sampled messages are stamped when they are broadcasted and
+    the last `trace_ring_size` of them are summarized on `/traces`.
+
+    With a `join_rate`, joins are admitted at that rate per second with a
+    `join_burst`, and red clients joining beyond it are told when to join
+    again, see `admission.py`.
+
+    With an `admin_token`, requests carrying it get profiles of the server on
+    `/admin/profile` and the number of live greenlets per handler on
+    `/admin/greenlets`, see `profiling.py`.
+
+    With a `snapshot_path`, the active green ids, the pending data and the
+    room histories are written to a snapshot every `snapshot_interval`
+    seconds and when the server stops, and restored when it starts, see
+    `snapshot.py`. A restarted server then admits joins before its listener
+    learns the active green ids, and rejoining red clients get the data they
+    missed from the restored histories.
     """
 
     def __init__(self, host=None, port=None, *args, **kwargs):
-        self.sid_to_rooms_map = {}
+        self.presence = PresenceIndex()
         self.host = host or "0.0.0.0"
         self.port = port or "5000"
         self.client_namespace = kwargs.pop("client_namespace", "/")
         self.server_namespace = kwargs.pop("server_namespace", "/")
-        self.app = Flask(__name__)
-        self.sio_server = SocketIO(self.app)
+        self.broadcast_batch_size = kwargs.pop("broadcast_batch_size", 1000)
+        self.broadcast_batch_delay = kwargs.pop("broadcast_batch_delay", 0)
+        self.broadcast_batches = BatchSizeHistogram()
+        self.compressor = Compressor(
+            threshold=kwargs.pop("compression_threshold", None)
+        )
+        self.compression_sids = set()   # Clients accepting compressed frames
+        self.epoch = uuid.uuid4().hex   # Sequence numbers restart per epoch
+        self.room_seqs = {}             # Room id -> last sequence number
+        self.room_history = {}          # Room id -> deque of (seq, data)
+        self.history_size = kwargs.pop("history_size", 1000)
+        self.presence_interval = kwargs.pop("presence_interval", 5.0)
+        self.node_address = kwargs.pop(
+            "node_address", f"{self.host}:{self.port}"
+        )
+        self.remote_presence = {}       # Node id -> (expiry, watched rooms)
+        self.remote_rooms = set()       # Rooms watched by other red servers
+        self.tracing = kwargs.pop("tracing", False)
+        self.traces = TraceRing(kwargs.pop("trace_ring_size", 1000))
+        self.admin_token = kwargs.pop("admin_token", None)
+        self.profiling = False          # A profile is being sampled
+        self.snapshots = None
+        snapshot_path = kwargs.pop("snapshot_path", None)
+        snapshot_interval = kwargs.pop("snapshot_interval", 5.0)
+        snapshot_max_age = kwargs.pop("snapshot_max_age", None)
+        if snapshot_path:
+            self.snapshots = Snapshots(
+                snapshot_path, snapshot_interval, snapshot_max_age
+            )
+        outbound_high_water = kwargs.pop("outbound_high_water", None)
+        slow_consumer_policy = kwargs.pop("slow_consumer_policy", DROP_OLDEST)
+        send_window = kwargs.pop("send_window", 10)
+        self.join_bucket = None
+        join_rate = kwargs.pop("join_rate", None)
+        join_burst = kwargs.pop("join_burst", 100)
+        if join_rate:
+            self.join_bucket = TokenBucket(join_rate, join_burst)
+        self.outbound = None            # Outbound queues of the red clients
+        if outbound_high_water is not None:
+            self.outbound = OutboundQueues(
+                self.send_to_session,
+                high_water=outbound_high_water,
+                policy=slow_consumer_policy,
+                window=send_window
+            )
+        self.create_app()
         super(RedAppleServer, self).__init__(*args, **kwargs)
+        self.register_metrics()
+        if shared_db.metrics.enabled:
+            self.add_route("/metrics", self.on_metrics)
+        if self.tracing:
+            self.add_route("/traces", self.on_traces)
+        if self.admin_token:
+            self.add_route("/admin/profile", self.on_profile)
+            self.add_route("/admin/greenlets", self.on_greenlets)
 
-        self.sio_server.on_event(
+        self.on_event(
             "disconnect", self.on_disconnect, namespace=self.server_namespace
         )
-        self.sio_server.on_event(
+        self.on_event(
             "join", self.on_join, namespace=self.server_namespace
         )
-        self.sio_server.on_event(
+        self.on_event(
             "leave", self.on_leave, namespace=self.server_namespace
         )
-        self.sio_server.on_event(
+        self.on_event(
             "new_data", self.on_new_data, namespace=self.server_namespace
         )
+        if self.snapshots is not None:
+            self.restore_snapshot()
+        shared_db.bus.subscribe(
+            self.on_bus_message,
+            self.sio_server.start_background_task,
+            topics=(self.node_address,) if shared_db.ring else ()
+        )
+
+    def register_metrics(self):
+        """Creates the counters, gauges and histograms of the server.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        metrics = shared_db.metrics
+        self.events_received = metrics.counter(
+            "events_received_total", "Socket.IO events received.",
+            ("namespace", "event")
+        )
+        self.broadcasts_sent = metrics.counter(
+            "events_sent_total", "Socket.IO events emitted.",
+            ("namespace", "event")
+        ).labels(self.client_namespace, "broadcast_message")
+        self.handler_seconds = metrics.histogram(
+            "handler_seconds", "Execution time of the event handlers.",
+            ("namespace", "event")
+        )
+        self.joins_throttled = metrics.counter(
+            "throttled_total", "Joins refused by admission control.",
+            ("event",)
+        ).labels("join")
+        self.snapshot_seconds = metrics.histogram(
+            "snapshot_seconds", "Time to write a snapshot of the state."
+        ).labels()
+        metrics.gauge(
+            "sessions", "Connected sessions.",
+            lambda: {self.client_namespace: len(self.presence)},
+            ("namespace",)
+        )
+        metrics.gauge(
+            "rooms", "Rooms with red clients.",
+            lambda: len(self.presence.rooms())
+        )
+        metrics.gauge(
+            "compression_bytes",
+            "Bytes of the compressed frames, before and after compression.",
+            lambda: {
+                "raw": self.compressor.raw_bytes,
+                "compressed": self.compressor.compressed_bytes,
+            },
+            ("stage",)
+        )
+        metrics.gauge(
+            "compression_ratio",
+            "Raw bytes per compressed byte of the compressed frames.",
+            lambda: self.compressor.stats()["ratio"] or 0.0
+        )
+        metrics.gauge(
+            "compression_cpu_seconds", "CPU time spent compressing frames.",
+            lambda: self.compressor.cpu_seconds
+        )
+        metrics.gauge(
+            "pending_items", "Data waiting to be broadcasted, per room.",
+            lambda: shared_db.new_published_data.pending_per_room(),
+            ("room",)
+        )
+        if self.outbound is None:
+            return
+        metrics.gauge(
+            "outbound_queue_depth",
+            "Broadcasts queued or unacknowledged, per red client.",
+            lambda: self.outbound.stats()["depth"], ("sid",)
+        )
+        metrics.gauge(
+            "outbound_dropped_broadcasts",
+            "Broadcasts dropped by the slow-consumer policy, per red client.",
+            lambda: self.outbound.stats()["dropped_per_session"], ("sid",)
+        )
+        metrics.gauge(
+            "slow_consumers_disconnected",
+            "Red clients disconnected by the slow-consumer policy.",
+            lambda: self.outbound.disconnected
+        )
+
+    def on_event(self, event, handler, namespace):
+        """Registers an event handler, counted and timed by the metrics.
+
+        :param self: The reference to class instance.
+        :param event: The name of the event.
+        :param handler: The event handler.
+        :param namespace: The namespace of the event.
+
+        :return: None
+        """
+        self.sio_server.on_event(
+            event,
+            shared_db.metrics.timed(
+                handler, self.handler_seconds, self.events_received,
+                namespace, event
+            ),
+            namespace=namespace
+        )
+
+    def create_app(self):
+        """Creates the Flask app and its Socket.IO server.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.app = Flask(__name__)
+        self.sio_server = SocketIO(self.app)
+
+    def add_route(self, path, view):
+        """Serves the response of a view on an HTTP route of the app.
+
+        :param self: The reference to class instance.
+        :param path: The path of the route, such as `/metrics`.
+        :param view: The callable returning the response.
+
+        :return: None
+        """
+        self.app.add_url_rule(path, path.strip("/"), view)
+
+    def session_id(self):
+        """Returns the session id of the client whose event is handled.
+
+        :param self: The reference to class instance.
+
+        :return: The session id.
+        """
+        return request.sid
+
+    def on_metrics(self):
+        """Serves the shared metrics in the Prometheus text format.
+
+        :param self: The reference to class instance.
+
+        :return: The Flask response.
+        """
+        return Response(shared_db.metrics.render(), content_type=CONTENT_TYPE)
+
+    def on_traces(self):
+        """Serves the latencies of the last traced messages as JSON.
+
+        :param self: The reference to class instance.
+
+        :return: The Flask response, see `TraceRing.dump`.
+        """
+        return jsonify(self.traces.dump())
+
+    def is_admin(self):
+        """Tells whether the HTTP request carries the admin token.
+
+        The token is read from the `X-Admin-Token` header.
+
+        :param self: The reference to class instance.
+
+        :return: Boolean, `True` if the token matches `admin_token`.
+        """
+        token = request.headers.get("X-Admin-Token", "")
+        return hmac.compare_digest(
+            token.encode(), str(self.admin_token).encode()
+        )
+
+    def on_profile(self):
+        """Samples the stacks of the server and serves them collapsed.
+
+        The query arguments `seconds` and `interval` set for how long and how
+        often the stacks are sampled, by default for 10 seconds every 5 ms.
+        Only one profile is sampled at a time.
+
+        :param self: The reference to class instance.
+
+        :return: The Flask response, see `StackSampler.collapsed`.
+        """
+        if not self.is_admin():
+            return Response("Forbidden\n", status=403)
+        if self.profiling:
+            return Response("A profile is already running\n", status=409)
+        self.profiling = True
+        try:
+            sampler = profile(
+                request.args.get("seconds", 10.0, type=float),
+                request.args.get("interval", 0.005, type=float),
+                self.sio_server.sleep
+            )
+        finally:
+            self.profiling = False
+        return Response(
+            sampler.collapsed(),
+            content_type="text/plain; charset=utf-8",
+            headers={"X-Samples": str(sampler.samples)}
+        )
+
+    def on_greenlets(self):
+        """Serves the number of live greenlets per handler as JSON.
+
+        :param self: The reference to class instance.
+
+        :return: The Flask response, see `count_greenlets`.
+        """
+        if not self.is_admin():
+            return Response("Forbidden\n", status=403)
+        return jsonify(count_greenlets(self))
 
     def on_disconnect(self):
         """Removes the connected client from its corresponding room.
@@ -51,37 +355,343 @@ class RedAppleServer:
 
         :return: None
         """
-        client = "RED" + self.sid_to_rooms_map.get(request.sid, "XXX")
+        client = "RED" + self.presence.room_of(self.session_id(), "XXX")
         print(f"< One instance of '{client}' disconnected >")
         self.on_leave()
 
     def on_new_data(self):
-        """Listens to new incoming data received from Green-Apple Server.
+        """Requests delivery of the data stored for the room of the client.
 
-        This method reads the shared data resource which is shared between the
-        redServer-greenServer and redClient-redServer connections. It new data
-        is found, it broadcasts the data to all the corresponding red clients.
+        This method gets called by a red client once it has joined its room.
+        It marks the room as pending, so that the dispatcher broadcasts any
+        data received for the room before the client joined.
 
         :param self: The reference to class instance. This will be used to call
                      the instance methods and to access the instance variables.
 
         :return: None
         """
-        room_id = self.sid_to_rooms_map[request.sid]
-        # While atleast one red client belonging to room exists
-        while room_id in self.sid_to_rooms_map.values():
-            self.sio_server.sleep(0.2)
-            new_data = shared_db.new_published_data.get(room_id, None)
-            if not new_data:
-                continue
-            new_data = new_data.copy()
-            shared_db.new_published_data[room_id] = []
-            emit(
-                "broadcast_message",
-                new_data,
-                room=room_id,
-                namespace=self.client_namespace
+        room_id = self.presence.room_of(self.session_id())
+        if room_id is not None:
+            shared_db.notify_room(room_id)
+
+    def on_bus_message(self, message):
+        """Handles a message published on the bus by the listener or a node.
+
+        New data is stored for the dispatcher, except data of rooms which only
+        have red clients on other red servers, as those servers broadcast it.
+        The active green ids are taken from roster messages, the offset of
+        the message log from offset messages of a listener in another process,
+        and the rooms watched by other red servers from their presence
+        messages.
+
+        :param self: The reference to class instance. This will be used to call
+                     the instance methods and to access the instance variables.
+        :param message: The dict with the ``kind`` of message. For example:
+                            {"kind": "data", "data": [("123", "data1")]}
+                            {"kind": "roster", "node": "4e1a...",
+                             "active": ["123", "456"]}
+                            {"kind": "presence", "node": "4e1a...",
+                             "rooms": ["123"]}
+                            {"kind": "offset", "node": "4e1a...",
+                             "offset": 1024}
+
+        :return: None
+        """
+        if message["kind"] == "data":
+            new_data = message["data"]
+            if self.remote_rooms:
+                new_data = [
+                    (room_id, data) for (room_id, data) in new_data
+                    if self.presence.count(room_id)
+                    or room_id not in self.remote_rooms
+                ]
+            if new_data:
+                shared_db.publish(new_data)
+        elif message["node"] == shared_db.node_id:
+            return
+        elif message["kind"] == "roster":
+            shared_db.active_green_ids = set(message["active"])
+        elif message["kind"] == "offset":
+            shared_db.log_offset = message["offset"]
+        elif message["kind"] == "presence":
+            self.remote_presence[message["node"]] = (
+                time.monotonic() + 3 * self.presence_interval,
+                frozenset(message["rooms"])
             )
+            self.update_remote_rooms()
+
+    def update_remote_rooms(self):
+        """Recomputes the rooms watched by other red servers.
+
+        Nodes which didn't announce their rooms for three presence intervals
+        are forgotten. Data kept for a room which only gets watched on another
+        red server is dropped, as that server broadcasts it.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        now = time.monotonic()
+        for node_id, (expires_at, _) in list(self.remote_presence.items()):
+            if expires_at < now:
+                del self.remote_presence[node_id]
+        remote_rooms = set().union(
+            *(rooms for (_, rooms) in self.remote_presence.values())
+        )
+        for room_id in remote_rooms - self.remote_rooms:
+            if not self.presence.count(room_id):
+                shared_db.take_room_data(room_id)
+        self.remote_rooms = remote_rooms
+
+    def announce_presence(self):
+        """Publishes the rooms with red clients of this server on the bus.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        shared_db.bus.publish({
+            "kind": "presence",
+            "node": shared_db.node_id,
+            "rooms": self.presence.rooms()
+        })
+
+    def announce_presence_periodically(self):
+        """Announces the watched rooms and forgets silent nodes in a loop.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        while True:
+            self.sio_server.sleep(self.presence_interval)
+            self.announce_presence()
+            self.update_remote_rooms()
+
+    def dispatch_new_data(self):
+        """Broadcasts new data received from Green-Apple Server to the rooms.
+
+        This method runs as the single background task of the server. It sleeps
+        till the listener stores new data for some rooms, and then broadcasts
+        the data of each pending room once to all its red clients.
+        Data of rooms without any red client is kept till one of them joins,
+        or till it expires if the buffers have a time to live.
+
+        With a `broadcast_batch_delay`, the dispatcher waits that long after
+        waking up to collect more data, unless `broadcast_batch_size` items
+        are already pending. Broadcasts never hold more items than that size.
+
+        :param self: The reference to class instance. This will be used to call
+                     the instance methods and to access the instance variables.
+
+        :return: None
+        """
+        while True:
+            # Wake up once per second only if unwatched data has to expire
+            timeout = 1.0 if shared_db.new_published_data.ttl else None
+            pending_rooms = shared_db.wait_for_pending_rooms(timeout=timeout)
+            shared_db.expire_unsubscribed(self.presence.count)
+            if (pending_rooms and self.broadcast_batch_delay > 0
+                    and len(shared_db.new_published_data)
+                    < self.broadcast_batch_size):
+                self.sio_server.sleep(self.broadcast_batch_delay)
+                pending_rooms = list(dict.fromkeys(
+                    pending_rooms + shared_db.wait_for_pending_rooms(timeout=0)
+                ))
+            self.broadcast_rooms(pending_rooms)
+
+    def broadcast_rooms(self, pending_rooms):
+        """Broadcasts the stored data of rooms to their red clients.
+
+        Data of rooms without any red client is kept.
+
+        :param self: The reference to class instance.
+        :param pending_rooms: The list of room ids with new data.
+
+        :return: None
+        """
+        for room_id in pending_rooms:
+            # Atleast one red client belonging to room exists
+            if not self.presence.count(room_id):
+                continue
+            new_data = shared_db.take_room_data(room_id)
+            size = self.broadcast_batch_size
+            for start in range(0, len(new_data), size):
+                batch = new_data[start:start + size]
+                self.broadcast_batches.observe(len(batch))
+                if self.tracing:
+                    self.stamp_traces(batch)
+                message = self.stamp_batch(room_id, batch)
+                if self.outbound is not None:
+                    self.fan_out(room_id, message)
+                    continue
+                self.sio_server.emit(
+                    "broadcast_message",
+                    self.compress_for_room(message, room_id),
+                    room=room_id,
+                    namespace=self.client_namespace
+                )
+                self.broadcasts_sent.inc(self.presence.count(room_id))
+
+    def fan_out(self, room_id, message):
+        """Queues a broadcast for every red client of a room.
+
+        The broadcast is compressed once for all the red clients accepting
+        compressed frames. Red clients which fell too far behind are
+        disconnected if the slow-consumer policy says so.
+
+        :param self: The reference to class instance.
+        :param room_id: The three digit id of the room.
+        :param message: The broadcast message, see `stamp_batch`.
+
+        :return: None
+        """
+        members = self.presence.members(room_id)
+        frame = message
+        if (self.compressor.threshold is not None
+                and not members.isdisjoint(self.compression_sids)):
+            frame = self.compressor.compress(message)
+        for sid in members:
+            if not self.outbound.push(sid, (message, frame)):
+                self.disconnect_slow_consumer(sid)
+
+    def send_to_session(self, sid, broadcast, gap, callback):
+        """Sends a queued broadcast to one red client.
+
+        :param self: The reference to class instance.
+        :param sid: The session id of the red client.
+        :param broadcast: The tuple of the broadcast message and its frame,
+                          which is compressed if the room accepts it.
+        :param gap: Boolean, whether broadcasts for the client were dropped
+                    since the last one it got.
+        :param callback: The callable to be called on acknowledgement.
+
+        :return: None
+        """
+        message, frame = broadcast
+        compressed = sid in self.compression_sids
+        if gap:
+            # The client resumes from this broadcast instead of waiting
+            frame = dict(message, gap=True)
+            if compressed:
+                frame = self.compressor.compress(frame)
+        elif not compressed:
+            frame = message
+        self.sio_server.emit(
+            "broadcast_message",
+            frame,
+            room=sid,
+            namespace=self.client_namespace,
+            callback=callback
+        )
+        self.broadcasts_sent.inc()
+
+    def disconnect_slow_consumer(self, sid):
+        """Disconnects a red client which fell too far behind.
+
+        :param self: The reference to class instance.
+        :param sid: The session id of the red client.
+
+        :return: None
+        """
+        room_id = self.presence.room_of(sid, "XXX")
+        print(f"< Disconnecting slow instance of 'RED{room_id}' >")
+        self.sio_server.emit(
+            "abort_connection",
+            f"Client 'RED{room_id}' is too slow to receive broadcasts.",
+            room=sid,
+            namespace=self.client_namespace
+        )
+        self.sio_server.server.disconnect(sid, namespace=self.client_namespace)
+
+    def stamp_traces(self, batch):
+        """Stamps the sampled messages of a broadcast and keeps their traces.
+
+        :param self: The reference to class instance.
+        :param batch: The list of data to be broadcasted.
+
+        :return: None
+        """
+        for data in batch:
+            if is_traced(data):
+                self.traces.record(stamp(data, RED_SERVER))
+
+    def stamp_batch(self, room_id, batch):
+        """Numbers the data of a broadcast and keeps it in the room history.
+
+        Every room numbers its data with consecutive sequence numbers, which
+        restart with every new `epoch` of the server. The last `history_size`
+        data of each room are kept, to be sent again to red clients which
+        rejoin after missing some broadcasts.
+
+        :param self: The reference to class instance. This will be used to call
+                     the instance methods and to access the instance variables.
+        :param room_id: The three digit id of the room.
+        :param batch: The list of data to be broadcasted.
+
+        :return: The broadcast message with the epoch and sequence number of
+                 the first data. For example:
+                    {"epoch": "9f1c...", "seq": 41, "data": ["data1", "data2"]}
+        """
+        first_seq = self.room_seqs.get(room_id, 0) + 1
+        self.room_seqs[room_id] = first_seq + len(batch) - 1
+        history = self.room_history.setdefault(
+            room_id, deque(maxlen=self.history_size)
+        )
+        history.extend(zip(range(first_seq, first_seq + len(batch)), batch))
+        return {"epoch": self.epoch, "seq": first_seq, "data": batch}
+
+    def missed_messages(self, room_id, epoch, last_seq):
+        """Returns the broadcast of the data a rejoining red client missed.
+
+        :param self: The reference to class instance.
+        :param room_id: The three digit id of the room.
+        :param epoch: The epoch of the last data received by the client.
+        :param last_seq: The sequence number of the last data received.
+
+        :return: The broadcast message of the missed data, flagged with a
+                 ``gap`` if some of it isn't in the history anymore, or `None`
+                 if nothing was missed.
+        """
+        current_seq = self.room_seqs.get(room_id, 0)
+        if epoch != self.epoch:
+            # Sequence numbers of an earlier epoch can't be resumed
+            return {
+                "epoch": self.epoch,
+                "seq": current_seq + 1,
+                "data": [],
+                "gap": True
+            }
+        if last_seq >= current_seq:
+            return None
+        history = self.room_history.get(room_id, ())
+        oldest_seq = history[0][0] if history else current_seq + 1
+        first_seq = max(last_seq + 1, oldest_seq)
+        return {
+            "epoch": self.epoch,
+            "seq": first_seq,
+            "data": [
+                data for (_, data) in
+                islice(history, first_seq - oldest_seq, None)
+            ],
+            "gap": first_seq > last_seq + 1
+        }
+
+    def compress_for_room(self, message, room_id):
+        """Compresses a broadcast if every red client of the room accepts it.
+
+        :param self: The reference to class instance.
+        :param message: The broadcast message.
+        :param room_id: The three digit id of the room.
+
+        :return: The compressed frame, or the message itself.
+        """
+        if self.compressor.threshold is None:
+            return message
+        if not self.presence.members(room_id) <= self.compression_sids:
+            return message
+        return self.compressor.compress(message)
 
     def on_join(self, data):
         """Adds or registers a new connected red client to corresponding room.
@@ -89,26 +699,69 @@ class RedAppleServer:
         This method should be called as soon as a red client connects to the
         server so as to register it to some room based on its client id.  It
         aborts the connection if a green client with the same three digit id
-        isn't connected to the green server at that point of time.
+        isn't connected to the green server at that point of time. A client
+        rejoining with the epoch and sequence number of the last data it
+        received first gets the data it missed from the room history. If the
+        room is owned by another red apple server, the client is told to join
+        that server instead. Joins exceeding the `join_rate` are told when to
+        join again.
 
         :param self: The reference to class instance. This will be used to call
                      the instance methods and to access the instance variables.
         :param data: The dict data which holds the three digit ``id`` of the
-                     new client. For example:
-                        {"id": "123"}
+                     new client and optionally the ``compression`` it accepts
+                     for broadcasts, and the ``epoch`` and ``last_seq`` of
+                     the last data it received. For example:
+                        {"id": "123", "epoch": "9f1c...", "last_seq": 40}
 
-        :return: None
+        :return: The dict with the ``node`` address of the red apple server
+                 owning the room, or the seconds after which to join again,
+                 or `None`. For example:
+                    {"node": "10.0.0.2:6000"}
+                    {"retry_after": 0.25}
         """
-        room_id = data["id"]
-        self.sid_to_rooms_map[request.sid] = room_id
+        if self.join_bucket is not None:
+            retry_after = self.join_bucket.take()
+            if retry_after:
+                self.joins_throttled.inc()
+                return {"retry_after": retry_after}
+        room_id, sid = data["id"], self.session_id()
+        if shared_db.ring is not None:
+            owner = shared_db.ring.node_for(room_id)
+            if owner != self.node_address:
+                return {"node": owner}
         if room_id not in shared_db.active_green_ids:
-            emit(
+            self.sio_server.emit(
                 "abort_connection",
                 f"Client 'GRN{room_id}' is unavailable.",
+                room=sid,
                 namespace=self.client_namespace
             )
-            return
-        join_room(room_id)
+            return None
+        self.presence.add(sid, room_id)
+        if self.presence.count(room_id) == 1:
+            self.announce_presence()
+        if data.get("compression") == ZLIB:
+            self.compression_sids.add(sid)
+        if self.outbound is not None:
+            self.outbound.open(sid)
+        if data.get("last_seq") is not None:
+            missed = self.missed_messages(
+                room_id, data.get("epoch"), data["last_seq"]
+            )
+            if missed is not None:
+                if sid in self.compression_sids:
+                    missed = self.compressor.compress(missed)
+                self.sio_server.emit(
+                    "broadcast_message",
+                    missed,
+                    room=sid,
+                    namespace=self.client_namespace
+                )
+        self.sio_server.server.enter_room(
+            sid, room_id, namespace=self.client_namespace
+        )
+        return None
 
     def on_leave(self):
         """Removes a red client from its registered room.
@@ -122,14 +775,105 @@ class RedAppleServer:
 
         :return: None
         """
-        room_id = self.sid_to_rooms_map.pop(request.sid)
-        leave_room(room_id)
+        sid = self.session_id()
+        room_id = self.presence.remove(sid)
+        self.compression_sids.discard(sid)
+        if self.outbound is not None:
+            self.outbound.close(sid)
+        if room_id is None:
+            return
+        self.sio_server.server.leave_room(
+            sid, room_id, namespace=self.client_namespace
+        )
+        if not self.presence.count(room_id):
+            self.announce_presence()
+
+    def snapshot_state(self):
+        """Returns the state of the server to be kept across restarts.
+
+        The state is a copy, which the server doesn't change while it is
+        written.
+
+        :param self: The reference to class instance.
+
+        :return: A dict of JSON values, see `SharedResource.dump`, with the
+                 epoch, sequence numbers and histories of the rooms.
+        """
+        state = shared_db.dump()
+        state.update({
+            "epoch": self.epoch,
+            "room_seqs": dict(self.room_seqs),
+            "room_history": {
+                room_id: list(history)
+                for room_id, history in self.room_history.items()
+            }
+        })
+        return state
+
+    def restore_snapshot(self):
+        """Restores the state of the server from its last snapshot.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        start = time.perf_counter()
+        state = self.snapshots.read()
+        if state is None:
+            return
+        shared_db.restore(state)
+        self.epoch = state["epoch"]
+        self.room_seqs = state["room_seqs"]
+        self.room_history = {
+            room_id: deque(map(tuple, history), maxlen=self.history_size)
+            for room_id, history in state["room_history"].items()
+        }
+        print(
+            f"< Restored {len(state['active_green_ids'])} green ids and "
+            f"{len(state['pending_data'])} pending data in "
+            f"{(time.perf_counter() - start) * 1000:.1f}ms >"
+        )
+
+    def write_snapshot(self, off_hub=False):
+        """Writes the state of the server to a new snapshot.
+
+        The state is copied on the hub, and with `off_hub`, it is encoded,
+        compressed and synced to disk in a native thread of `eventlet.tpool`,
+        so that broadcasts go on meanwhile.
+
+        :param self: The reference to class instance.
+        :param off_hub: Boolean, whether to write in a native thread.
+
+        :return: None
+        """
+        start = time.perf_counter()
+        state = self.snapshot_state()
+        if off_hub:
+            from eventlet import tpool
+            tpool.execute(self.snapshots.write, state)
+        else:
+            self.snapshots.write(state)
+        self.snapshot_seconds.observe(time.perf_counter() - start)
+
+    def write_snapshots_periodically(self):
+        """Writes a snapshot every `snapshot_interval` seconds in a loop.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        while True:
+            self.sio_server.sleep(self.snapshots.interval)
+            self.write_snapshot(off_hub=True)
 
     def run(self):
         """Runs an instance of Red-Apple server.
 
         This method runs a Flask-SocketIO server and servers as the source of
-        incoming data for all the connected red clients.
+        incoming data for all the connected red clients. The dispatcher of new
+        data and the announcement of watched rooms to other red servers are
+        started as background tasks before running the server. With
+        snapshots, they are written periodically and once the server stops.
 
         :param self: The reference to class instance. This will be used to call
                      the instance methods and to access the instance variables.
@@ -137,5 +881,15 @@ class RedAppleServer:
         :return: None
         """
         print(f"(Starting server on '{self.host}:{self.port}')")
+        self.sio_server.start_background_task(self.dispatch_new_data)
+        self.sio_server.start_background_task(
+            self.announce_presence_periodically
+        )
+        if self.snapshots is not None:
+            self.sio_server.start_background_task(
+                self.write_snapshots_periodically
+            )
         self.sio_server.run(self.app, host=self.host, port=self.port)
+        if self.snapshots is not None:
+            self.write_snapshot()
         print("Server closed.")
@@ -17,3 +17,192 @@ class RedServerConstants:
     grn_client_nmsp = "/red"        # Namespace for connecting to green server
     grn_server_port = "7000"        # Port for connecting to green server
     grn_server_host = "0.0.0.0"     # Host for connecting to green server
+
+    push_enabled = True             # Subscribe for data pushed by green server
+    listen_interval = 0.5           # Seconds between polls without push mode
+    fallback_interval = 5.0         # Seconds between polls with push mode
+    interest_filtering = True       # Only receive data of watched rooms
+    offset_path = "red_apple.offset"    # File of the log offset, or None
+    offset_sync_interval = 1.0      # Seconds between saves of the log offset
+
+    buffer_room_capacity = 1000     # Pending messages kept per room
+    buffer_total_capacity = 100000  # Pending messages kept for all rooms
+    buffer_policy = "drop_oldest"   # Either "drop_oldest" or "drop_newest"
+    buffer_ttl = 300.0              # Seconds to keep data of unwatched rooms
+
+    broadcast_batch_size = 100      # Most messages in one broadcast
+    broadcast_batch_delay = 0.005   # Seconds to collect data for broadcasts
+
+    link_codec = "json"             # Either "json" or "binary"
+
+    compression_threshold = 4096    # Bytes from which broadcasts are zipped
+    link_compression = True         # Accept zipped frames from green server
+
+    history_size = 1000             # Broadcast messages kept per room
+
+    outbound_high_water = 1000      # Broadcasts queued per red client
+    slow_consumer_policy = "drop_oldest"    # Or "conflate" or "disconnect"
+    send_window = 10                # Unacknowledged broadcasts per red client
+
+    join_rate = 500.0               # Joins admitted per second, None disables
+    join_burst = 1000               # Joins admitted at once
+
+    bus = "memory"                  # Either "memory", "redis" or "shm"
+    bus_url = "redis://127.0.0.1:6379/0"    # Broker for the "redis" bus
+    bus_channel = "red_apple"       # Channel of the "redis" bus
+    shm_name = "red_apple"          # Shared memory of the "shm" bus
+    shm_ring_bytes = 16384          # Bytes of every room ring of "shm" bus
+    shm_poll_interval = 0.001       # Seconds between polls of the "shm" bus
+    shm_max_poll_interval = 0.02    # Seconds between polls while it is idle
+    listen_to_green = True          # Only one red server may listen to green
+    presence_interval = 5.0         # Seconds between watched rooms announces
+
+    ring_nodes = []                 # Addresses of red servers sharing rooms
+    ring_vnodes = 100               # Points of every red server on the ring
+    node_address = "127.0.0.1:6000"     # Address of this server on the ring
+
+    metrics_enabled = True          # Serve counters and timings on /metrics
+    tracing = True                  # Stamp sampled messages, see /traces
+    trace_ring_size = 1000          # Traced messages kept for /traces
+    admin_token = None              # Token of the /admin routes, or None
+
+    snapshot_path = None            # File of the state snapshots, or None
+    snapshot_interval = 5.0         # Seconds between state snapshots
+    snapshot_max_age = 300.0        # Older snapshots aren't restored
+
+    use_asyncio = False             # Run on asyncio instead of eventlet
+
+
+def buffer_kwargs(options=None):
+    """Builds the keyword arguments of the shared buffers.
+
+    :param options: The dict of settings overriding the constants, whose keys
+                    prefixed with `buffer_` are popped. Defaults to None.
+
+    :return: The dict of keyword arguments for `configure_buffers`.
+    """
+    options = {} if options is None else options
+    consts = RedServerConstants
+    return {
+        "room_capacity": options.pop(
+            "buffer_room_capacity", consts.buffer_room_capacity
+        ),
+        "total_capacity": options.pop(
+            "buffer_total_capacity", consts.buffer_total_capacity
+        ),
+        "policy": options.pop("buffer_policy", consts.buffer_policy),
+        "ttl": options.pop("buffer_ttl", consts.buffer_ttl),
+    }
+
+
+def bus_kwargs(options=None):
+    """Builds the name and the keyword arguments of the message bus.
+
+    :param options: The dict of settings overriding the constants, whose keys
+                    `bus`, `bus_url`, `bus_channel` and the ones prefixed with
+                    `shm_` are popped. Defaults to None.
+
+    :return: The name of the bus and the dict of keyword arguments for
+             `get_bus`, without the `owner` of the `shm` bus.
+    """
+    from bus import MEMORY
+    from shm import SHARED_MEMORY
+
+    options = {} if options is None else options
+    consts = RedServerConstants
+    bus = options.pop("bus", consts.bus)
+    url = options.pop("bus_url", consts.bus_url)
+    channel = options.pop("bus_channel", consts.bus_channel)
+    shm_kwargs = {
+        "name": options.pop("shm_name", consts.shm_name),
+        "ring_bytes": options.pop("shm_ring_bytes", consts.shm_ring_bytes),
+        "poll_interval": options.pop(
+            "shm_poll_interval", consts.shm_poll_interval
+        ),
+        "max_poll_interval": options.pop(
+            "shm_max_poll_interval", consts.shm_max_poll_interval
+        ),
+    }
+    if bus == MEMORY:
+        return bus, {}
+    if bus == SHARED_MEMORY:
+        return bus, shm_kwargs
+    return bus, {"url": url, "channel": channel}
+
+
+def listener_kwargs(options=None):
+    """Builds the keyword arguments of the listener of the green apple server.
+
+    :param options: The dict of settings overriding the constants, whose keys
+                    prefixed with `grn_` and the listener settings are popped.
+                    The `presence_interval` and `tracing` are left for the
+                    red apple server. Defaults to None.
+
+    :return: The dict of keyword arguments for `Listener`.
+    """
+    options = {} if options is None else options
+    consts = RedServerConstants
+    return {
+        "host": options.pop("grn_server_host", consts.grn_server_host),
+        "port": options.pop("grn_server_port", consts.grn_server_port),
+        "client_namespace": consts.grn_client_nmsp,
+        "server_namespace": consts.grn_client_nmsp,
+        "push_enabled": options.pop("push_enabled", consts.push_enabled),
+        "listen_interval": options.pop(
+            "listen_interval", consts.listen_interval
+        ),
+        "fallback_interval": options.pop(
+            "fallback_interval", consts.fallback_interval
+        ),
+        "codec": options.pop("link_codec", consts.link_codec),
+        "compression": options.pop(
+            "link_compression", consts.link_compression
+        ),
+        "interest_filtering": options.pop(
+            "interest_filtering", consts.interest_filtering
+        ),
+        "presence_interval": options.get(
+            "presence_interval", consts.presence_interval
+        ),
+        "tracing": options.get("tracing", consts.tracing),
+        "offset_path": options.pop("offset_path", consts.offset_path),
+        "offset_sync_interval": options.pop(
+            "offset_sync_interval", consts.offset_sync_interval
+        ),
+    }
+
+
+def server_kwargs(options=None):
+    """Builds the keyword arguments of the red apple server.
+
+    :param options: The dict of keyword arguments overriding the settings.
+                    Defaults to None, which uses the settings alone.
+
+    :return: The dict of keyword arguments for `RedAppleServer`.
+    """
+    consts = RedServerConstants
+    kwargs = {
+        "host": consts.red_server_host,
+        "port": consts.red_server_port,
+        "client_namespace": consts.red_client_nmsp,
+        "server_namespace": consts.red_client_nmsp,
+        "broadcast_batch_size": consts.broadcast_batch_size,
+        "broadcast_batch_delay": consts.broadcast_batch_delay,
+        "compression_threshold": consts.compression_threshold,
+        "history_size": consts.history_size,
+        "outbound_high_water": consts.outbound_high_water,
+        "slow_consumer_policy": consts.slow_consumer_policy,
+        "send_window": consts.send_window,
+        "join_rate": consts.join_rate,
+        "join_burst": consts.join_burst,
+        "presence_interval": consts.presence_interval,
+        "node_address": consts.node_address,
+        "tracing": consts.tracing,
+        "trace_ring_size": consts.trace_ring_size,
+        "admin_token": consts.admin_token,
+        "snapshot_path": consts.snapshot_path,
+        "snapshot_interval": consts.snapshot_interval,
+        "snapshot_max_age": consts.snapshot_max_age,
+    }
+    kwargs.update(options or {})
+    return kwargs
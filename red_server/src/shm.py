@@ -0,0 +1,497 @@
+#!/bin/env python
+"""This file has the shared memory bus between a listener and a server process.
+
+With the `shm` bus, the `Listener` runs in a process of its own, so that
+decoding the data of the green apple server doesn't compete with broadcasting
+to red clients for one core. Both processes map one segment of shared memory,
+created by the red apple server, which holds:
+
+    - a ring of the published data of every three digit room id,
+    - a ring of the ids of the rooms with new data, one record per published
+      batch, which the server drains instead of polling a thousand rings,
+    - a bitmap of the active green ids, with one bit per three digit id,
+    - a ring of other messages in each direction, such as the rooms watched
+      by red clients, and data of ids which aren't three digits.
+
+Every ring has a single producer and a single consumer, so that neither needs
+a lock: the producer only moves the `head` after writing a record, and the
+consumer only moves the `tail` after reading one. Both counters are 8 byte
+aligned stores on their own cache lines, which relies on such stores being
+atomic and kept in order, as on x86-64. The bitmap is written by the listener
+only, under a sequence counter which the server reads before and after the
+bitmap to retry torn reads.
+
+The data of a room is handed over as one JSON record per published batch,
+which is encoded once by the listener and decoded once by the server. A batch
+too large for the ring of its room goes through the ring of other messages,
+which the server reads before the rings of the rooms. To keep the data of the
+room in order, the listener first waits till the server drained the ring of
+the room, and sends the later data of the room the same way till the server
+read the large batch.
+"""
+
+import json
+import time
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+
+SHARED_MEMORY = "shm"
+ROOMS = 1000                        # One ring per three digit id
+LENGTH_BYTES = 4                    # Length prefix of every record
+COUNTER_BYTES = 64                  # A cache line per counter
+HEADER_BYTES = 256                  # Sequence counter and bitmap
+BITMAP_OFFSET = 64
+LISTENER_NODE = "listener"          # Node of the messages of the listener
+
+
+def room_index(room_id):
+    """Returns the index of the ring of a room, given its three digit id.
+
+    :param room_id: The id of the room.
+
+    :return: The integer index, or `None` if the id isn't three digits.
+    """
+    if len(room_id) == 3 and room_id.isdigit():
+        return int(room_id)
+    return None
+
+
+class SpscRing:
+    """Class for a ring of length-prefixed records in a shared buffer.
+
+    The ring is made of the `head` counter, the `tail` counter and the
+    records, each counter on its own cache line. The counters only grow, and
+    the records wrap around the end of the ring.
+
+    :param self: The reference to class instance.
+    :param buffer: The `memoryview` of the shared memory.
+    :param offset: The 8 byte aligned offset of the ring in the buffer.
+    :param capacity: The number of bytes of the records.
+    """
+
+    def __init__(self, buffer, offset, capacity):
+        self.capacity = capacity
+        self.head = buffer[offset:offset + 8].cast("Q")
+        self.tail = buffer[
+            offset + COUNTER_BYTES:offset + COUNTER_BYTES + 8
+        ].cast("Q")
+        start = offset + 2 * COUNTER_BYTES
+        self.records = buffer[start:start + capacity]
+
+    @staticmethod
+    def size(capacity):
+        """Returns the number of bytes taken by a ring in the buffer.
+
+        :param capacity: The number of bytes of the records.
+
+        :return: The number of bytes, including the counters.
+        """
+        return 2 * COUNTER_BYTES + capacity
+
+    def write(self, position, data):
+        """Copies bytes into the records, wrapping around the end.
+
+        :param self: The reference to class instance.
+        :param position: The counter value of the first byte.
+        :param data: The bytes.
+
+        :return: None
+        """
+        start = position % self.capacity
+        first = min(len(data), self.capacity - start)
+        self.records[start:start + first] = data[:first]
+        if first < len(data):
+            self.records[:len(data) - first] = data[first:]
+
+    def read(self, position, length):
+        """Copies bytes out of the records, wrapping around the end.
+
+        :param self: The reference to class instance.
+        :param position: The counter value of the first byte.
+        :param length: The number of bytes.
+
+        :return: The bytes.
+        """
+        start = position % self.capacity
+        if start + length <= self.capacity:
+            return self.records[start:start + length].tobytes()
+        first = self.capacity - start
+        return (
+            self.records[start:].tobytes()
+            + self.records[:length - first].tobytes()
+        )
+
+    def fits(self, payload):
+        """Tells whether a payload fits in the empty ring at all.
+
+        :param self: The reference to class instance.
+        :param payload: The bytes of the record.
+
+        :return: Boolean.
+        """
+        return LENGTH_BYTES + len(payload) <= self.capacity
+
+    def put(self, payload):
+        """Appends a record, unless the ring is too full. Producer only.
+
+        :param self: The reference to class instance.
+        :param payload: The bytes of the record.
+
+        :return: Boolean, `False` if there is no room for the record yet.
+        """
+        head = self.head[0]
+        size = LENGTH_BYTES + len(payload)
+        if self.capacity - (head - self.tail[0]) < size:
+            return False
+        length = len(payload).to_bytes(LENGTH_BYTES, "little")
+        self.write(head, length + payload)
+        self.head[0] = head + size
+        return True
+
+    def drain(self):
+        """Removes and returns all the records. Consumer only.
+
+        The records are copied out of the ring at once, before moving the
+        `tail`.
+
+        :param self: The reference to class instance.
+
+        :return: The list of the bytes of the records, oldest first.
+        """
+        tail, head = self.tail[0], self.head[0]
+        if tail == head:
+            return []
+        records = self.read(tail, head - tail)
+        payloads = []
+        position = 0
+        while position < len(records):
+            start = position + LENGTH_BYTES
+            length = int.from_bytes(records[position:start], "little")
+            payloads.append(records[start:start + length])
+            position = start + length
+        self.tail[0] = head
+        return payloads
+
+    def release(self):
+        """Releases the views of the shared buffer.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        for view in (self.head, self.tail, self.records):
+            view.release()
+
+
+class PresenceBitmap:
+    """Class for the bitmap of the active three digit green ids.
+
+    :param self: The reference to class instance.
+    :param buffer: The `memoryview` of the shared memory.
+    """
+
+    def __init__(self, buffer):
+        self.version = buffer[:8].cast("Q")
+        self.bits = buffer[BITMAP_OFFSET:BITMAP_OFFSET + (ROOMS + 7) // 8]
+
+    def write(self, green_ids):
+        """Replaces the active ids. Listener only.
+
+        The sequence counter is odd while the bits are written.
+
+        :param self: The reference to class instance.
+        :param green_ids: The iterable of three digit ids.
+
+        :return: None
+        """
+        bits = bytearray(len(self.bits))
+        for green_id in green_ids:
+            index = room_index(green_id)
+            bits[index // 8] |= 1 << (index % 8)
+        self.version[0] += 1
+        self.bits[:] = bits
+        self.version[0] += 1
+
+    def read(self):
+        """Returns the version and the active ids, retrying torn reads.
+
+        :param self: The reference to class instance.
+
+        :return: The tuple of the even version and the list of active ids.
+        """
+        while True:
+            version = self.version[0]
+            bits = self.bits.tobytes()
+            if version % 2 == 0 and version == self.version[0]:
+                break
+        return version, [
+            f"{index:03d}" for index in range(ROOMS)
+            if bits[index // 8] >> (index % 8) & 1
+        ]
+
+    def release(self):
+        """Releases the views of the shared buffer.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.version.release()
+        self.bits.release()
+
+
+class SharedMemoryBus:
+    """Class for the bus between the listener and the server processes.
+
+    The server creates the shared memory and consumes the data and the active
+    ids, which the listener produces after attaching to it. Messages of the
+    server, such as the rooms it watches, are dropped while their ring is
+    full, as they are announced again periodically, whereas the listener
+    waits for room in the rings of the server. Retained messages need no
+    special care, as the bitmap and the rings keep them till the server reads
+    them. Topics are ignored, as only one server is connected.
+
+    :param self: The reference to class instance.
+    :param name: The name of the shared memory segment.
+    :param ring_bytes: The number of bytes of the ring of every room, a
+                       multiple of 8 so that all counters stay aligned.
+    :param control_bytes: The number of bytes of the rings of other messages
+                          and of the ring of rooms with new data, a multiple
+                          of 8 as well.
+    :param owner: Boolean, `True` in the server process, which creates the
+                  segment, and `False` in the listener process.
+    :param poll_interval: The number of seconds the receiving task sleeps
+                          once nothing was received, doubled every time
+                          nothing was received again.
+    :param max_poll_interval: The number of seconds the receiving task sleeps
+                              at most while idle.
+    """
+    name = SHARED_MEMORY
+
+    def __init__(self, name="red_apple", ring_bytes=16384,
+                 control_bytes=1048576, owner=True, poll_interval=0.001,
+                 max_poll_interval=0.02):
+        if ring_bytes % 8 or control_bytes % 8:
+            raise ValueError("The ring sizes must be multiples of 8 bytes")
+        self.segment_name = name
+        self.owner = owner
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(poll_interval, max_poll_interval)
+        self.closed = False
+        self.dropped = 0                # Messages dropped by a full ring
+        self.detours = {}               # Room index -> end of its large batch
+        size = (
+            HEADER_BYTES + 3 * SpscRing.size(control_bytes)
+            + ROOMS * SpscRing.size(ring_bytes)
+        )
+        if owner:
+            self.shm = self.create_segment(name, size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # Only the owner unlinks the segment, see bpo-38119
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        buffer = self.shm.buf
+        self.presence = PresenceBitmap(buffer)
+        offset = HEADER_BYTES
+        rings = []
+        for capacity in [control_bytes] * 3 + [ring_bytes] * ROOMS:
+            rings.append(SpscRing(buffer, offset, capacity))
+            offset += SpscRing.size(capacity)
+        to_server, to_listener, self.pending_rooms = rings[:3]
+        self.rooms = rings[3:]
+        self.outbox = to_listener if owner else to_server
+        self.inbox = to_server if owner else to_listener
+
+    @staticmethod
+    def create_segment(name, size):
+        """Creates the shared memory, replacing one left by a crashed server.
+
+        :param name: The name of the segment.
+        :param size: The number of bytes.
+
+        :return: The `SharedMemory` instance.
+        """
+        try:
+            return shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+        return shared_memory.SharedMemory(name, create=True, size=size)
+
+    def put(self, ring, payload, wait):
+        """Appends a record to a ring, waiting for room in it if asked to.
+
+        :param self: The reference to class instance.
+        :param ring: The `SpscRing`.
+        :param payload: The bytes of the record.
+        :param wait: Boolean, whether to wait while the ring is full.
+
+        :return: Boolean, `False` if the record was dropped.
+        """
+        if not ring.fits(payload):
+            print(f"WARNING: Dropped a {len(payload)} bytes record of the bus")
+            self.dropped += 1
+            return False
+        while not ring.put(payload):
+            if not wait or self.closed:
+                print("WARNING: Dropped a message of the bus, its ring is "
+                      "full")
+                self.dropped += 1
+                return False
+            time.sleep(self.poll_interval)
+        return True
+
+    def publish(self, message, retain=None, topic=None):
+        """Delivers a message to the other process.
+
+        :param self: The reference to class instance.
+        :param message: The JSON serializable dict to be delivered.
+        :param retain: Unused, see the class.
+        :param topic: Unused, see the class.
+
+        :return: None
+        """
+        if self.owner:
+            self.put(self.outbox, json.dumps(message).encode(), wait=False)
+            return
+        # A roster with ids other than three digits is sent as a message
+        if message["kind"] == "roster" and all(
+                room_index(green_id) is not None
+                for green_id in message["active"]):
+            self.presence.write(message["active"])
+            return
+        if message["kind"] != "data":
+            self.put(self.outbox, json.dumps(message).encode(), wait=True)
+            return
+        room_data, other_data = {}, []
+        for (room_id, data) in message["data"]:
+            index = room_index(room_id)
+            if index is None:
+                other_data.append((room_id, data))
+            else:
+                room_data.setdefault(index, []).append(data)
+        indexes, detoured = array("H"), []
+        for index, data in room_data.items():
+            payload = json.dumps(data).encode()
+            ring = self.rooms[index]
+            if self.detours.get(index, 0) > self.outbox.tail[0]:
+                detoured.append(index)
+            elif ring.fits(payload):
+                self.detours.pop(index, None)
+                self.put(ring, payload, wait=True)
+                indexes.append(index)
+                continue
+            else:
+                self.wait_until_drained(ring)
+                detoured.append(index)
+            room_id = f"{index:03d}"
+            other_data.extend((room_id, item) for item in data)
+        if indexes:
+            self.put(self.pending_rooms, indexes.tobytes(), wait=True)
+        if other_data:
+            self.put(
+                self.outbox,
+                json.dumps({"kind": "data", "data": other_data}).encode(),
+                wait=True
+            )
+            for index in detoured:
+                self.detours[index] = self.outbox.head[0]
+
+    def wait_until_drained(self, ring):
+        """Waits till the server read every record of a ring.
+
+        :param self: The reference to class instance.
+        :param ring: The `SpscRing` of a room.
+
+        :return: None
+        """
+        while ring.tail[0] != ring.head[0] and not self.closed:
+            time.sleep(self.poll_interval)
+
+    def subscribe(self, callback, start_task, topics=()):
+        """Delivers the messages of the other process in a background task.
+
+        :param self: The reference to class instance.
+        :param callback: The callable receiving every message.
+        :param start_task: The callable starting the background task which
+                           receives messages, such as the
+                           `start_background_task` method of SocketIO objects.
+        :param topics: Unused, see the class.
+
+        :return: None
+        """
+        start_task(self.receive, callback)
+
+    def receive(self, callback):
+        """Delivers the messages of the other process till the bus is closed.
+
+        The server receives the active ids as a roster message whenever the
+        bitmap changes, and the data of all rooms with new data as a single
+        data message. While nothing is received, the task sleeps longer
+        every time, up to `max_poll_interval`.
+
+        :param self: The reference to class instance.
+        :param callback: The callable receiving every message.
+
+        :return: None
+        """
+        known_version = 0
+        interval = self.poll_interval
+        while not self.closed:
+            received = False
+            if self.owner and self.presence.version[0] != known_version:
+                known_version, active = self.presence.read()
+                callback({
+                    "kind": "roster", "node": LISTENER_NODE, "active": active
+                })
+            for payload in self.inbox.drain():
+                callback(json.loads(payload))
+                received = True
+            if self.owner:
+                received = self.receive_room_data(callback) or received
+            if received:
+                interval = self.poll_interval
+                time.sleep(0)
+                continue
+            time.sleep(interval)
+            interval = min(2 * interval, self.max_poll_interval)
+
+    def receive_room_data(self, callback):
+        """Delivers the data of the rooms with new data as one message.
+
+        :param self: The reference to class instance.
+        :param callback: The callable receiving the message.
+
+        :return: Boolean, `True` if any data was received.
+        """
+        indexes = {}
+        for payload in self.pending_rooms.drain():
+            indexes.update(dict.fromkeys(array("H", payload)))
+        new_data = []
+        for index in indexes:
+            payloads = self.rooms[index].drain()
+            if not payloads:
+                continue
+            room_id = f"{index:03d}"
+            # The records of a room are decoded at once, as a list of lists
+            for data in json.loads(b"[" + b",".join(payloads) + b"]"):
+                new_data.extend((room_id, item) for item in data)
+        if new_data:
+            callback({"kind": "data", "data": new_data})
+        return bool(indexes)
+
+    def close(self):
+        """Stops receiving and unmaps the segment, which the owner removes.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.closed = True
+        self.presence.release()
+        for ring in [self.inbox, self.outbox, self.pending_rooms] + self.rooms:
+            ring.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
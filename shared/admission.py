@@ -0,0 +1,107 @@
+#!/bin/env python
+"""This file has the admission control of joins and published data.
+
+A `TokenBucket` admits events at a steady rate with a burst, such as the joins
+of all clients reconnecting at once after a restart. Throttled callers are told
+when to retry, and their retries are spread at the rate of the bucket, so that
+they don't come back as another storm. A `RateLimiter` keeps a bucket per key,
+such as the data published by every green id, and tells a throttled key only
+once per throttled period.
+"""
+
+import time
+
+
+class TokenBucket:
+    """Class for a token bucket refilled at a steady rate.
+
+    :param self: The reference to class instance.
+    :param rate: The number of tokens added per second.
+    :param burst: The number of tokens the bucket holds at most.
+    :param clock: The callable returning the current time in seconds.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+        self.retry_at = 0.0             # Time handed to the last throttled
+
+    def take(self):
+        """Takes a token, or tells when to retry if none is left.
+
+        :param self: The reference to class instance.
+
+        :return: `0.0` if a token was taken, otherwise the number of seconds
+                 after which to retry.
+        """
+        now = self.clock()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        # Every throttled caller gets its own slot of the refill rate
+        self.retry_at = max(
+            self.retry_at + 1 / self.rate,
+            now + (1 - self.tokens) / self.rate
+        )
+        return self.retry_at - now
+
+
+class RateLimiter:
+    """Class with a `TokenBucket` per key.
+
+    :param self: The reference to class instance.
+    :param rate: The number of events admitted per second and key.
+    :param burst: The number of events admitted at once per key.
+    :param clock: The callable returning the current time in seconds.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.buckets = {}               # Key -> its `TokenBucket`
+        self.throttled_until = {}       # Key -> end of its throttled period
+
+    def admit(self, key):
+        """Admits an event of a key, unless the key exceeds its rate.
+
+        :param self: The reference to class instance.
+        :param key: The key, such as a green id.
+
+        :return: A tuple of whether the event is admitted and the number of
+                 seconds after which to retry. The seconds are `None` when
+                 admitted, or when the key was already told during the
+                 current throttled period. For example:
+                    (True, None)
+                    (False, 0.25)
+        """
+        if self.clock() < self.throttled_until.get(key, 0.0):
+            return False, None
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(
+                self.rate, self.burst, self.clock
+            )
+        retry_after = bucket.take()
+        if not retry_after:
+            return True, None
+        self.throttled_until[key] = self.clock() + retry_after
+        return False, retry_after
+
+    def forget(self, key):
+        """Forgets the bucket of a key, such as a green id which left.
+
+        :param self: The reference to class instance.
+        :param key: The key.
+
+        :return: None
+        """
+        self.buckets.pop(key, None)
+        self.throttled_until.pop(key, None)
@@ -0,0 +1,275 @@
+#!/bin/env python
+"""This file has the asyncio transport of the servers and clients.
+
+The asyncio variants of the servers and clients, chosen by the `use_asyncio`
+setting, run on `socketio.AsyncServer` and `socketio.AsyncClient` over
+`aiohttp` in a single event loop instead of on eventlet green threads. They
+reuse the event handlers of the eventlet variants, which only use the part of
+the Flask `SocketIO` and `socketio.Client` interfaces wrapped here. Handlers
+stay synchronous, since emitting only schedules a task on the event loop,
+while the loops of the variants await events and timers instead of sleeping
+green threads. It needs the `aiohttp` package.
+"""
+
+import asyncio
+import sys
+
+import socketio
+from aiohttp import web
+from socketio import exceptions as sio_exceptions
+
+deferred_tasks = []             # Tasks started once the event loop runs
+
+
+def start_task(target, *args):
+    """Starts a coroutine function as a task, or calls a function soon.
+
+    Tasks started before the event loop runs are deferred till it runs, see
+    `start_deferred_tasks`.
+
+    :param target: The coroutine function or function.
+    :param args: The arguments of the target.
+
+    :return: The `asyncio.Task`, or `None` for a function or a deferred task.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        deferred_tasks.append((target, args))
+        return None
+    if asyncio.iscoroutinefunction(target):
+        return loop.create_task(target(*args))
+    loop.call_soon(target, *args)
+    return None
+
+
+def start_deferred_tasks():
+    """Starts the tasks deferred till the event loop runs.
+
+    :return: The list of started `asyncio.Task` instances.
+    """
+    tasks = []
+    while deferred_tasks:
+        target, args = deferred_tasks.pop(0)
+        task = start_task(target, *args)
+        if task is not None:
+            tasks.append(task)
+    return tasks
+
+
+def run_until_done():
+    """Runs the event loop till no task is left, as the clients do.
+
+    :return: None
+    """
+    async def main():
+        start_deferred_tasks()
+        current = asyncio.current_task()
+        while True:
+            tasks = asyncio.all_tasks() - {current}
+            if not tasks:
+                return
+            await asyncio.wait(tasks)
+
+    asyncio.run(main())
+
+
+def delayed(delay):
+    """Returns a `start_task` for a `MicroBatcher` which waits for a delay.
+
+    With `no_sleep` as its `sleep`, the batcher has the event loop call the
+    flush of a batch after the delay, instead of starting a task which sleeps
+    first.
+
+    :param delay: The number of seconds after which a flush is called.
+
+    :return: The callable calling a function after the delay.
+    """
+    def start_later(target, *args):
+        asyncio.get_running_loop().call_later(delay, target, *args)
+
+    return start_later
+
+
+def no_sleep(seconds):
+    """Returns right away, see `delayed`.
+
+    :param seconds: The ignored number of seconds.
+
+    :return: None
+    """
+
+
+class AsyncSessions:
+    """Class for the rooms and sessions of `socketio.AsyncServer`, like the
+    `server` of the Flask `SocketIO`.
+
+    :param self: The reference to class instance.
+    :param sio: The `socketio.AsyncServer`.
+    """
+
+    def __init__(self, sio):
+        self.sio = sio
+
+    def enter_room(self, sid, room, namespace=None):
+        self.sio.enter_room(sid, room, namespace=namespace)
+
+    def leave_room(self, sid, room, namespace=None):
+        self.sio.leave_room(sid, room, namespace=namespace)
+
+    def disconnect(self, sid, namespace=None):
+        start_task(self.sio.disconnect, sid, namespace)
+
+
+class AsyncServerTransport:
+    """Class wrapping `socketio.AsyncServer` and its `aiohttp` app like the
+    Flask `SocketIO`.
+
+    Event handlers are called with the arguments of the event only, like with
+    Flask, and the session id of the client is kept in `sid` meanwhile.
+
+    :param self: The reference to class instance.
+    """
+
+    sleep = staticmethod(asyncio.sleep)
+
+    def __init__(self):
+        self.sio = socketio.AsyncServer(async_mode="aiohttp")
+        self.app = web.Application()
+        self.sio.attach(self.app)
+        self.server = AsyncSessions(self.sio)
+        self.sid = None                 # Session id of the handled event
+
+    def on_event(self, event, handler, namespace=None):
+        """Registers an event handler.
+
+        :param self: The reference to class instance.
+        :param event: The name of the event.
+        :param handler: The event handler.
+        :param namespace: The namespace of the event.
+
+        :return: None
+        """
+        def session_handler(sid, *args):
+            self.sid = sid
+            # Connect handlers get the environ, unlike with Flask
+            if event == "connect":
+                args = ()
+            return handler(*args)
+
+        self.sio.on(event, session_handler, namespace=namespace)
+
+    def emit(self, event, data=None, room=None, namespace=None,
+             callback=None):
+        """Schedules emitting an event to a room or a session.
+
+        :param self: The reference to class instance.
+        :param event: The name of the event.
+        :param data: The optional data of the event.
+        :param room: The room or the session id of the recipients.
+        :param namespace: The namespace of the event.
+        :param callback: The callable called with the acknowledgement.
+
+        :return: None
+        """
+        asyncio.ensure_future(self.sio.emit(
+            event, data, room=room, namespace=namespace, callback=callback
+        ))
+
+    def start_background_task(self, target, *args):
+        return start_task(target, *args)
+
+    def run(self, app, host=None, port=None):
+        """Runs the app and the deferred tasks till the server is stopped.
+
+        :param self: The reference to class instance.
+        :param app: The `aiohttp` app.
+        :param host: The host to listen on.
+        :param port: The port to listen on.
+
+        :return: None
+        """
+        async def on_startup(app):
+            start_deferred_tasks()
+
+        app.on_startup.append(on_startup)
+        web.run_app(app, host=host, port=int(port), print=None)
+
+
+class AsyncClientTransport:
+    """Class wrapping `socketio.AsyncClient` like `socketio.Client`.
+
+    :param self: The reference to class instance.
+    :param kwargs: The keyword arguments of `socketio.AsyncClient`.
+    """
+
+    sleep = staticmethod(asyncio.sleep)
+
+    def __init__(self, **kwargs):
+        self.client = socketio.AsyncClient(**kwargs)
+
+    @property
+    def connected(self):
+        return self.client.connected
+
+    def register_namespace(self, namespace_handler):
+        """Registers the `on_` methods of a client namespace as handlers.
+
+        A `ClientNamespace` can't be registered with `socketio.AsyncClient`,
+        so its methods are registered one by one for its namespace.
+
+        :param self: The reference to class instance.
+        :param namespace_handler: The `ClientNamespace` instance.
+
+        :return: None
+        """
+        for name in dir(namespace_handler):
+            if name.startswith("on_"):
+                self.client.on(
+                    name[3:],
+                    getattr(namespace_handler, name),
+                    namespace=namespace_handler.namespace
+                )
+
+    async def connect_and_wait(self, url, namespaces, server):
+        """Connects to a server and waits till the client is disconnected.
+
+        Connection errors are printed and exit, like in the eventlet clients.
+
+        :param self: The reference to class instance.
+        :param url: The URL of the server.
+        :param namespaces: The list of namespaces to connect to.
+        :param server: The name of the server, such as `green server`.
+
+        :return: None
+        """
+        try:
+            await self.client.connect(url, namespaces=namespaces)
+        except sio_exceptions.BadNamespaceError as ex:
+            print(f"ERROR: {ex} (possibly wrong namespace, check again)")
+            sys.exit(1)
+        except sio_exceptions.ConnectionError as ex:
+            print(f"ERROR: {ex} ({server} unreachable or not running)")
+            sys.exit(1)
+        await self.client.wait()
+
+    def emit(self, event, data=None, namespace=None, callback=None):
+        """Schedules emitting an event to the server.
+
+        :param self: The reference to class instance.
+        :param event: The name of the event.
+        :param data: The optional data of the event.
+        :param namespace: The namespace of the event.
+        :param callback: The callable called with the acknowledgement.
+
+        :return: None
+        """
+        asyncio.ensure_future(self.client.emit(
+            event, data, namespace=namespace, callback=callback
+        ))
+
+    def disconnect(self):
+        start_task(self.client.disconnect)
+
+    def start_background_task(self, target, *args):
+        return start_task(target, *args)
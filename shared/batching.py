@@ -0,0 +1,138 @@
+#!/bin/env python
+"""This file has the micro-batching of messages sent over a connection.
+
+Sending every small message as its own Socket.IO packet makes the per-packet
+overhead dominate. A `MicroBatcher` collects messages and hands them out as one
+batch once the batch is full or the oldest message waited for the maximum
+delay, whichever comes first. The sizes of the flushed batches are recorded in
+a `BatchSizeHistogram`.
+"""
+
+from threading import Lock
+
+
+class BatchSizeHistogram:
+    """Class to record the distribution of batch sizes.
+
+    Sizes are counted in buckets with upper bounds of powers of two, i.e. a
+    batch of 3 messages is counted in the bucket `4`.
+    """
+
+    def __init__(self, max_bucket=1024):
+        self.bounds = [1]
+        while self.bounds[-1] < max_bucket:
+            self.bounds.append(self.bounds[-1] * 2)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.batches = 0
+        self.messages = 0
+
+    def observe(self, size):
+        """Records the size of a flushed batch.
+
+        :param self: The reference to class instance.
+        :param size: The number of messages in the batch.
+
+        :return: None
+        """
+        self.batches += 1
+        self.messages += size
+        for index, bound in enumerate(self.bounds):
+            if size <= bound:
+                self.counts[index] += 1
+                return
+        self.counts[-1] += 1
+
+    def stats(self):
+        """Returns the number of batches per bucket and the totals.
+
+        :param self: The reference to class instance.
+
+        :return: A dict of counters. For example:
+                    {"batches": 3, "messages": 7, "buckets": {"1": 1, ...}}
+        """
+        buckets = {
+            str(bound): count for bound, count in zip(self.bounds, self.counts)
+        }
+        buckets["+Inf"] = self.counts[-1]
+        return {
+            "batches": self.batches,
+            "messages": self.messages,
+            "buckets": buckets,
+        }
+
+
+class MicroBatcher:
+    """Class to collect messages and flush them in batches.
+
+    :param self: The reference to class instance.
+    :param flush: The callable which sends a list of messages as one batch.
+    :param start_task: The callable starting a background task, such as the
+                       `start_background_task` method of SocketIO objects.
+    :param sleep: The callable sleeping for a number of seconds, such as the
+                  `sleep` method of SocketIO objects.
+    :param max_size: The number of messages which flushes a batch right away.
+    :param max_delay: The number of seconds after which a batch is flushed.
+                      A delay of `0` flushes every message on its own.
+    """
+
+    def __init__(self, flush, start_task, sleep, max_size=100,
+                 max_delay=0.005):
+        self.flush_batch = flush
+        self.start_task = start_task
+        self.sleep = sleep
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.histogram = BatchSizeHistogram()
+        self.messages = []
+        self.flush_scheduled = False
+        self.lock = Lock()
+
+    def add(self, message):
+        """Adds a message to the current batch.
+
+        The batch is flushed right away if it is full or if batching is
+        disabled. Otherwise a flush is scheduled after the maximum delay.
+
+        :param self: The reference to class instance.
+        :param message: The message to be sent.
+
+        :return: None
+        """
+        with self.lock:
+            self.messages.append(message)
+            flush_now = (
+                len(self.messages) >= self.max_size or self.max_delay <= 0
+            )
+            schedule = not flush_now and not self.flush_scheduled
+            if schedule:
+                self.flush_scheduled = True
+        if flush_now:
+            self.flush()
+        elif schedule:
+            self.start_task(self.flush_later)
+
+    def flush_later(self):
+        """Flushes the current batch after the maximum delay.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.sleep(self.max_delay)
+        with self.lock:
+            self.flush_scheduled = False
+        self.flush()
+
+    def flush(self):
+        """Sends the collected messages as one batch, if there are any.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        with self.lock:
+            messages, self.messages = self.messages, []
+        if not messages:
+            return
+        self.histogram.observe(len(messages))
+        self.flush_batch(messages)
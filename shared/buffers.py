@@ -0,0 +1,260 @@
+#!/bin/env python
+"""This file has the bounded buffers holding the pending data of every room.
+
+Every room has a ring buffer of pending data, limited by a capacity per room
+and a total capacity over all the rooms. When a buffer is full, the eviction
+policy either drops the oldest pending data or rejects the newest one. Data of
+rooms without subscribers can additionally expire after a time to live. Every
+evicted item is counted, by reason and by room.
+"""
+
+import time
+from collections import Counter, deque
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+EXPIRED = "expired"
+
+
+class RoomBuffers:
+    """Class for bounded per-room buffers of pending data.
+
+    :param self: The reference to class instance.
+    :param room_capacity: The maximum number of pending items per room.
+    :param total_capacity: The maximum number of pending items of all rooms.
+    :param policy: Either `drop_oldest` or `drop_newest`, to decide which item
+                   is evicted when a buffer is full. Defaults to `drop_oldest`.
+    :param ttl: The optional number of seconds after which pending items of
+                rooms without subscribers expire. Defaults to `None`, which
+                keeps them till they are evicted by the capacity limits.
+    """
+
+    def __init__(self, room_capacity=1000, total_capacity=100000,
+                 policy=DROP_OLDEST, ttl=None):
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown eviction policy '{policy}'")
+        self.room_capacity = room_capacity
+        self.total_capacity = total_capacity
+        self.policy = policy
+        self.ttl = ttl
+        self.buffers = {}                   # Room id -> deque of (time, data)
+        self.total = 0
+        self.evicted = Counter()            # Reason -> evicted items
+        self.evicted_per_room = Counter()   # Room id -> evicted items
+        self.last_expiry = time.monotonic()
+
+    def __len__(self):
+        return self.total
+
+    def __bool__(self):
+        return self.total > 0
+
+    def _evict(self, room_id, reason, count=1):
+        self.evicted[reason] += count
+        self.evicted_per_room[room_id] += count
+
+    def _pop_oldest(self, room_id):
+        buffer = self.buffers[room_id]
+        buffer.popleft()
+        self.total -= 1
+        if not buffer:
+            del self.buffers[room_id]
+        self._evict(room_id, DROP_OLDEST)
+
+    def append(self, room_id, data):
+        """Stores new pending data of a room, evicting data if it is full.
+
+        With the `drop_oldest` policy, the room drops its own oldest item, so
+        that a chatty producer can't push out the data of other rooms. Only a
+        room without pending data, when the total capacity is reached, drops
+        the oldest item of the room with the most pending items instead. With
+        the `drop_newest` policy, the new data is rejected.
+
+        :param self: The reference to class instance.
+        :param room_id: The three digit id of the room.
+        :param data: The data to be stored.
+
+        :return: Boolean, `True` if the data was stored.
+        """
+        room_full = len(self.buffers.get(room_id, ())) >= self.room_capacity
+        if room_full or self.total >= self.total_capacity:
+            if self.policy == DROP_NEWEST:
+                self._evict(room_id, DROP_NEWEST)
+                return False
+            if room_id in self.buffers:
+                self._pop_oldest(room_id)
+            else:
+                largest = max(self.buffers, key=lambda r: len(self.buffers[r]))
+                self._pop_oldest(largest)
+        self.buffers.setdefault(room_id, deque()).append(
+            (time.monotonic(), data)
+        )
+        self.total += 1
+        return True
+
+    def extend(self, new_data):
+        """Stores a list of tuples of room id and data.
+
+        :param self: The reference to class instance.
+        :param new_data: The list of tuples. For example:
+                            [("123", "data1"), ("456", "data2")]
+
+        :return: None
+        """
+        for (room_id, data) in new_data:
+            self.append(room_id, data)
+
+    def prepend(self, old_data):
+        """Puts back data in front of the pending data of its rooms.
+
+        This is used for data which was handed out but not delivered. Items
+        which don't fit in the capacity of their room anymore are evicted.
+
+        :param self: The reference to class instance.
+        :param old_data: The list of tuples of room id and data, in the order
+                         in which they were handed out.
+
+        :return: None
+        """
+        now = time.monotonic()
+        for (room_id, data) in reversed(old_data):
+            if (self.pending(room_id) >= self.room_capacity
+                    or self.total >= self.total_capacity):
+                self._evict(room_id, self.policy)
+                continue
+            self.buffers.setdefault(room_id, deque()).appendleft((now, data))
+            self.total += 1
+
+    def take(self, room_id):
+        """Removes and returns all the pending data of a room.
+
+        :param self: The reference to class instance.
+        :param room_id: The three digit id of the room.
+
+        :return: The list of data in order of arrival.
+        """
+        buffer = self.buffers.pop(room_id, ())
+        self.total -= len(buffer)
+        return [data for (_, data) in buffer]
+
+    def take_all(self):
+        """Removes and returns the pending data of all the rooms.
+
+        :param self: The reference to class instance.
+
+        :return: The list of tuples of room id and data, in order of arrival
+                 for each room.
+        """
+        new_data = self.peek_all()
+        self.clear()
+        return new_data
+
+    def peek_all(self):
+        """Returns the pending data of all the rooms without removing it.
+
+        :param self: The reference to class instance.
+
+        :return: The list of tuples of room id and data, in order of arrival
+                 for each room.
+        """
+        return [
+            (room_id, data) for room_id, buffer in self.buffers.items()
+            for (_, data) in buffer
+        ]
+
+    def take_rooms(self, room_ids):
+        """Removes and returns the pending data of some of the rooms.
+
+        :param self: The reference to class instance.
+        :param room_ids: The set of room ids whose data is taken.
+
+        :return: The list of tuples of room id and data, in order of arrival
+                 for each room.
+        """
+        new_data = []
+        for room_id in [r for r in self.buffers if r in room_ids]:
+            new_data.extend((room_id, data) for data in self.take(room_id))
+        return new_data
+
+    def clear(self):
+        """Discards all the pending data without counting it as evicted.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.buffers = {}
+        self.total = 0
+
+    def pending(self, room_id):
+        """Returns the number of pending items of a room.
+
+        :param self: The reference to class instance.
+        :param room_id: The three digit id of the room.
+
+        :return: Integer count of pending items.
+        """
+        return len(self.buffers.get(room_id, ()))
+
+    def pending_per_room(self):
+        """Returns the number of pending items of every room with any.
+
+        :param self: The reference to class instance.
+
+        :return: A dict of room id -> integer count of pending items.
+        """
+        return {
+            room_id: len(buffer) for room_id, buffer in self.buffers.items()
+        }
+
+    def expire(self, is_subscribed):
+        """Drops pending data older than the time to live in unwatched rooms.
+
+        Expiry runs at most once per second, or once per time to live if it
+        is shorter, so that it can be called on every new data.
+
+        :param self: The reference to class instance.
+        :param is_subscribed: The callable returning whether a room id still
+                              has subscribers, whose data is kept.
+
+        :return: Integer count of expired items.
+        """
+        now = time.monotonic()
+        if self.ttl is None or now - self.last_expiry < min(self.ttl, 1.0):
+            return 0
+        self.last_expiry = now
+        expired_at = now - self.ttl
+        expired = 0
+        for room_id in list(self.buffers):
+            if is_subscribed(room_id):
+                continue
+            buffer = self.buffers[room_id]
+            count = 0
+            while buffer and buffer[0][0] < expired_at:
+                buffer.popleft()
+                count += 1
+            if not buffer:
+                del self.buffers[room_id]
+            if count:
+                self.total -= count
+                self._evict(room_id, EXPIRED, count)
+                expired += count
+        return expired
+
+    def stats(self):
+        """Returns the counters of pending and evicted items.
+
+        :param self: The reference to class instance.
+
+        :return: A dict of counters. For example:
+                    {
+                        "pending": 12,
+                        "evicted": {"drop_oldest": 3},
+                        "evicted_per_room": {"123": 3}
+                    }
+        """
+        return {
+            "pending": self.total,
+            "evicted": dict(self.evicted),
+            "evicted_per_room": dict(self.evicted_per_room),
+        }
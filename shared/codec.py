@@ -0,0 +1,212 @@
+#!/bin/env python
+"""This file has the codecs for payloads between green and red apple servers.
+
+A payload is the dict returned for `listen` calls and pushed to the red apple
+server. It holds the new published data and the roster update, and with the
+message log enabled, the log ``offset`` to resume from and whether a replay is
+``done``. For example:
+
+    {
+        "data": [("123", "data1"), ("456", "data2")],
+        "roster": {"version": 7, "changes": [(7, "join", "456")]},
+        "offset": 1024
+    }
+
+The `json` codec leaves the payload to the JSON encoding of Socket.IO and is
+the default. The `binary` codec packs it in a length-prefixed `struct` layout
+with the three digit ids as small integers, which Socket.IO sends as a binary
+attachment. Payloads which can't be packed, e.g. with ids which aren't three
+digits, fall back to the `json` codec. Decoding tells both apart by type.
+"""
+
+import json
+import struct
+
+FORMAT_VERSION = 2
+NO_ROSTER, ROSTER_SNAPSHOT, ROSTER_CHANGES = 0, 1, 2
+HAS_OFFSET, REPLAY_DONE = 1, 2
+TEXT_DATA, JSON_DATA = 0, 1
+ROSTER_OPS = {"join": 0, "leave": 1}
+ROSTER_OP_NAMES = {code: name for name, code in ROSTER_OPS.items()}
+
+# Format, roster kind, roster version, log offset and flags
+HEADER = struct.Struct("!BBIQB")
+COUNT = struct.Struct("!I")
+ROSTER_ID = struct.Struct("!H")
+ROSTER_CHANGE = struct.Struct("!IBH")   # Version, op, id
+DATA_ITEM = struct.Struct("!HBI")       # Id, data kind, data length
+
+
+def id_to_int(green_id):
+    """Converts a three digit id to its integer, checking it round-trips.
+
+    :param green_id: The three digit id, such as `"007"`.
+
+    :return: The integer of the id.
+    """
+    if len(green_id) != 3 or not green_id.isdigit():
+        raise ValueError(f"Id '{green_id}' is not three digits")
+    return int(green_id)
+
+
+class JsonCodec:
+    """Codec leaving payloads as they are, to be sent as JSON by Socket.IO.
+    """
+    name = "json"
+
+    @staticmethod
+    def encode(payload):
+        return payload
+
+    @staticmethod
+    def decode(payload):
+        return payload
+
+
+class BinaryCodec:
+    """Codec packing payloads in a compact length-prefixed binary layout.
+    """
+    name = "binary"
+
+    @staticmethod
+    def encode(payload):
+        """Packs a payload in bytes.
+
+        :param payload: The dict with ``data`` and ``roster`` to be packed.
+
+        :return: The packed bytes, or the payload itself if it can't be
+                 packed, so that it is sent as JSON.
+        """
+        try:
+            return BinaryCodec.pack(payload)
+        except (ValueError, struct.error):
+            return payload
+
+    @staticmethod
+    def pack(payload):
+        """Packs a payload in bytes, raising `ValueError` if it can't.
+
+        :param payload: The dict with ``data`` and ``roster`` to be packed.
+
+        :return: The packed bytes.
+        """
+        parts = []
+        offset, flags = payload.get("offset"), 0
+        if offset is not None:
+            flags |= HAS_OFFSET
+        if payload.get("done"):
+            flags |= REPLAY_DONE
+        tail = (offset or 0, flags)
+        roster = payload.get("roster")
+        if not roster:
+            parts.append(HEADER.pack(FORMAT_VERSION, NO_ROSTER, 0, *tail))
+        elif "active" in roster:
+            parts.append(HEADER.pack(
+                FORMAT_VERSION, ROSTER_SNAPSHOT, roster["version"], *tail
+            ))
+            parts.append(COUNT.pack(len(roster["active"])))
+            parts.extend(
+                ROSTER_ID.pack(id_to_int(green_id))
+                for green_id in roster["active"]
+            )
+        else:
+            parts.append(HEADER.pack(
+                FORMAT_VERSION, ROSTER_CHANGES, roster["version"], *tail
+            ))
+            parts.append(COUNT.pack(len(roster["changes"])))
+            parts.extend(
+                ROSTER_CHANGE.pack(
+                    version, ROSTER_OPS[op], id_to_int(green_id)
+                )
+                for (version, op, green_id) in roster["changes"]
+            )
+        new_data = payload.get("data") or []
+        parts.append(COUNT.pack(len(new_data)))
+        for (green_id, data) in new_data:
+            if isinstance(data, str):
+                kind, raw = TEXT_DATA, data.encode("utf-8")
+            else:
+                kind, raw = JSON_DATA, json.dumps(data).encode("utf-8")
+            parts.append(DATA_ITEM.pack(id_to_int(green_id), kind, len(raw)))
+            parts.append(raw)
+        return b"".join(parts)
+
+    @staticmethod
+    def decode(raw):
+        """Unpacks a payload packed by `encode`.
+
+        :param raw: The packed bytes.
+
+        :return: The dict with ``data``, ``roster``, ``offset`` and ``done``.
+        """
+        view = memoryview(raw)
+        fmt, kind, version, log_offset, flags = HEADER.unpack_from(view, 0)
+        if fmt != FORMAT_VERSION:
+            raise ValueError(f"Unknown payload format {fmt}")
+        offset = HEADER.size
+        roster = None
+        if kind != NO_ROSTER:
+            (count,) = COUNT.unpack_from(view, offset)
+            offset += COUNT.size
+            if kind == ROSTER_SNAPSHOT:
+                active = []
+                for _ in range(count):
+                    (green_id,) = ROSTER_ID.unpack_from(view, offset)
+                    offset += ROSTER_ID.size
+                    active.append(f"{green_id:03d}")
+                roster = {"version": version, "active": active}
+            else:
+                changes = []
+                for _ in range(count):
+                    change = ROSTER_CHANGE.unpack_from(view, offset)
+                    offset += ROSTER_CHANGE.size
+                    changes.append((
+                        change[0], ROSTER_OP_NAMES[change[1]],
+                        f"{change[2]:03d}"
+                    ))
+                roster = {"version": version, "changes": changes}
+        (count,) = COUNT.unpack_from(view, offset)
+        offset += COUNT.size
+        new_data = []
+        for _ in range(count):
+            green_id, data_kind, length = DATA_ITEM.unpack_from(view, offset)
+            offset += DATA_ITEM.size
+            data = str(view[offset:offset + length], "utf-8")
+            offset += length
+            if data_kind == JSON_DATA:
+                data = json.loads(data)
+            new_data.append((f"{green_id:03d}", data))
+        return {
+            "data": new_data or None,
+            "roster": roster,
+            "offset": log_offset if flags & HAS_OFFSET else None,
+            "done": bool(flags & REPLAY_DONE)
+        }
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec, BinaryCodec)}
+
+
+def get_codec(name):
+    """Returns the codec registered with a name.
+
+    :param name: The name of the codec, either `json` or `binary`.
+
+    :return: The codec class.
+    """
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Unknown codec '{name}'") from None
+
+
+def decode_payload(payload):
+    """Decodes a payload received from the link, whatever its codec.
+
+    :param payload: Either the packed bytes or the JSON decoded dict.
+
+    :return: The dict with ``data`` and ``roster``.
+    """
+    if isinstance(payload, (bytes, bytearray)):
+        return BinaryCodec.decode(payload)
+    return payload
@@ -0,0 +1,146 @@
+#!/bin/env python
+"""This file has the optional compression of large frames.
+
+Frames larger than a threshold are compressed with zlib and sent as a dict
+holding the compressed bytes, which Socket.IO sends as a binary attachment:
+
+    {"compression": "zlib", "frame": b"...", "binary": False}
+
+The ``binary`` flag tells whether the frame was bytes, or a JSON value which is
+restored by `decompress`. Smaller frames are sent as they are, so compression
+doesn't add latency to them. Their size is estimated by `estimate_size`
+instead of encoding them, as Socket.IO encodes them anyway, and frames whose
+estimate comes near the threshold are encoded to measure them. A receiver
+announces the compression it accepts when it connects, so frames are only
+compressed for receivers which can read them.
+"""
+
+import json
+import time
+import zlib
+
+ZLIB = "zlib"
+ESTIMATE_MARGIN = 2                 # Estimates may be this much too small
+
+
+def estimate_size(value, limit=None):
+    """Returns a rough size of the JSON encoding of a value.
+
+    Every item of lists and dicts is counted, but counting stops once the
+    size reaches `limit`, so that a large value costs no more to estimate
+    than one of that size.
+
+    :param value: A JSON serializable value.
+    :param limit: The optional size from which counting stops.
+
+    :return: The estimated number of bytes, at least `limit` if counting
+             stopped.
+    """
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value) + 2
+    if isinstance(value, dict):
+        size = 2
+        for key, item in value.items():
+            size += len(key) + 4 + estimate_size(
+                item, None if limit is None else limit - size
+            )
+            if limit is not None and size >= limit:
+                break
+        return size
+    if isinstance(value, (list, tuple)):
+        size = 2
+        for item in value:
+            # Strings, such as room ids, are counted without a call
+            if isinstance(item, str):
+                size += len(item) + 3
+            else:
+                size += estimate_size(
+                    item, None if limit is None else limit - size
+                ) + 1
+            if limit is not None and size >= limit:
+                break
+        return size
+    return 8
+
+
+class Compressor:
+    """Class to compress frames above a size threshold and count the results.
+
+    :param self: The reference to class instance.
+    :param threshold: The size in bytes from which frames are compressed.
+                      `None` disables compression.
+    :param level: The zlib compression level.
+    """
+
+    def __init__(self, threshold=4096, level=6):
+        self.threshold = threshold
+        self.level = level
+        self.frames = 0
+        self.compressed_frames = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.cpu_seconds = 0.0
+
+    def compress(self, frame):
+        """Compresses a frame if it is larger than the threshold.
+
+        :param self: The reference to class instance.
+        :param frame: Either bytes or a JSON serializable value.
+
+        :return: The compressed frame dict, or the frame itself.
+        """
+        self.frames += 1
+        if self.threshold is None:
+            return frame
+        binary = isinstance(frame, (bytes, bytearray))
+        if binary:
+            raw = frame
+        elif (estimate_size(frame, self.threshold / ESTIMATE_MARGIN)
+                * ESTIMATE_MARGIN < self.threshold):
+            return frame
+        else:
+            raw = json.dumps(frame).encode("utf-8")
+        if len(raw) < self.threshold:
+            return frame
+        start = time.thread_time()
+        compressed = zlib.compress(raw, self.level)
+        self.cpu_seconds += time.thread_time() - start
+        self.compressed_frames += 1
+        self.raw_bytes += len(raw)
+        self.compressed_bytes += len(compressed)
+        return {"compression": ZLIB, "frame": compressed, "binary": binary}
+
+    def stats(self):
+        """Returns the counters of compressed frames.
+
+        :param self: The reference to class instance.
+
+        :return: A dict of counters, with the ``ratio`` of raw bytes to
+                 compressed bytes of the compressed frames.
+        """
+        ratio = None
+        if self.compressed_bytes:
+            ratio = self.raw_bytes / self.compressed_bytes
+        return {
+            "frames": self.frames,
+            "compressed_frames": self.compressed_frames,
+            "raw_bytes": self.raw_bytes,
+            "compressed_bytes": self.compressed_bytes,
+            "ratio": ratio,
+            "cpu_seconds": self.cpu_seconds,
+        }
+
+
+def decompress(frame):
+    """Restores a frame compressed by a `Compressor`.
+
+    :param frame: The received frame, compressed or not.
+
+    :return: The original frame.
+    """
+    if not (isinstance(frame, dict) and frame.get("compression") == ZLIB):
+        return frame
+    raw = zlib.decompress(frame["frame"])
+    if frame["binary"]:
+        return raw
+    return json.loads(raw)
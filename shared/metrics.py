@@ -0,0 +1,373 @@
+#!/bin/env python
+"""This file has the metrics of a server in the Prometheus text format.
+
+A `MetricsRegistry` holds counters, gauges and histograms, optionally with
+labels, and renders all of them as the body of a `/metrics` route. Counters
+and histograms are updated on the hot path, so updating one is a dict lookup
+and an addition, whereas gauges are only computed by a callable when the
+metrics are rendered. A disabled registry hands out instruments which don't
+record anything and leaves the timed handlers unwrapped.
+"""
+
+import time
+from bisect import bisect_left
+from functools import wraps
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def format_labels(names, values):
+    """Returns the labels of a sample in the Prometheus text format.
+
+    :param names: The tuple of label names.
+    :param values: The tuple of label values.
+
+    :return: A string such as `{namespace="/red",event="join"}`, or an empty
+             string without labels.
+    """
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n")
+        value = value.replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value):
+    """Returns a sample value in the Prometheus text format.
+
+    :param value: The number.
+
+    :return: The string of the number.
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class NullInstrument:
+    """Class for the instruments of a disabled registry, recording nothing.
+    """
+
+    def inc(self, *args, **kwargs):
+        pass
+
+    def observe(self, *args, **kwargs):
+        pass
+
+    def labels(self, *values):
+        return self
+
+
+NULL_INSTRUMENT = NullInstrument()
+
+
+class CounterSeries:
+    """Class for the count of a counter under some label values.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class HistogramSeries:
+    """Class for the buckets of a histogram under some label values.
+    """
+
+    __slots__ = ("buckets", "counts", "total")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+
+class Counter:
+    """Class for a counter which only goes up.
+
+    :param self: The reference to class instance.
+    :param name: The name of the metric, ending with `_total`.
+    :param description: The description of the metric.
+    :param labels: The tuple of label names.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self.values = {}                # Label values -> `CounterSeries`
+
+    def labels(self, *values):
+        """Returns the series of the given label values.
+
+        Handlers updating the same series every time should keep it, which
+        saves looking it up on every update.
+
+        :param self: The reference to class instance.
+        :param values: The label values, in order of the label names.
+
+        :return: The `CounterSeries`.
+        """
+        series = self.values.get(values)
+        if series is None:
+            series = self.values[values] = CounterSeries()
+        return series
+
+    def inc(self, *values, amount=1):
+        """Increments the counter of the given label values.
+
+        :param self: The reference to class instance.
+        :param values: The label values, in order of the label names.
+        :param amount: The number added to the counter. Defaults to `1`.
+
+        :return: None
+        """
+        self.labels(*values).value += amount
+
+    def samples(self):
+        """Returns the samples of the counter.
+
+        :param self: The reference to class instance.
+
+        :return: The list of tuples of sample name, labels and value.
+        """
+        return [
+            (self.name, format_labels(self.label_names, values), series.value)
+            for values, series in sorted(self.values.items())
+        ]
+
+
+class Gauge:
+    """Class for a gauge computed when the metrics are rendered.
+
+    :param self: The reference to class instance.
+    :param name: The name of the metric.
+    :param description: The description of the metric.
+    :param collect: The callable returning the value, or with labels a dict of
+                    tuples of label values -> value. With a single label, the
+                    keys may be the label values themselves.
+    :param labels: The tuple of label names.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, description, collect, labels=()):
+        self.name = name
+        self.description = description
+        self.collect = collect
+        self.label_names = tuple(labels)
+
+    def samples(self):
+        """Returns the samples of the gauge.
+
+        :param self: The reference to class instance.
+
+        :return: The list of tuples of sample name, labels and value.
+        """
+        if not self.label_names:
+            return [(self.name, "", self.collect())]
+        samples = []
+        for values, value in sorted(self.collect().items()):
+            if not isinstance(values, tuple):
+                values = (values,)
+            samples.append(
+                (self.name, format_labels(self.label_names, values), value)
+            )
+        return samples
+
+
+class Histogram:
+    """Class for a histogram of observed values, such as durations.
+
+    :param self: The reference to class instance.
+    :param name: The name of the metric.
+    :param description: The description of the metric.
+    :param labels: The tuple of label names.
+    :param buckets: The sorted upper bounds of the buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(),
+                 buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}                # Label values -> `HistogramSeries`
+
+    def labels(self, *values):
+        """Returns the series of the given label values, see `Counter`.
+
+        :param self: The reference to class instance.
+        :param values: The label values, in order of the label names.
+
+        :return: The `HistogramSeries`.
+        """
+        series = self.values.get(values)
+        if series is None:
+            series = self.values[values] = HistogramSeries(self.buckets)
+        return series
+
+    def observe(self, value, *values):
+        """Records an observed value under the given label values.
+
+        :param self: The reference to class instance.
+        :param value: The observed number.
+        :param values: The label values, in order of the label names.
+
+        :return: None
+        """
+        self.labels(*values).observe(value)
+
+    def samples(self):
+        """Returns the cumulative buckets, sum and count of the histogram.
+
+        :param self: The reference to class instance.
+
+        :return: The list of tuples of sample name, labels and value.
+        """
+        samples = []
+        bounds = [
+            format_value(bound) for bound in self.buckets + (float("inf"),)
+        ]
+        bucket_names = self.label_names + ("le",)
+        for values, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series.counts):
+                cumulative += count
+                samples.append((
+                    self.name + "_bucket",
+                    format_labels(bucket_names, values + (bound,)),
+                    cumulative
+                ))
+            labels = format_labels(self.label_names, values)
+            samples.append((self.name + "_sum", labels, series.total))
+            samples.append((self.name + "_count", labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """Class to create the metrics of a server and render them.
+
+    :param self: The reference to class instance.
+    :param prefix: The prefix of the names of all the metrics.
+    :param enabled: Boolean, whether anything is recorded. Defaults to `True`.
+    """
+
+    def __init__(self, prefix="apple", enabled=True):
+        self.prefix = prefix
+        self.enabled = enabled
+        self.metrics = []
+
+    def _register(self, metric):
+        if not self.enabled:
+            return NULL_INSTRUMENT
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, description, labels=()):
+        """Returns a new counter, see `Counter`.
+
+        :param self: The reference to class instance.
+        :param name: The name of the metric, without the prefix.
+        :param description: The description of the metric.
+        :param labels: The tuple of label names.
+
+        :return: The counter.
+        """
+        return self._register(
+            Counter(f"{self.prefix}_{name}", description, labels)
+        )
+
+    def gauge(self, name, description, collect, labels=()):
+        """Adds a gauge, see `Gauge`.
+
+        :param self: The reference to class instance.
+        :param name: The name of the metric, without the prefix.
+        :param description: The description of the metric.
+        :param collect: The callable computing the value.
+        :param labels: The tuple of label names.
+
+        :return: The gauge.
+        """
+        return self._register(
+            Gauge(f"{self.prefix}_{name}", description, collect, labels)
+        )
+
+    def histogram(self, name, description, labels=(),
+                  buckets=LATENCY_BUCKETS):
+        """Returns a new histogram, see `Histogram`.
+
+        :param self: The reference to class instance.
+        :param name: The name of the metric, without the prefix.
+        :param description: The description of the metric.
+        :param labels: The tuple of label names.
+        :param buckets: The sorted upper bounds of the buckets.
+
+        :return: The histogram.
+        """
+        return self._register(
+            Histogram(f"{self.prefix}_{name}", description, labels, buckets)
+        )
+
+    def timed(self, handler, histogram, counter, *values):
+        """Wraps an event handler to count its calls and time its execution.
+
+        :param self: The reference to class instance.
+        :param handler: The event handler.
+        :param histogram: The histogram of the execution time.
+        :param counter: The counter of the calls.
+        :param values: The label values of the counter and the histogram.
+
+        :return: The wrapped handler, or the handler itself if the registry is
+                 disabled.
+        """
+        if not self.enabled:
+            return handler
+        calls = counter.labels(*values)
+        durations = histogram.labels(*values)
+        perf_counter = time.perf_counter
+
+        @wraps(handler)
+        def timed_handler(*args):
+            calls.value += 1
+            start = perf_counter()
+            try:
+                return handler(*args)
+            finally:
+                durations.observe(perf_counter() - start)
+
+        return timed_handler
+
+    def render(self):
+        """Renders all the metrics in the Prometheus text format.
+
+        :param self: The reference to class instance.
+
+        :return: The string of the metrics.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,93 @@
+#!/bin/env python
+"""This file has the index of connected sessions and the rooms they joined.
+
+The index maps every session id to its room and every room to the set of its
+session ids, so that registering, removing and counting the sessions of a room
+don't need to scan all the connected sessions.
+"""
+
+
+class PresenceIndex:
+    """Class to index the room membership of connected sessions.
+
+    Every session belongs to at most one room, identified by the three digit id
+    of a client. Rooms without any session are not kept in the index.
+    """
+
+    def __init__(self):
+        self.sid_to_room = {}
+        self.room_to_sids = {}
+
+    def __len__(self):
+        return len(self.sid_to_room)
+
+    def add(self, sid, room_id):
+        """Registers a session in a room, moving it out of its previous room.
+
+        :param self: The reference to class instance.
+        :param sid: The session id.
+        :param room_id: The three digit id of the room.
+
+        :return: None
+        """
+        if sid in self.sid_to_room:
+            self.remove(sid)
+        self.sid_to_room[sid] = room_id
+        self.room_to_sids.setdefault(room_id, set()).add(sid)
+
+    def remove(self, sid):
+        """Unregisters a session from its room.
+
+        :param self: The reference to class instance.
+        :param sid: The session id.
+
+        :return: The room id of the session, or `None` if it wasn't registered.
+        """
+        room_id = self.sid_to_room.pop(sid, None)
+        if room_id is None:
+            return None
+        sids = self.room_to_sids[room_id]
+        sids.discard(sid)
+        if not sids:
+            del self.room_to_sids[room_id]
+        return room_id
+
+    def room_of(self, sid, default=None):
+        """Returns the room id of a session.
+
+        :param self: The reference to class instance.
+        :param sid: The session id.
+        :param default: The value returned if the session isn't registered.
+
+        :return: The room id of the session or `default`.
+        """
+        return self.sid_to_room.get(sid, default)
+
+    def members(self, room_id):
+        """Returns the session ids registered in a room.
+
+        :param self: The reference to class instance.
+        :param room_id: The three digit id of the room.
+
+        :return: A frozenset of session ids.
+        """
+        return frozenset(self.room_to_sids.get(room_id, ()))
+
+    def count(self, room_id):
+        """Returns the number of sessions registered in a room.
+
+        :param self: The reference to class instance.
+        :param room_id: The three digit id of the room.
+
+        :return: Integer count of sessions.
+        """
+        return len(self.room_to_sids.get(room_id, ()))
+
+    def rooms(self):
+        """Returns the ids of the rooms with at least one session.
+
+        :param self: The reference to class instance.
+
+        :return: A list of room ids.
+        """
+        return list(self.room_to_sids)
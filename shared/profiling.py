@@ -0,0 +1,217 @@
+#!/bin/env python
+"""This file has the on-demand profiling of a server running on eventlet.
+
+A `StackSampler` samples the stacks of the running threads from a native
+thread, so that it samples even while a greenlet never yields. Under eventlet
+the stack of the main thread is the stack of the greenlet running at that
+moment, and the stack of the hub while all greenlets wait. The samples are
+rendered as collapsed stacks, one `frame;frame;frame count` line per stack,
+which is the input of flame graph tools such as `flamegraph.pl` or speedscope.
+
+`count_greenlets` counts the live greenlets by the handler they run, so that
+handlers whose greenlets pile up, such as leaked loops, show up at once.
+"""
+
+import gc
+import importlib
+import os
+import sys
+from collections import Counter
+
+MAX_PROFILE_SECONDS = 60.0          # Longest profile served on demand
+MIN_PROFILE_INTERVAL = 0.001        # Shortest interval between samples
+SHARED_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def native(module):
+    """Returns a module as it was before eventlet monkey patched it.
+
+    :param module: The name of the module, such as `threading`.
+
+    :return: The original module, or the imported one without eventlet.
+    """
+    try:
+        from eventlet.patcher import original
+    except ImportError:
+        return importlib.import_module(module)
+    return original(module)
+
+
+def frame_name(frame):
+    """Returns the name of a frame in a stack, made of module and function.
+
+    :param frame: The frame.
+
+    :return: A string such as `server:dispatch_new_data`.
+    """
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+def collapse(frame, names):
+    """Returns the collapsed stack of a frame, from the outermost frame on.
+
+    :param frame: The innermost frame of the stack.
+    :param names: The dict caching the name of every code object.
+
+    :return: A string such as `hub:run;server:broadcast_rooms`.
+    """
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        name = names.get(code)
+        if name is None:
+            name = names[code] = frame_name(frame)
+        stack.append(name)
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class StackSampler:
+    """Class sampling the stacks of all threads from a native thread.
+
+    :param self: The reference to class instance.
+    :param interval: The number of seconds between samples.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()         # Collapsed stack -> its samples
+        self.samples = 0
+        self.running = False
+        self.thread = None
+        self.names = {}                 # Code object -> its frame name
+
+    def start(self):
+        """Starts sampling in a native thread.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.running = True
+        self.thread = native("threading").Thread(
+            target=self.sample, name="stack-sampler", daemon=True
+        )
+        self.thread.start()
+
+    def sample(self):
+        """Samples the stacks of the other threads till stopped.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        sleep = native("time").sleep
+        own_ident = native("threading").get_ident()
+        while self.running:
+            for ident, frame in sys._current_frames().items():
+                if ident != own_ident:
+                    self.stacks[collapse(frame, self.names)] += 1
+            self.samples += 1
+            sleep(self.interval)
+
+    def stop(self):
+        """Stops sampling and waits for the sampling thread.
+
+        :param self: The reference to class instance.
+
+        :return: None
+        """
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def collapsed(self):
+        """Renders the sampled stacks, the most sampled first.
+
+        :param self: The reference to class instance.
+
+        :return: The string of collapsed stacks, one per line. For example:
+                    eventlet.hubs.hub:run;eventlet.hubs.poll:wait 950
+                    eventlet.greenthread:main;server:dispatch_new_data 50
+        """
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+def source_dirs(owner):
+    """Returns the directories of the modules of a server.
+
+    :param owner: The server instance.
+
+    :return: The set of the directory of the module of its class and of the
+             directory of the modules shared by the servers.
+    """
+    module = sys.modules[type(owner).__module__]
+    return {SHARED_DIR, os.path.dirname(os.path.abspath(module.__file__))}
+
+
+def handler_of(frame, owner, directories):
+    """Returns the name of the handler a greenlet runs, given its stack.
+
+    The handler is the outermost method of the `owner`, otherwise the
+    outermost function of a module of the server, and otherwise the outermost
+    function of the stack.
+
+    :param frame: The innermost frame of the greenlet.
+    :param owner: The server whose methods are the handlers.
+    :param directories: The directories of the modules of the server, see
+                        `source_dirs`.
+
+    :return: A string such as `on_join` or `batching:run`.
+    """
+    method = function = outermost = None
+    while frame is not None:
+        directory = os.path.dirname(os.path.abspath(frame.f_code.co_filename))
+        if frame.f_locals.get("self") is owner:
+            method = frame.f_code.co_name
+        elif directory in directories:
+            function = frame_name(frame)
+        outermost = frame
+        frame = frame.f_back
+    return method or function or frame_name(outermost)
+
+
+def count_greenlets(owner):
+    """Counts the live greenlets by the handler they run.
+
+    The greenlet counting them isn't counted, as it runs.
+
+    :param owner: The server whose methods are the handlers.
+
+    :return: A dict of handler name -> number of greenlets, the largest
+             first. For example:
+                {"dispatch_new_data": 1, "eventlet.hubs.hub:run": 1}
+    """
+    from greenlet import greenlet
+
+    directories = source_dirs(owner)
+    counts = Counter(
+        handler_of(obj.gr_frame, owner, directories)
+        for obj in gc.get_objects()
+        if isinstance(obj, greenlet) and obj.gr_frame is not None
+    )
+    return dict(counts.most_common())
+
+
+def profile(seconds, interval, sleep):
+    """Samples the stacks of the server for a number of seconds.
+
+    :param seconds: The number of seconds to sample, at most
+                    `MAX_PROFILE_SECONDS`.
+    :param interval: The number of seconds between samples, at least
+                     `MIN_PROFILE_INTERVAL`.
+    :param sleep: The callable sleeping without blocking the server, such as
+                  `SocketIO.sleep`.
+
+    :return: The `StackSampler` with the samples.
+    """
+    sampler = StackSampler(max(interval, MIN_PROFILE_INTERVAL))
+    sampler.start()
+    try:
+        sleep(min(max(seconds, 0.0), MAX_PROFILE_SECONDS))
+    finally:
+        sampler.stop()
+    return sampler
+
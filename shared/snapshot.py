@@ -0,0 +1,122 @@
+#!/bin/env python
+"""This file has the snapshots of the state of a server for warm restarts.
+
+A server periodically writes its state, such as the active green ids and the
+pending data of every room, to a snapshot file, and once more when it stops.
+A restarted server reads the snapshot back before accepting connections, so
+that it serves joins right away and only catches up on what changed since.
+The state is a dict of JSON values, compressed by zlib. It is written to a
+temporary file which then replaces the snapshot, so that a crash while writing
+keeps the previous snapshot. Snapshots older than `max_age` are ignored, as
+their state is too stale by then. A server writes its snapshots in a native
+thread, given a copy of its state, so that its event loop goes on meanwhile.
+Large lists are encoded in chunks, between which the thread lets the event
+loop run.
+"""
+
+import json
+import os
+import time
+import zlib
+
+FORMAT_VERSION = 1
+CHUNK_ITEMS = 1000                  # Items of a list encoded at once
+SEPARATORS = (",", ":")
+
+
+def iter_encode(value):
+    """Yields the JSON encoding of a value in pieces.
+
+    Lists of more than `CHUNK_ITEMS` items are encoded a chunk at a time, so
+    that a thread encoding a large state releases the GIL in between.
+
+    :param value: The JSON value.
+
+    :return: The generator of strings making up the encoding.
+    """
+    if isinstance(value, dict):
+        yield "{"
+        for index, (key, item) in enumerate(value.items()):
+            yield f"{',' if index else ''}{json.dumps(str(key))}:"
+            yield from iter_encode(item)
+        yield "}"
+    elif isinstance(value, list) and len(value) > CHUNK_ITEMS:
+        yield "["
+        for start in range(0, len(value), CHUNK_ITEMS):
+            chunk = value[start:start + CHUNK_ITEMS]
+            encoded = json.dumps(chunk, separators=SEPARATORS)
+            yield f"{',' if start else ''}{encoded[1:-1]}"
+        yield "]"
+    else:
+        yield json.dumps(value, separators=SEPARATORS)
+
+
+class Snapshots:
+    """Class writing and reading the snapshots of a server in a file.
+
+    :param self: The reference to class instance.
+    :param path: The path of the snapshot file.
+    :param interval: The number of seconds between snapshots.
+    :param max_age: The optional number of seconds after which a snapshot is
+                    too old to be restored.
+    """
+
+    def __init__(self, path, interval=5.0, max_age=None):
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self.written = 0                # Number of snapshots written
+        self.last_size = 0              # Bytes of the last snapshot
+
+    def write(self, state):
+        """Writes the state of the server as the new snapshot.
+
+        It may run in a native thread, given a state which the server doesn't
+        change meanwhile.
+
+        :param self: The reference to class instance.
+        :param state: The dict of JSON values.
+
+        :return: The number of bytes written.
+        """
+        body = zlib.compress("".join(iter_encode({
+            "version": FORMAT_VERSION,
+            "written_at": time.time(),
+            "state": state
+        })).encode())
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "wb") as snapshot_file:
+            snapshot_file.write(body)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary, self.path)
+        self.written += 1
+        self.last_size = len(body)
+        return len(body)
+
+    def read(self):
+        """Reads the state of the last snapshot.
+
+        :param self: The reference to class instance.
+
+        :return: The dict of the state, or `None` if there is no usable
+                 snapshot.
+        """
+        try:
+            with open(self.path, "rb") as snapshot_file:
+                snapshot = json.loads(zlib.decompress(snapshot_file.read()))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, zlib.error) as ex:
+            print(f"WARNING: Snapshot '{self.path}' is unreadable ({ex})")
+            return None
+        if snapshot.get("version") != FORMAT_VERSION:
+            print(f"WARNING: Snapshot '{self.path}' has another format")
+            return None
+        age = time.time() - snapshot["written_at"]
+        if self.max_age is not None and age > self.max_age:
+            print(f"WARNING: Snapshot '{self.path}' is {age:.0f}s old")
+            return None
+        return snapshot["state"]
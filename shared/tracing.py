@@ -0,0 +1,217 @@
+#!/bin/env python
+"""This file has the tracing of sampled messages from green to red clients.
+
+A green client wraps every sampled message in a trace envelope, which carries
+the trace id and the wall clock time at which every stage handled it:
+
+    {"_trace": {"id": "123:42", "stamps": [["green_client", 1.5e9]]},
+     "data": "some_data"}
+
+The green apple server, the listener and the red apple server append their
+stamps as the envelope passes by, and the red client takes out the data. Each
+of them keeps the last traces in a `TraceRing`, which summarizes the latency
+between consecutive stages. Messages which aren't sampled are left as they
+are, so tracing only costs a type check per message.
+"""
+
+import time
+from collections import deque
+
+TRACE_KEY = "_trace"
+GREEN_CLIENT = "green_client"
+GREEN_SERVER = "green_server"
+RED_LISTENER = "red_listener"
+RED_SERVER = "red_server"
+RED_CLIENT = "red_client"
+STAGES = (GREEN_CLIENT, GREEN_SERVER, RED_LISTENER, RED_SERVER, RED_CLIENT)
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def is_traced(data):
+    """Returns whether data is a trace envelope.
+
+    :param data: The published data.
+
+    :return: Boolean, `True` if the data is wrapped in a trace envelope.
+    """
+    return type(data) is dict and TRACE_KEY in data
+
+
+def wrap(data, trace_id):
+    """Wraps data in a new trace envelope without any stamp.
+
+    :param data: The published data.
+    :param trace_id: The id of the trace, unique per green client.
+
+    :return: The trace envelope.
+    """
+    return {TRACE_KEY: {"id": trace_id, "stamps": []}, "data": data}
+
+
+def unwrap(data):
+    """Returns the data of a trace envelope, or the data itself.
+
+    :param data: The published data, possibly wrapped.
+
+    :return: The data.
+    """
+    return data["data"] if is_traced(data) else data
+
+
+def stamp(data, stage):
+    """Stamps a trace envelope with the current time of a stage.
+
+    :param data: The trace envelope.
+    :param stage: The name of the stage, see `STAGES`.
+
+    :return: The trace of the envelope.
+    """
+    trace = data[TRACE_KEY]
+    trace["stamps"].append([stage, time.time()])
+    return trace
+
+
+def stamped_copy(data, stage):
+    """Returns a copy of a trace envelope stamped with the time of a stage.
+
+    The envelope itself is left unchanged, so that an envelope sent again is
+    timed from every send instead of piling up stamps.
+
+    :param data: The trace envelope.
+    :param stage: The name of the stage, see `STAGES`.
+
+    :return: The stamped copy of the envelope.
+    """
+    trace = data[TRACE_KEY]
+    copy = dict(data)
+    copy[TRACE_KEY] = dict(
+        trace, stamps=trace["stamps"] + [[stage, time.time()]]
+    )
+    return copy
+
+
+class Sampler:
+    """Class to pick every n-th message of a green client for tracing.
+
+    :param self: The reference to class instance.
+    :param producer_id: The three digit id of the green client.
+    :param every: The number of messages per sampled message. `0` disables
+                  tracing.
+    """
+
+    def __init__(self, producer_id, every=0):
+        self.producer_id = producer_id
+        self.every = every
+        self.count = 0
+
+    def sample(self, data):
+        """Wraps the data in a trace envelope if it is sampled.
+
+        :param self: The reference to class instance.
+        :param data: The data to be published.
+
+        :return: The trace envelope or the data itself.
+        """
+        if not self.every:
+            return data
+        self.count += 1
+        if self.count % self.every:
+            return data
+        return wrap(data, f"{self.producer_id}:{self.count}")
+
+
+def percentile(ordered, pct):
+    """Returns the percentile of sorted samples by nearest rank.
+
+    :param ordered: The sorted list of numbers.
+    :param pct: The percentile to be computed, between 0 and 100.
+
+    :return: The value at the given percentile.
+    """
+    rank = max(int(round(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class TraceRing:
+    """Class to keep the last traces and summarize their stage latencies.
+
+    :param self: The reference to class instance.
+    :param size: The number of traces kept.
+    """
+
+    def __init__(self, size=1000):
+        self.traces = deque(maxlen=size)
+        self.recorded = 0
+
+    def __len__(self):
+        return len(self.traces)
+
+    def record(self, trace):
+        """Keeps a copy of the stamps of a trace.
+
+        :param self: The reference to class instance.
+        :param trace: The trace of an envelope, see `stamp`.
+
+        :return: None
+        """
+        self.traces.append((trace["id"], tuple(map(tuple, trace["stamps"]))))
+        self.recorded += 1
+
+    def stage_latencies(self):
+        """Returns the latencies between consecutive stages of the traces.
+
+        :param self: The reference to class instance.
+
+        :return: A dict of stage pair, such as `green_client->green_server`,
+                 and `total` -> list of latencies in milliseconds.
+        """
+        latencies = {}
+        for (_, stamps) in list(self.traces):
+            for (stage, at), (next_stage, next_at) in zip(stamps, stamps[1:]):
+                latencies.setdefault(f"{stage}->{next_stage}", []).append(
+                    (next_at - at) * 1000
+                )
+            if len(stamps) > 1:
+                latencies.setdefault("total", []).append(
+                    (stamps[-1][1] - stamps[0][1]) * 1000
+                )
+        return latencies
+
+    def dump(self):
+        """Summarizes the stage latencies as histograms and percentiles.
+
+        :param self: The reference to class instance.
+
+        :return: A dict with the number of traces and, for every stage pair,
+                 the count, percentiles and the histogram of latencies in
+                 milliseconds with buckets of upper bounds. For example:
+                    {
+                        "traces": 2,
+                        "recorded": 40,
+                        "stages": {
+                            "green_client->green_server": {
+                                "count": 2, "p50_ms": 0.8, "p99_ms": 1.2,
+                                "max_ms": 1.2, "buckets": {"1": 1, ...}
+                            }
+                        }
+                    }
+        """
+        stages = {}
+        for name, samples in self.stage_latencies().items():
+            ordered = sorted(samples)
+            buckets = dict.fromkeys([str(b) for b in BUCKETS_MS] + ["+Inf"], 0)
+            for value in ordered:
+                bound = next((b for b in BUCKETS_MS if value <= b), None)
+                buckets["+Inf" if bound is None else str(bound)] += 1
+            stages[name] = {
+                "count": len(ordered),
+                "p50_ms": percentile(ordered, 50),
+                "p99_ms": percentile(ordered, 99),
+                "max_ms": ordered[-1],
+                "buckets": buckets,
+            }
+        return {
+            "traces": len(self.traces),
+            "recorded": self.recorded,
+            "stages": stages,
+        }